@@ -44,7 +44,9 @@ from teams.moderation_const import REVIEWED_AND_PUBLISHED, \
 
 
 from messages.models import Message
-from utils import send_templated_email
+from utils import (
+    send_templated_email, send_templated_emails, render_for_recipients
+)
 from utils.metrics import Meter
 from utils.translation import get_language_label
 
@@ -52,6 +54,21 @@ from utils.translation import get_language_label
 def get_url_base():
     return "http://" + Site.objects.get_current().domain
 
+def _send_messages(users, subject, template_name, context, object):
+    """Send the same site message to many users with a single insert.
+
+    The template is rendered once per language, see
+    utils.render_for_recipients.  Users who opted out of site messages are
+    skipped.
+    """
+    users = [u for u in users if u.notify_by_message]
+    messages = []
+    for user, content in render_for_recipients(users, template_name, context):
+        msg = Message(subject=subject, content=content, user=user)
+        msg.object = object
+        messages.append(msg)
+    Message.objects.bulk_create(messages)
+
 def _team_sends_notification(team, notification_setting_name):
     from teams.models import Setting
     return not team.settings.filter( key=Setting.KEY_IDS[notification_setting_name]).exists()
@@ -216,28 +233,21 @@ def team_member_new(member_pk):
     # to show up on all of them
     Action.create_new_member_handler(member)
     # notify  admins and owners through messages
-    notifiable = TeamMember.objects.filter( team=member.team,
-       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).exclude(pk=member.pk)
-    for m in notifiable:
-        context = {
-            "new_member": member.user,
-            "team":member.team,
-            "user":m.user,
-            "role":member.role,
-            "url_base":get_url_base(),
-        }
-        body = render_to_string("messages/team-new-member.txt",context)
-        subject = ugettext("%s team has a new member" % (member.team))
-        if m.user.notify_by_message:
-            msg = Message()
-            msg.subject = subject
-            msg.content = body
-            msg.user = m.user
-            msg.object = m.team
-            msg.save()
-        template_name = "messages/email/team-new-member.html"
-        Meter('templated-emails-sent-by-type.teams.new-member').inc()
-        send_templated_email(m.user, subject, template_name, context)
+    notifiable = [m.user for m in TeamMember.objects.filter(team=member.team,
+       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).exclude(
+           pk=member.pk).select_related('user')]
+    context = {
+        "new_member": member.user,
+        "team":member.team,
+        "role":member.role,
+        "url_base":get_url_base(),
+    }
+    subject = ugettext("%s team has a new member" % (member.team))
+    _send_messages(notifiable, subject, "messages/team-new-member.txt",
+                   context, member.team)
+    template_name = "messages/email/team-new-member.html"
+    Meter('templated-emails-sent-by-type.teams.new-member').inc(len(notifiable))
+    send_templated_emails(notifiable, subject, template_name, context)
 
 
     # now send welcome mail to the new member
@@ -276,26 +286,18 @@ def team_member_leave(team_pk, user_pk):
     # to show up on all of them
     Action.create_member_left_handler(team, user)
     # notify  admins and owners through messages
-    notifiable = TeamMember.objects.filter( team=team,
-       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER])
+    notifiable = [m.user for m in TeamMember.objects.filter(team=team,
+       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).select_related('user')]
     subject = ugettext(u"%(user)s has left the %(team)s team" % dict(user=user, team=team))
-    for m in notifiable:
-        context = {
-            "parting_member": user,
-            "team":team,
-            "user":m.user,
-            "url_base":get_url_base(),
-        }
-        body = render_to_string("messages/team-member-left.txt",context)
-        if m.user.notify_by_message:
-            msg = Message()
-            msg.subject = subject
-            msg.content = body
-            msg.user = m.user
-            msg.object = team
-            msg.save()
-        Meter('templated-emails-sent-by-type.teams.someone-left').inc()
-        send_templated_email(m.user, subject, "messages/email/team-member-left.html", context)
+    context = {
+        "parting_member": user,
+        "team":team,
+        "url_base":get_url_base(),
+    }
+    _send_messages(notifiable, subject, "messages/team-member-left.txt",
+                   context, team)
+    Meter('templated-emails-sent-by-type.teams.someone-left').inc(len(notifiable))
+    send_templated_emails(notifiable, subject, "messages/email/team-member-left.html", context)
 
 
     context = {
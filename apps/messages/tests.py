@@ -143,6 +143,39 @@ class MessageTest(TestCase):
         self.assertTrue(Action.objects.for_user(contributor.user).filter(pk=action.pk).exists())
         self.assertTrue(Action.objects.for_user(admin.user).filter(pk=action.pk).exists())
 
+    def test_member_join_personalized(self):
+        team = Team.objects.create(name='test', slug='test')
+        admins = []
+        for x in xrange(3):
+            user = User.objects.create(username='admin%s' % x,
+                                       email='admin%s@example.com' % x,
+                                       notify_by_email=True,
+                                       notify_by_message=(x != 2))
+            TeamMember.objects.create(team=team, user=user,
+                                      role=TeamMember.ROLE_ADMIN)
+            admins.append(user)
+        new_user = User.objects.create(username='newbie',
+                                       email='newbie@example.com')
+        tm = TeamMember.objects.create(team=team, user=new_user)
+
+        mail.outbox = []
+        notifier.team_member_new(tm.pk)
+
+        # one email for each admin, plus the welcome email
+        self.assertEquals(len(mail.outbox), 4)
+        for user in admins:
+            emails = [e for e in mail.outbox if user.email in e.recipients()]
+            self.assertEquals(len(emails), 1)
+            self.assert_('Hi %s' % user.username in emails[0].body)
+
+        for user in admins[:2]:
+            message = Message.objects.get(user=user)
+            self.assert_('Hi %s' % user.username in message.content)
+            self.assertEquals(message.object, team)
+            self.assertFalse(message.read)
+        # opted out of site messages
+        self.assertFalse(Message.objects.filter(user=admins[2]).exists())
+
     def test_member_leave(self):
         return # fix me now
         def _get_counts(member):
@@ -16,6 +16,7 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from utils.celery_search_index import search_index_queue_depth
 from utils.rpc import add_request_to_kwargs
 from search.forms import SearchForm
 from videos.search_indexes import VideoSearchResult, VideoIndex
@@ -24,7 +25,6 @@ from videos.models import Video
 from django.template.loader import render_to_string
 from videos.rpc import render_page
 from django.template import RequestContext
-from django.core.cache import cache
 
 class SearchApiClass(object):
 
@@ -55,13 +55,9 @@ class SearchApiClass(object):
         output = render_page(rdata.get('page', 1), qs, 20, display_views=display_views)
         output['sidebar'] = render_to_string('search/_sidebar.html', dict(form=form, rdata=rdata))
 
-        # Assume we're currently indexing if the number of public
-        # indexed vids differs from the count of video objects by
-        # more than 1000
-        is_indexing = cache.get('is_indexing')
-        if is_indexing is None:
-            is_indexing = Video.objects.all().count() - VideoIndex.public().count() > 1000
-            cache.set('is_indexing', is_indexing, 300)
+        # Assume we're currently indexing if more than 1000 videos are
+        # waiting in the search index update queue
+        is_indexing = search_index_queue_depth(Video) > 1000
 
         output['is_indexing'] = is_indexing
 
@@ -85,7 +85,7 @@ class TestSearch(TestCase):
             video.title = title
             video.save()
             video.update_search_index()
-            test_utils.update_search_index.run_original()
+            test_utils.update_search_index(Video)
 
             result = rpc.search(rdata, self.user, testing=True)['sqs']
             self.assertTrue(video in [item.object for item in result], title)
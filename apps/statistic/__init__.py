@@ -19,7 +19,9 @@ from django.db import IntegrityError
 from django.db.models import F
 
 from statistic.models import SubtitleFetchCounters, VideoViewCounter, WidgetViewCounter
-from statistic.pre_day_statistic import BasePerDayStatistic, UpdatingLogger
+from statistic.pre_day_statistic import (
+    BasePerDayStatistic, UpdatingLogger, increment_grouped
+)
 from utils.redis_utils import default_connection
 
 
@@ -31,6 +33,7 @@ class VideoViewStatistic(BasePerDayStatistic):
     connection = default_connection
     model = VideoViewCounter
     prefix = 'st_video_view'
+    total_field = 'view_count'
 
     def get_key(self, date, video=None, video_id=None):
         if not video and not video_id:
@@ -68,11 +71,50 @@ class VideoViewStatistic(BasePerDayStatistic):
         video = obj.video
         video.__class__.objects.filter(pk=video.pk).update(view_count=F('view_count')+value)
 
+    def get_rows(self, keys):
+        from videos.models import Video
+
+        parsed = {}
+
+        for key in keys:
+            try:
+                prefix, video_id, date_str = key.split(':')
+            except ValueError:
+                continue
+            parsed[key] = (video_id, date_str)
+
+        video_ids = set(video_id for video_id, date_str in parsed.values())
+        pks = dict(Video.objects.filter(video_id__in=video_ids)
+                                .values_list('video_id', 'pk'))
+
+        rows = {}
+
+        for key, (video_id, date_str) in parsed.items():
+            if video_id in pks:
+                rows[key] = {
+                    'video_id': pks[video_id],
+                    'date': self.get_date(date_str)
+                }
+
+        return rows
+
+    def update_totals(self, rows):
+        from videos.models import Video
+
+        totals = {}
+
+        for fields, value in rows:
+            pk = fields['video_id']
+            totals[pk] = totals.get(pk, 0) + value
+
+        increment_grouped(Video, self.total_field, totals)
+
 st_video_view_handler = VideoViewStatistic()
 
 class WidgetViewStatistic(VideoViewStatistic):
     model = WidgetViewCounter
     prefix = 'st_widget_view'
+    total_field = 'widget_views_count'
     log_to_redis = UpdatingLogger(default_connection, 'st_widget_view_migrations',
                                   u'Widget views statistic')
 
@@ -146,23 +188,31 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
 
         return key
 
-    def get_object(self, key):
-        from videos.models import Video
-
+    def _parse_key(self, key):
+        """
+        Return (video_id, language, date string) for a key built by *get_key*
+        """
         parts = key.split(':')
 
-        if len(parts) == 6:
-            lang = parts[2]
+        if len(parts) == 5:
+            lang = parts[3]
         else:
             lang = ''
 
+        return parts[1], lang, parts[-1]
+
+    def get_object(self, key):
+        from videos.models import Video
+
+        video_id, lang, date_str = self._parse_key(key)
+
         try:
-            video = Video.objects.get(video_id=parts[1])
+            video = Video.objects.get(video_id=video_id)
         except Video.DoesNotExist:
             return
 
         fields = {
-            'date': self.get_date(parts[-1]),
+            'date': self.get_date(date_str),
             'video': video,
             'language': lang
         }
@@ -173,6 +223,26 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
             obj = self.model.objects.get(**fields)
         return obj
 
+    def get_rows(self, keys):
+        from videos.models import Video
+
+        parsed = dict((key, self._parse_key(key)) for key in keys)
+        video_ids = set(video_id for video_id, lang, date_str in parsed.values())
+        pks = dict(Video.objects.filter(video_id__in=video_ids)
+                                .values_list('video_id', 'pk'))
+
+        rows = {}
+
+        for key, (video_id, lang, date_str) in parsed.items():
+            if video_id in pks:
+                rows[key] = {
+                    'video_id': pks[video_id],
+                    'language': lang,
+                    'date': self.get_date(date_str)
+                }
+
+        return rows
+
     def get_query_set(self, date, video, sl=None):
         qs = self.model.objects.filter(video=video)
 
@@ -183,6 +253,17 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
 
     def update_total(self, key, obj, value):
         video = obj.video
-        video.__class__.objects.filter(pk=video.pk).update(view_count=F('subtitles_fetched_count')+value)
+        video.__class__.objects.filter(pk=video.pk).update(subtitles_fetched_count=F('subtitles_fetched_count')+value)
+
+    def update_totals(self, rows):
+        from videos.models import Video
+
+        totals = {}
+
+        for fields, value in rows:
+            pk = fields['video_id']
+            totals[pk] = totals.get(pk, 0) + value
+
+        increment_grouped(Video, 'subtitles_fetched_count', totals)
 
 st_sub_fetch_handler = SubtitleFetchStatistic()
@@ -0,0 +1,155 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""In-process buffer for the view/fetch counters.
+
+Counting a page view or a subtitle fetch used to mean one Celery task per
+hit, each ending in a single Redis INCR.  *CounterBuffer* accumulates the
+increments in memory instead and writes them to Redis in one pipeline every
+*FLUSH_INTERVAL* seconds, from a daemon thread, or as soon as *MAX_PENDING*
+distinct counters are waiting.  Whatever is left when the process exits is
+flushed by an atexit hook.
+
+The redis key of a statistic is worked out when the hit is counted (once per
+distinct counter and flush interval), so a flush only talks to Redis.
+
+Usage:
+
+    counter_buffer.incr_statistic(st_video_view_handler, video_id=video_id)
+    counter_buffer.incr_key(sl.subtitles_fetched_counter.redis_key)
+"""
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from utils.redis_utils import default_connection, IGNORE_REDIS
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, 'STATISTIC_BUFFER_FLUSH_INTERVAL', 10)
+MAX_PENDING = getattr(settings, 'STATISTIC_BUFFER_MAX_PENDING', 500)
+
+
+class CounterBuffer(object):
+    def __init__(self, connection=None, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.connection = connection or default_connection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pid = None
+        self._thread = None
+        self.lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # (handler, date, sorted kwargs) -> redis key, None if not counted
+        self.resolved = {}
+        # (handler, redis key) -> count
+        self.statistics = {}
+        # raw redis key -> count
+        self.keys = {}
+
+    def pending(self):
+        return len(self.statistics) + len(self.keys)
+
+    def incr_statistic(self, handler, **kwargs):
+        """Count one hit for a BasePerDayStatistic *handler*.
+
+        kwargs are what you would pass to ``handler.update``.  The date is
+        captured now, so hits buffered across midnight land on the right day.
+        """
+        self._check_thread()
+        item = (handler, datetime.date.today(), tuple(sorted(kwargs.items())))
+        if item in self.resolved:
+            key = self.resolved[item]
+        else:
+            # may hit the database, keep it out of the lock
+            key = handler.get_key(date=item[1], **kwargs)
+        with self.lock:
+            self.resolved[item] = key
+            if key:
+                stat = (handler, key)
+                self.statistics[stat] = self.statistics.get(stat, 0) + 1
+        self._maybe_flush()
+
+    def incr_key(self, key):
+        """Count one hit for a plain redis counter key."""
+        self._check_thread()
+        with self.lock:
+            self.keys[key] = self.keys.get(key, 0) + 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.pending() >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered increment to Redis in one pipeline."""
+        with self.lock:
+            statistics, keys = self.statistics, self.keys
+            self._reset()
+
+        if IGNORE_REDIS or not (statistics or keys):
+            return
+
+        try:
+            pipe = self.connection.pipeline(transaction=False)
+            for (handler, key), count in statistics.items():
+                handler.update_key_pipelined(pipe, key, count)
+            for key, count in keys.items():
+                pipe.incr(key, count)
+            pipe.execute()
+        except Exception:
+            # These are only view counters, losing a batch of them is better
+            # than breaking the request that happened to trigger the flush.
+            logger.exception('Failed to flush statistic counters')
+
+    def _check_thread(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            # First hit in this process.  If we were forked, the counts and
+            # the lock belong to the parent and the thread didn't survive.
+            self.lock = threading.Lock()
+            self._reset()
+            self._thread = threading.Thread(target=self._run,
+                                            name='statistic-flush')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+counter_buffer = CounterBuffer()
+
+@atexit.register
+def _flush_at_exit():
+    if counter_buffer._pid == os.getpid():
+        counter_buffer.flush()
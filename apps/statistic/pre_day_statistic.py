@@ -16,7 +16,7 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
-from django.db import models
+from django.db import connections, models
 from utils.redis_utils import RedisKey
 from django.contrib.admin import ModelAdmin
 from django.views.generic.simple import direct_to_template
@@ -24,6 +24,7 @@ from django.core.paginator import EmptyPage, InvalidPage, Paginator
 import datetime
 import time
 from django.views.generic.list_detail import object_list
+from libs.bulkops import increment_many
 
 class LoggerModelAdmin(ModelAdmin):
     logger = None
@@ -116,6 +117,20 @@ class UpdatingLogger(object):
             
         return output
         
+def increment_grouped(model, field, totals):
+    """
+    Add totals[pk] to *field* of each *model* row. Rows that get the same
+    value are updated together, so a chunk of small view counts costs a
+    handful of UPDATE queries instead of one per row.
+    """
+    by_value = {}
+
+    for pk, value in totals.items():
+        by_value.setdefault(value, []).append(pk)
+
+    for value, pks in by_value.items():
+        model.objects.filter(pk__in=pks).update(**{field: models.F(field)+value})
+
 class BasePerDayStatisticModel(models.Model):
     """
     Base Model for saving statistic information in DB
@@ -180,6 +195,7 @@ class BasePerDayStatistic(object):
     prefix = None       #keys' prefix
     model = None        #Model to save info in DB, BasePerDayStatisticModel subclass
     log_to_redis = None
+    chunk_size = 1000   #keys per chunk in *migrate_batched*
     
     def __init__(self):
         if not self.connection:
@@ -250,33 +266,123 @@ class BasePerDayStatistic(object):
         """
         raise Exception('Not implemented')
         
+    def get_rows(self, keys):
+        """
+        Batched counterpart of *get_object*, used by *migrate_batched*.
+        Should return a dict mapping each Redis key that should be saved to
+        the values identifying its *model* row, by attribute name and covering
+        the model's unique_together. Keys missing in the result are dropped.
+
+        Example:
+
+        def get_rows(self, keys):
+            return dict((key, {'video_id': key.split(':')[1],
+                               'date': self.get_date(key.split(':')[2])})
+                        for key in keys)
+        """
+        raise Exception('Not implemented')
+
+    def update_totals(self, rows):
+        """
+        Batched counterpart of *update_total*, used by *migrate_batched*.
+        rows - list of (fields, value) pairs, where fields is a dict returned
+        by *get_rows* and value the number of views to add for it
+        """
+        raise Exception('Not implemented')
+
     def get_views(self, **kwargs):
         """
         Return views statistic for week and month like: {'month': value, 'week': value, 'year': value}
         Pas
         """
         qs = self.get_query_set(**kwargs)
-        today = datetime.datetime.today()
-        yesterday  = today - datetime.timedelta(days=1)
-        week_ago = today - datetime.timedelta(days=7)
-        month_ago = today - datetime.timedelta(days=30)
-        year_ago = today - datetime.timedelta(days=365)
-        
-        #TODO: refactor this. too many queries. 
-        result = dict(week=0, month=0)
-        result['week'] = qs.filter(date__range=(week_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-        result['month'] = qs.filter(date__range=(month_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-        result['year'] = qs.filter(date__range=(year_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-
-        today_views = qs.filter(date=today).aggregate(s=models.Sum('count'))['s'] or 0
-        yesterday_views = qs.filter(date=yesterday).aggregate(s=models.Sum('count'))['s'] or 0
-        result['today'] =  int(today_views + yesterday_views * (1 - today.hour / 24.))
-                    
+        rows = self._sum_windows(qs)
+        return self._views_from_sums(*rows[0][1:])
+
+    def get_views_many(self, field, values):
+        """
+        Bulk version of *get_views*: return a dict mapping each of *values*
+        to its views statistic, where *field* is the name of the *model*
+        field the statistic is related with. All objects cost one query.
+
+            st_video_view_handler.get_views_many('video', video_pks)
+        """
+        values = list(values)
+        if not values:
+            return {}
+
+        qs = self.model.objects.filter(**{'%s__in' % field: values})
+        result = dict((v, self._views_from_sums(0, 0, 0, 0, 0)) for v in values)
+
+        for row in self._sum_windows(qs, field):
+            result[row[0]] = self._views_from_sums(*row[1:])
+
         return result
-    
+
+    def _window_dates(self):
+        today = datetime.datetime.today()
+
+        return {
+            'today': today,
+            'yesterday': today - datetime.timedelta(days=1),
+            'week': today - datetime.timedelta(days=7),
+            'month': today - datetime.timedelta(days=30),
+            'year': today - datetime.timedelta(days=365),
+        }
+
+    def _sum_windows(self, qs, group_field=None):
+        """
+        Sum counts of *qs* for every window at once with conditional
+        aggregation, optionally grouped by *group_field*. Return a list of
+        (group, week, month, year, today, yesterday) rows; group is None
+        when *group_field* is not given.
+        """
+        dates = self._window_dates()
+        con = connections[qs.db]
+        qn = con.ops.quote_name
+        opts = self.model._meta
+
+        columns = ['date', 'count']
+        if group_field:
+            columns.append(group_field)
+
+        inner = qs.filter(date__range=(dates['year'].date(), dates['today'].date()))
+        inner_sql, inner_params = inner.values_list(*columns).query \
+            .get_compiler(qs.db).as_sql()
+
+        date_col = qn(opts.get_field('date').column)
+        count_col = qn(opts.get_field('count').column)
+        since = 'SUM(CASE WHEN %s >= %%s THEN %s ELSE 0 END)' % (date_col, count_col)
+        on = 'SUM(CASE WHEN %s = %%s THEN %s ELSE 0 END)' % (date_col, count_col)
+
+        select = [since, since, since, on, on]
+        params = [dates['week'].date(), dates['month'].date(), dates['year'].date(),
+                  dates['today'].date(), dates['yesterday'].date()]
+
+        if group_field:
+            group_col = qn(opts.get_field(group_field).column)
+            sql = 'SELECT %s, %s FROM (%s) stats GROUP BY %s' % (
+                group_col, ', '.join(select), inner_sql, group_col)
+        else:
+            sql = 'SELECT NULL, %s FROM (%s) stats' % (', '.join(select), inner_sql)
+
+        cursor = con.cursor()
+        cursor.execute(sql, params + list(inner_params))
+        return cursor.fetchall()
+
+    def _views_from_sums(self, week, month, year, today_views, yesterday_views):
+        hour = datetime.datetime.today().hour
+        # the database hands back Decimals, which don't mix with floats
+        today_views = int(today_views or 0)
+        yesterday_views = int(yesterday_views or 0)
+
+        return {
+            'week': int(week or 0),
+            'month': int(month or 0),
+            'year': int(year or 0),
+            'today': int(today_views + yesterday_views * (1 - hour / 24.)),
+        }
+
     def post_migrate(self, updated_objects, updated_keys):
         """
         This method is executed after migration to DB
@@ -339,7 +445,94 @@ class BasePerDayStatistic(object):
             self.log_to_redis.save(datetime.datetime.now(), count, time.time()-start)
 
         return count
-        
+
+    def _pop_keys(self, count):
+        pipe = self.connection.pipeline(transaction=False)
+
+        for i in xrange(count):
+            pipe.spop(self.set_key.redis_key)
+
+        return [key for key in pipe.execute() if key]
+
+    def _take_values(self, keys):
+        """
+        Read and delete *keys* atomically, return a dict key -> int value
+        """
+        pipe = self.connection.pipeline()
+
+        for key in keys:
+            pipe.get(key)
+            pipe.delete(key)
+
+        result = pipe.execute()
+        values = {}
+
+        for key, value in zip(keys, result[::2]):
+            try:
+                values[key] = int(value)
+            except (TypeError, ValueError):
+                pass
+
+        return values
+
+    def migrate_batched(self, verbosity=1, chunk_size=None):
+        """
+        Migrate information from Redis to DB in chunks of *chunk_size* keys.
+
+        Each chunk is drained from Redis with two pipelines, aggregated per
+        *model* row in Python, written with one bulk upsert and applied to the
+        totals by *update_totals*. *post_migrate* is called once per chunk
+        with unsaved *model* instances built from the fields of *get_rows*.
+        """
+        chunk_size = chunk_size or self.chunk_size
+
+        if verbosity >= 2:
+            print '>>> Start batched migration...'
+
+        start = time.time()
+
+        self.pre_migrate()
+
+        count = self.set_key.scard()
+        migrated = 0
+
+        while migrated < count:
+            if verbosity >= 2:
+                print '  >>> migrate key: %s of %s' % (migrated, count)
+
+            keys = self._pop_keys(min(chunk_size, count - migrated))
+            if not keys:
+                break
+
+            migrated += len(keys)
+
+            values = self._take_values(keys)
+            fields_for_key = self.get_rows(keys)
+
+            aggregated = {}
+
+            for key in keys:
+                fields = fields_for_key.get(key)
+
+                if fields is None or key not in values:
+                    continue
+
+                item = tuple(sorted(fields.items()))
+                aggregated[item] = aggregated.get(item, 0) + values[key]
+
+            rows = [(dict(item), value) for item, value in aggregated.items()]
+
+            increment_many(self.model, rows, 'count')
+            self.update_totals(rows)
+
+            self.post_migrate([self.model(**fields) for fields, value in rows],
+                              keys)
+
+        if self.log_to_redis and count:
+            self.log_to_redis.save(datetime.datetime.now(), count, time.time()-start)
+
+        return count
+
     def update(self, **kwargs):
         """
         Update counter for date in Redis
@@ -352,4 +545,14 @@ class BasePerDayStatistic(object):
         
         self.connection.incr(key)
         self.set_key.sadd(key)
-        self.total_key.incr()    
\ No newline at end of file
+        self.total_key.incr()
+
+    def update_key_pipelined(self, pipe, key, count):
+        """
+        Same as *update*, but add *count* at once to a key already built by
+        *get_key* and only queue the commands on the Redis pipeline *pipe*.
+        Used by statistic.buffer.CounterBuffer
+        """
+        pipe.incr(key, count)
+        pipe.sadd(self.set_key.redis_key, key)
+        pipe.incr(self.total_key.redis_key, count)    
\ No newline at end of file
@@ -68,9 +68,9 @@ def gauge_statistic_languages():
 
 @periodic_task(run_every=timedelta(hours=6))
 def update_statistic(*args, **kwargs):
-    st_sub_fetch_handler.migrate(verbosity=kwargs.get('verbosity', 1))
-    st_video_view_handler.migrate(verbosity=kwargs.get('verbosity', 1))
-    st_widget_view_statistic.migrate(verbosity=kwargs.get('verbosity', 1))
+    st_sub_fetch_handler.migrate_batched(verbosity=kwargs.get('verbosity', 1))
+    st_video_view_handler.migrate_batched(verbosity=kwargs.get('verbosity', 1))
+    st_widget_view_statistic.migrate_batched(verbosity=kwargs.get('verbosity', 1))
 
 
 @task
@@ -0,0 +1,296 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import datetime
+import os
+
+import mock
+from django.db.models import Sum
+from django.test import TestCase
+
+from libs.bulkops import increment_many
+from statistic import (
+    buffer as stat_buffer, st_sub_fetch_handler, st_video_view_handler
+)
+from statistic.models import SubtitleFetchCounters, VideoViewCounter
+from statistic.pre_day_statistic import increment_grouped
+from utils.redis_utils import default_connection
+from videos.models import Video
+
+
+class FakeStatistic(object):
+    """Stands in for a BasePerDayStatistic, records the get_key calls."""
+    prefix = 'test_counter_buffer'
+
+    def __init__(self):
+        self.resolved = []
+
+    def get_key(self, date, video_id=None):
+        self.resolved.append(video_id)
+        if video_id:
+            return '%s:%s' % (self.prefix, video_id)
+
+    def update_key_pipelined(self, pipe, key, count):
+        pipe.incr(key, count)
+
+class CounterBufferTest(TestCase):
+    def setUp(self):
+        # the flush thread would only get in the way
+        self.thread_patcher = mock.patch('statistic.buffer.threading.Thread')
+        self.Thread = self.thread_patcher.start()
+        self.buffer = stat_buffer.CounterBuffer(default_connection,
+                                                flush_interval=60, max_pending=10)
+        self.handler = FakeStatistic()
+
+    def tearDown(self):
+        self.thread_patcher.stop()
+        keys = default_connection.keys('%s:*' % FakeStatistic.prefix)
+        if keys:
+            default_connection.delete(*keys)
+
+    def _value(self, name):
+        value = default_connection.get('%s:%s' % (FakeStatistic.prefix, name))
+        return value and int(value)
+
+    def test_counts_are_aggregated(self):
+        for i in xrange(3):
+            self.buffer.incr_statistic(self.handler, video_id='a')
+        self.buffer.incr_statistic(self.handler, video_id='b')
+        self.buffer.incr_key('%s:raw' % FakeStatistic.prefix)
+        self.buffer.incr_key('%s:raw' % FakeStatistic.prefix)
+
+        self.assertEquals(self.buffer.pending(), 3)
+        # nothing is written before the flush
+        self.assertEquals(self._value('a'), None)
+
+        self.buffer.flush()
+        self.assertEquals(self.buffer.pending(), 0)
+        self.assertEquals(self._value('a'), 3)
+        self.assertEquals(self._value('b'), 1)
+        self.assertEquals(self._value('raw'), 2)
+
+    def test_key_resolution(self):
+        for i in xrange(3):
+            self.buffer.incr_statistic(self.handler, video_id='a')
+            self.buffer.incr_statistic(self.handler)
+        # get_key runs once per counter, even when it says not to count
+        self.assertEquals(self.handler.resolved, ['a', None])
+        self.assertEquals(self.buffer.pending(), 1)
+
+        # keys are resolved again after a flush
+        self.buffer.flush()
+        self.buffer.incr_statistic(self.handler, video_id='a')
+        self.assertEquals(self.handler.resolved, ['a', None, 'a'])
+
+    def test_flush_when_full(self):
+        self.buffer.max_pending = 2
+        self.buffer.incr_statistic(self.handler, video_id='a')
+        self.assertEquals(self._value('a'), None)
+        self.buffer.incr_statistic(self.handler, video_id='b')
+        self.assertEquals(self._value('a'), 1)
+        self.assertEquals(self.buffer.pending(), 0)
+
+    def test_thread_restarted_after_fork(self):
+        self.buffer.incr_statistic(self.handler, video_id='a')
+        self.buffer.incr_statistic(self.handler, video_id='b')
+        self.assertEquals(self.Thread.call_count, 1)
+        parent_lock = self.buffer.lock
+
+        with mock.patch('statistic.buffer.os.getpid',
+                        return_value=os.getpid() + 1):
+            self.buffer.incr_statistic(self.handler, video_id='a')
+
+            # the child starts its own thread and lock and drops the counts
+            # of the parent, which flushes them itself
+            self.assertEquals(self.Thread.call_count, 2)
+            self.assertTrue(self.Thread.return_value.daemon)
+            self.assertNotEquals(self.buffer.lock, parent_lock)
+            self.assertEquals(self.buffer.pending(), 1)
+
+            self.buffer.flush()
+        self.assertEquals(self._value('a'), 1)
+        self.assertEquals(self._value('b'), None)
+
+    def test_flush_at_exit(self):
+        with mock.patch.object(stat_buffer, 'counter_buffer', self.buffer):
+            # never used in this process, nothing to do
+            stat_buffer._flush_at_exit()
+
+            self.buffer.incr_statistic(self.handler, video_id='a')
+            stat_buffer._flush_at_exit()
+        self.assertEquals(self._value('a'), 1)
+
+    def test_flush_at_exit_skips_the_parents_counts(self):
+        self.buffer.incr_statistic(self.handler, video_id='a')
+        with mock.patch.object(stat_buffer, 'counter_buffer', self.buffer):
+            with mock.patch('statistic.buffer.os.getpid',
+                            return_value=os.getpid() + 1):
+                stat_buffer._flush_at_exit()
+        self.assertEquals(self._value('a'), None)
+
+def views_per_window(qs):
+    """What get_views computed with one query per window."""
+    today = datetime.datetime.today()
+    def total(qs):
+        return qs.aggregate(s=Sum('count'))['s'] or 0
+
+    today_views = total(qs.filter(date=today))
+    yesterday_views = total(qs.filter(date=today - datetime.timedelta(days=1)))
+    return {
+        'week': total(qs.filter(date__range=(today - datetime.timedelta(days=7), today))),
+        'month': total(qs.filter(date__range=(today - datetime.timedelta(days=30), today))),
+        'year': total(qs.filter(date__range=(today - datetime.timedelta(days=365), today))),
+        'today': int(today_views + yesterday_views * (1 - today.hour / 24.)),
+    }
+
+class ViewWindowsTest(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.videos = list(Video.objects.all()[:3])
+        today = datetime.date.today()
+        # every day of the last 400 for the first video, including the
+        # window boundaries, every tenth day for the second, none for the
+        # third
+        for days in xrange(400):
+            date = today - datetime.timedelta(days=days)
+            VideoViewCounter.objects.create(video=self.videos[0], date=date,
+                                            count=days + 1)
+            if days % 10 == 0:
+                VideoViewCounter.objects.create(video=self.videos[1],
+                                                date=date, count=3)
+        # not in any window
+        VideoViewCounter.objects.create(video=self.videos[1], count=100,
+            date=today + datetime.timedelta(days=1))
+
+    def test_get_views(self):
+        for video in self.videos:
+            expected = views_per_window(VideoViewCounter.objects.filter(video=video))
+            self.assertEquals(st_video_view_handler.get_views(video=video),
+                              expected)
+        self.assertEquals(st_video_view_handler.get_views(video=self.videos[2]),
+                          {'week': 0, 'month': 0, 'year': 0, 'today': 0})
+
+    def test_get_views_many(self):
+        pks = [video.pk for video in self.videos]
+        views = st_video_view_handler.get_views_many('video', pks)
+
+        self.assertEquals(sorted(views.keys()), sorted(pks))
+        for video in self.videos:
+            expected = views_per_window(VideoViewCounter.objects.filter(video=video))
+            self.assertEquals(views[video.pk], expected)
+
+        self.assertEquals(st_video_view_handler.get_views_many('video', []), {})
+
+class FakeLanguage(object):
+    def __init__(self, language):
+        self.language = language
+
+class MigrateBatchedTest(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.videos = list(Video.objects.all()[:2])
+        self.today = datetime.date.today()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+        self._clear_redis()
+
+    def tearDown(self):
+        self._clear_redis()
+
+    def _clear_redis(self):
+        for handler in (st_video_view_handler, st_sub_fetch_handler):
+            keys = default_connection.keys('%s:*' % handler.prefix)
+            if keys:
+                default_connection.delete(*keys)
+
+    def _reload(self, video):
+        return Video.objects.get(pk=video.pk)
+
+    def test_video_views(self):
+        first, second = self.videos
+        # counts migrated before are added to
+        VideoViewCounter.objects.create(video=first, date=self.today, count=5)
+        for i in xrange(3):
+            st_video_view_handler.update(video=first)
+        # update() always counts for today
+        pipe = default_connection.pipeline()
+        st_video_view_handler.update_key_pipelined(pipe,
+            st_video_view_handler.get_key(self.yesterday, video=first), 1)
+        pipe.execute()
+        st_video_view_handler.update(video=second)
+        # a deleted video is dropped
+        st_video_view_handler.update(video_id='gone')
+
+        # chunks smaller than the number of keys
+        self.assertEquals(st_video_view_handler.migrate_batched(chunk_size=2), 4)
+
+        counts = dict(((c.video_id, c.date), c.count)
+                      for c in VideoViewCounter.objects.all())
+        self.assertEquals(counts, {
+            (first.pk, self.today): 8,
+            (first.pk, self.yesterday): 1,
+            (second.pk, self.today): 1,
+        })
+        self.assertEquals(self._reload(first).view_count, first.view_count + 4)
+        self.assertEquals(self._reload(second).view_count, second.view_count + 1)
+
+        # everything was taken out of redis
+        self.assertEquals(st_video_view_handler.set_key.scard(), 0)
+        self.assertEquals(default_connection.keys('st_video_view:%s:*' %
+                                                  first.video_id), [])
+        self.assertEquals(st_video_view_handler.migrate_batched(), 0)
+
+    def test_subtitle_fetches(self):
+        video = self.videos[0]
+        st_sub_fetch_handler.update(video=video, sl=FakeLanguage('en'))
+        st_sub_fetch_handler.update(video=video, sl=FakeLanguage('en'))
+        st_sub_fetch_handler.update(video=video)
+
+        self.assertEquals(st_sub_fetch_handler.migrate_batched(), 2)
+
+        counts = dict((c.language, c.count)
+                      for c in SubtitleFetchCounters.objects.filter(video=video))
+        self.assertEquals(counts, {'en': 2, '': 1})
+
+        reloaded = self._reload(video)
+        self.assertEquals(reloaded.subtitles_fetched_count,
+                          video.subtitles_fetched_count + 3)
+        self.assertEquals(reloaded.view_count, video.view_count)
+
+    def test_increment_many(self):
+        first, second = self.videos
+        VideoViewCounter.objects.create(video=first, date=self.today, count=5)
+
+        increment_many(VideoViewCounter, [
+            ({'video_id': first.pk, 'date': self.today}, 2),
+            ({'video_id': second.pk, 'date': self.today}, 3),
+        ], 'count')
+
+        counts = dict((c.video_id, c.count)
+                      for c in VideoViewCounter.objects.all())
+        self.assertEquals(counts, {first.pk: 7, second.pk: 3})
+
+    def test_increment_grouped(self):
+        videos = list(Video.objects.all()[:3])
+        totals = {videos[0].pk: 2, videos[1].pk: 2, videos[2].pk: 5}
+
+        increment_grouped(Video, 'view_count', totals)
+
+        for video in videos:
+            self.assertEquals(self._reload(video).view_count,
+                              video.view_count + totals[video.pk])
@@ -16,9 +16,13 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import babelsubs
 from django.core.cache import cache
 
 TIMEOUT = 60 * 60 * 24 * 5 # 5 days
+# Rendered subtitles never go stale (versions are immutable), we only expire
+# them to give the memory back.
+RENDERED_TIMEOUT = 60 * 60 * 24 * 30 # 30 days
 
 
 def _lang_is_synced_id(language, public):
@@ -38,3 +42,37 @@ def get_is_synced(language, public):
 def set_is_synced(language, public, value):
     cache_key = _lang_is_synced_id(language, public)
     cache.set(cache_key, value, TIMEOUT)
+
+def _video_language_status_id(video_pk):
+    return u"video-%s-language-status" % (video_pk,)
+
+def invalidate_language_status(video_pk):
+    cache.delete(_video_language_status_id(video_pk))
+
+def get_language_status(video_pk):
+    return cache.get(_video_language_status_id(video_pk))
+
+def set_language_status(video_pk, value):
+    cache.set(_video_language_status_id(video_pk), value, TIMEOUT)
+
+def _rendered_subtitles_id(version_pk, format):
+    return u"version-%s-rendered-%s" % (version_pk, format)
+
+def rendered_subtitles_etag(version, format):
+    """Return a strong ETag for version rendered in format.
+
+    Versions are immutable once written, so the pk and format identify the
+    content and we don't need to render anything to compute it.
+
+    """
+    return u"%s-%s" % (version.pk, format)
+
+def get_rendered_subtitles(version, format):
+    """Return the subtitles of version rendered in format by babelsubs."""
+    cache_key = _rendered_subtitles_id(version.pk, format)
+    value = cache.get(cache_key)
+    if value is None:
+        value = babelsubs.to(version.get_subtitles(), format,
+                             language=version.language_code)
+        cache.set(cache_key, value, RENDERED_TIMEOUT)
+    return value
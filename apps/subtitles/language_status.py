@@ -0,0 +1,230 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Per-video status of every subtitle language.
+
+The language list on the video page and the widget drop down both need the
+same handful of facts about each language of a video: does it have a public
+version, is its tip synced, how many subtitles does the tip have, what was it
+translated from...  Asking every SubtitleLanguage for them costs several
+queries per language, so instead we compute them for the whole video with
+a fixed number of queries and keep the result in the cache.
+
+The cached value is dropped whenever a SubtitleLanguage or SubtitleVersion of
+the video is saved or deleted, and the pipeline rebuilds it once its
+transaction has committed.
+
+Each language is described by a dict with these keys:
+
+* pk, language_code, subtitles_complete and writelock_time, straight from
+  the SubtitleLanguage.
+* has_nonempty_versions: there's an extant version with subtitles (see
+  SubtitleLanguageManager.having_nonempty_versions).
+* has_public_version: there's a public version.
+* has_tip, subtitle_count, has_subtitles and is_synced: facts about the
+  extant tip (the one get_tip() returns).
+* translation_source_pk and translation_source_code: the language this one
+  was translated from (see get_translation_source_language), or None.
+
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from apps.subtitles import cache
+from apps.subtitles.models import (
+    SubtitleLanguage, SubtitleVersion, WRITELOCK_EXPIRATION
+)
+
+
+def get_language_status(video):
+    """Return the list of language statuses of video, ordered by code."""
+    value = cache.get_language_status(video.pk)
+    if value is None:
+        value = refresh_language_status(video)
+    return value
+
+def refresh_language_status(video):
+    """Rebuild the language statuses of video and store them in the cache."""
+    value = build_language_status(video)
+    cache.set_language_status(video.pk, value)
+    return value
+
+def get_language_status_for(language):
+    """Return the status dict of a single SubtitleLanguage."""
+    for status in get_language_status(language.video):
+        if status['pk'] == language.pk:
+            return status
+
+    # The cached value predates this language, start over.
+    for status in refresh_language_status(language.video):
+        if status['pk'] == language.pk:
+            return status
+
+def is_writelocked(status):
+    """Return whether the language is writelocked, like SL.is_writelocked."""
+    writelock_time = status['writelock_time']
+    if writelock_time is None:
+        return False
+    expiration = timedelta(seconds=WRITELOCK_EXPIRATION)
+    return datetime.now() - writelock_time < expiration
+
+def incomplete_tasks_by_language(team_video):
+    """Return a dict of language code -> (type, assignee pk).
+
+    Only the first incomplete task of each language is kept, which is the
+    one the widget and the video page look at.
+
+    """
+    from teams.models import Task
+
+    tasks = {}
+    rows = (Task.objects.incomplete().filter(team_video=team_video)
+                                     .values_list('language', 'type',
+                                                  'assignee'))
+    for language_code, type, assignee_id in rows:
+        tasks.setdefault(language_code, (type, assignee_id))
+    return tasks
+
+
+# Building
+def _is_public(visibility, visibility_override):
+    # Mirrors SubtitleVersionManager.public()
+    if visibility_override:
+        return visibility_override == 'public'
+    return visibility == 'public'
+
+def _get_parents(video):
+    """Return a dict of version pk -> parent pks, highest pk first."""
+    through = SubtitleVersion.parents.through
+    rows = (through.objects.filter(from_subtitleversion__video=video)
+                           .values_list('from_subtitleversion',
+                                        'to_subtitleversion'))
+    parents = defaultdict(list)
+    for version_pk, parent_pk in rows:
+        parents[version_pk].append(parent_pk)
+    for pks in parents.values():
+        pks.sort(reverse=True)
+    return parents
+
+def _translation_source(language_pk, tip_pk, versions, parents):
+    """Return the pk of the language the tip was translated from, or None.
+
+    Uses the stored translation source when there is one, and otherwise walks
+    the lineage like SubtitleVersion.get_translation_source does.
+
+    """
+    tip = versions[tip_pk]
+    if tip['is_translation'] is not None:
+        source = versions.get(tip['translation_source'])
+        if tip['is_translation'] and source:
+            return source['subtitle_language']
+        return None
+
+    current = tip_pk
+    while True:
+        current_parents = [pk for pk in parents.get(current, ())
+                           if pk in versions]
+        for pk in current_parents:
+            if versions[pk]['subtitle_language'] != language_pk:
+                return versions[pk]['subtitle_language']
+
+        if versions[current]['version_number'] > 1 and current_parents:
+            # previous versions might have parents in other languages
+            current = current_parents[0]
+        else:
+            return None
+
+def build_language_status(video):
+    """Compute the language statuses of video without touching the cache.
+
+    This costs two queries, no matter how many languages the video has.  If
+    some tips were written before the timing fields were filled in it costs
+    one more, and so do tips written before the translation source was
+    stored.
+
+    """
+    languages = list(SubtitleLanguage.objects.filter(video=video)
+                                     .order_by('language_code')
+                                     .values('pk', 'language_code',
+                                             'subtitles_complete', 'is_forked',
+                                             'writelock_time'))
+    if not languages:
+        return []
+
+    versions = dict((row['pk'], row) for row in
+                    SubtitleVersion.objects.full().filter(video=video)
+                                   .values('pk', 'subtitle_language',
+                                           'version_number', 'visibility',
+                                           'visibility_override',
+                                           'subtitle_count', 'fully_synced',
+                                           'is_translation',
+                                           'translation_source'))
+
+    tips = {}
+    nonempty = set()
+    public = set()
+    for row in versions.values():
+        if row['visibility_override'] == 'deleted':
+            continue
+        language_pk = row['subtitle_language']
+        tip = tips.get(language_pk)
+        if tip is None or row['version_number'] > tip['version_number']:
+            tips[language_pk] = row
+        if row['subtitle_count'] > 0:
+            nonempty.add(language_pk)
+        if _is_public(row['visibility'], row['visibility_override']):
+            public.add(language_pk)
+
+    # Tips that predate the denormalized timing fields need to be parsed.
+    legacy_pks = [tip['pk'] for tip in tips.values()
+                  if tip['fully_synced'] is None]
+    for version in SubtitleVersion.objects.full().filter(pk__in=legacy_pks):
+        tip = tips[version.subtitle_language_id]
+        tip['fully_synced'] = version.is_synced()
+        tip['subtitle_count'] = version.get_subtitle_count()
+
+    if any(tip['is_translation'] is None for tip in tips.values()):
+        parents = _get_parents(video)
+    else:
+        parents = {}
+    language_codes = dict((l['pk'], l['language_code']) for l in languages)
+
+    statuses = []
+    for language in languages:
+        tip = tips.get(language['pk'])
+        source_pk = None
+        if tip and not language['is_forked']:
+            source_pk = _translation_source(language['pk'], tip['pk'],
+                                            versions, parents)
+        statuses.append({
+            'pk': language['pk'],
+            'language_code': language['language_code'],
+            'subtitles_complete': language['subtitles_complete'],
+            'writelock_time': language['writelock_time'],
+            'has_nonempty_versions': language['pk'] in nonempty,
+            'has_public_version': language['pk'] in public,
+            'has_tip': tip is not None,
+            'subtitle_count': tip['subtitle_count'] if tip else 0,
+            'has_subtitles': bool(tip and tip['subtitle_count']),
+            'is_synced': bool(tip and tip['fully_synced']),
+            'translation_source_pk': source_pk,
+            'translation_source_code': language_codes.get(source_pk),
+        })
+
+    return statuses
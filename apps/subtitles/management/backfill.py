@@ -0,0 +1,85 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Base for the commands that fill in new fields of old SubtitleVersions."""
+
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min
+
+from subtitles.models import SubtitleVersion
+
+class VersionBackfillCommand(BaseCommand):
+    """Fill a field of every SubtitleVersion where it's still NULL.
+
+    Versions are processed in pk ranges by a pool of worker processes.  Only
+    versions whose pending_field is still NULL are touched, so the command
+    can be stopped and rerun at any time.
+
+    Subclasses set pending_field and fill_range, a module level function
+    wrapped in staticmethod (the pool has to pickle it), which takes a
+    (start, end) pk range, fills the versions with start <= pk < end and
+    returns how many it filled.
+    """
+    pending_field = None
+    fill_range = None
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', '-p', dest='processes', type='int',
+            default=4),
+        make_option('--chunk-size', '-c', dest='chunk_size', type='int',
+            default=1000),
+    )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        chunk_size = options['chunk_size']
+
+        pending = {'%s__isnull' % self.pending_field: True}
+        bounds = (SubtitleVersion.objects.full()
+                                         .filter(**pending)
+                                         .aggregate(Min('pk'), Max('pk')))
+        if bounds['pk__min'] is None:
+            print 'Nothing to do'
+            return
+
+        ranges = [(start, start + chunk_size)
+                  for start in xrange(bounds['pk__min'], bounds['pk__max'] + 1,
+                                      chunk_size)]
+        print '%s chunks to go' % len(ranges)
+
+        if processes > 1:
+            # The workers must not share our database connection.
+            connection.close()
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(self.fill_range, ranges)
+        else:
+            pool = None
+            results = (self.fill_range(r) for r in ranges)
+
+        total = 0
+        for i, count in enumerate(results):
+            total += count
+            print 'Done %s/%s chunks (%s versions)' % (i + 1, len(ranges), total)
+
+        if pool:
+            pool.close()
+            pool.join()
@@ -0,0 +1,59 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Fill in the stored translation source of old SubtitleVersions."""
+
+import logging
+
+from subtitles.management.backfill import VersionBackfillCommand
+from subtitles.models import SubtitleVersion
+
+logger = logging.getLogger(__name__)
+
+def fill_range(pk_range):
+    """Fill the translation source of the versions with start <= pk < end."""
+    start, end = pk_range
+    # Parents always have a lower pk, so going in pk order means that most
+    # of them have already been filled in and the lineage doesn't need to be
+    # walked.
+    versions = (SubtitleVersion.objects.full()
+                                       .filter(pk__gte=start, pk__lt=end,
+                                               is_translation__isnull=True)
+                                       .defer('serialized_subtitles')
+                                       .order_by('pk'))
+    count = 0
+    for version in versions:
+        try:
+            version.set_translation_source(list(version.parents.full()))
+        except Exception:
+            logger.exception('Failed to find the source of version %s',
+                             version.pk)
+            continue
+
+        SubtitleVersion.objects.full().filter(pk=version.pk).update(
+            is_translation=version.is_translation,
+            translation_source=version.translation_source_id)
+        count += 1
+
+    return count
+
+class Command(VersionBackfillCommand):
+    help = u'Fill in the translation source of versions written before it was stored'
+
+    pending_field = 'is_translation'
+    fill_range = staticmethod(fill_range)
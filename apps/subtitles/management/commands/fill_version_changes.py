@@ -0,0 +1,63 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Fill in the stored text/time changes of old SubtitleVersions."""
+
+import logging
+
+from subtitles.management.backfill import VersionBackfillCommand
+from subtitles.models import SubtitleVersion
+
+logger = logging.getLogger(__name__)
+
+def fill_range(pk_range):
+    """Fill the change fields of the versions with start <= pk < end."""
+    start, end = pk_range
+    versions = (SubtitleVersion.objects.full()
+                                       .filter(pk__gte=start, pk__lt=end,
+                                               time_changed__isnull=True)
+                                       .order_by('subtitle_language',
+                                                 'version_number'))
+    count = 0
+    # Consecutive versions of a language are usually diffed against each
+    # other, so keep the last one around to avoid parsing it twice.
+    last = None
+    for version in versions:
+        try:
+            previous = version.previous_version()
+            if previous and last and previous.pk == last.pk:
+                previous = last
+            version.set_changes(previous)
+        except Exception:
+            logger.exception('Failed to diff version %s', version.pk)
+            continue
+        finally:
+            last = version
+
+        SubtitleVersion.objects.full().filter(pk=version.pk).update(
+            time_changed=version.time_changed,
+            text_changed=version.text_changed)
+        count += 1
+
+    return count
+
+class Command(VersionBackfillCommand):
+    help = u'Fill in the text/time changes of versions written before they were stored'
+
+    pending_field = 'time_changed'
+    fill_range = staticmethod(fill_range)
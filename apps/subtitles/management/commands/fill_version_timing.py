@@ -0,0 +1,58 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Fill in the denormalized timing fields of old SubtitleVersions."""
+
+import logging
+
+from subtitles.management.backfill import VersionBackfillCommand
+from subtitles.models import SubtitleVersion
+
+logger = logging.getLogger(__name__)
+
+def fill_range(pk_range):
+    """Fill the timing fields of the versions with start <= pk < end."""
+    start, end = pk_range
+    versions = (SubtitleVersion.objects.full()
+                                       .filter(pk__gte=start, pk__lt=end,
+                                               fully_synced__isnull=True)
+                                       .only('serialized_subtitles'))
+    count = 0
+    for version in versions:
+        try:
+            subtitles = version.get_subtitles()
+            version.set_timing(subtitles)
+        except Exception:
+            logger.exception('Failed to read subtitles of version %s',
+                             version.pk)
+            continue
+
+        SubtitleVersion.objects.full().filter(pk=version.pk).update(
+            subtitle_count=len(subtitles),
+            start_time=version.start_time,
+            end_time=version.end_time,
+            fully_synced=version.fully_synced)
+        count += 1
+
+    return count
+
+class Command(VersionBackfillCommand):
+    help = u'Fill in the timing fields of versions written before they existed'
+
+    pending_field = 'fully_synced'
+    fill_range = staticmethod(fill_range)
@@ -154,44 +154,35 @@ class SubtitleLanguageManager(models.Manager):
     # These methods are not fun, and they are not pretty, but they ARE fast.
     #
     # Prepare yourself.
+    #
+    # (The ones about tips and public versions have since been rewritten to use
+    # the tip pointers on SubtitleLanguage, which are denormalized after all.)
+
+    def update_tips(self, video):
+        """Recompute the tip pointers of every language of the video.
+
+        Use this after changing the visibility of versions with update(), which
+        bypasses SubtitleVersion.save().
+
+        """
+        for language in self.get_query_set().filter(video=video):
+            language.update_tips()
 
     def having_versions(self):
         """Return a QS of SLs that have at least 1 version.
 
-        TODO: See if we need to denormalize this into a field.  I don't think we
-        will (and would strongly prefer not to (see the has_version/had_version
-        mess we were in before)).
+        This uses the denormalized tip pointers (see SubtitleLanguage.extant_tip).
 
         """
-        return self.get_query_set().extra(where=[
-            """
-            EXISTS (
-                SELECT 1
-                  FROM subtitles_subtitleversion AS sv
-                 WHERE sv.subtitle_language_id = subtitles_subtitlelanguage.id
-               AND NOT sv.visibility_override = 'deleted'
-            )
-            """,
-        ])
+        return self.get_query_set().filter(extant_tip__isnull=False)
 
     def not_having_versions(self):
         """Return a QS of SLs that have zero versions.
 
-        TODO: See if we need to denormalize this into a field.  I don't think we
-        will (and would strongly prefer not to (see the has_version/had_version
-        mess we were in before)).
+        This uses the denormalized tip pointers (see SubtitleLanguage.extant_tip).
 
         """
-        return self.get_query_set().extra(where=[
-            """
-            NOT EXISTS (
-                SELECT 1
-                  FROM subtitles_subtitleversion AS sv
-                 WHERE sv.subtitle_language_id = subtitles_subtitlelanguage.id
-               AND NOT sv.visibility_override = 'deleted'
-            )
-            """,
-        ])
+        return self.get_query_set().filter(extant_tip__isnull=True)
 
 
     def having_nonempty_versions(self):
@@ -223,90 +214,30 @@ class SubtitleLanguageManager(models.Manager):
 
     def having_nonempty_tip(self):
         """Return a QS of SLs that have a tip version with 1 or more subtitles."""
-        return self.get_query_set().extra(where=[
-            """
-            EXISTS (
-               SELECT 1 FROM subtitles_subtitleversion AS sv
-                INNER JOIN (
-                     SELECT subtitle_language_id,
-                            MAX(version_number) AS tip_version_number
-                       FROM subtitles_subtitleversion AS subver
-                      WHERE NOT subver.visibility_override = 'deleted'
-                      GROUP BY subtitle_language_id
-                ) AS tip_versions ON (
-                    sv.subtitle_language_id = tip_versions.subtitle_language_id
-                    AND sv.version_number = tip_versions.tip_version_number
-                )
-                WHERE sv.subtitle_count > 0
-                  AND sv.subtitle_language_id = subtitles_subtitlelanguage.id
-            )
-            """,
-        ])
+        return self.get_query_set().filter(extant_tip__subtitle_count__gt=0)
 
     def not_having_nonempty_tip(self):
         """Return a QS of SLs that do not have a tip version with 1 or more subtitles."""
-        return self.get_query_set().extra(where=[
-            """
-            NOT EXISTS (
-               SELECT 1 FROM subtitles_subtitleversion AS sv
-                INNER JOIN (
-                     SELECT subtitle_language_id,
-                            MAX(version_number) AS tip_version_number
-                       FROM subtitles_subtitleversion AS subver
-                      WHERE NOT subver.visibility_override = 'deleted'
-                      GROUP BY subtitle_language_id
-                ) AS tip_versions ON (
-                    sv.subtitle_language_id = tip_versions.subtitle_language_id
-                    AND sv.version_number = tip_versions.tip_version_number
-                )
-                WHERE sv.subtitle_count > 0
-                  AND sv.subtitle_language_id = subtitles_subtitlelanguage.id
-            )
-            """,
-        ])
+        return self.get_query_set().filter(
+            models.Q(extant_tip__isnull=True) |
+            models.Q(extant_tip__subtitle_count=0))
 
 
     def having_public_versions(self):
         """Return a QS of SLs that have at least 1 publicly-visible versions.
 
-        TODO: See if we need to denormalize this into a field.  I don't think we
-        will (and would strongly prefer not to (see the has_version/had_version
-        mess we were in before)).
+        This uses the denormalized tip pointers (see SubtitleLanguage.extant_tip).
 
         """
-        return self.get_query_set().extra(where=[
-            """
-            EXISTS (
-                SELECT 1
-                  FROM subtitles_subtitleversion AS sv
-                 WHERE sv.subtitle_language_id = subtitles_subtitlelanguage.id
-               AND NOT sv.visibility_override = 'deleted'
-               AND NOT sv.visibility_override = 'private'
-               AND NOT (sv.visibility = 'private' AND sv.visibility_override = '')
-            )
-            """,
-        ])
+        return self.get_query_set().filter(public_tip__isnull=False)
 
     def not_having_public_versions(self):
         """Return a QS of SLs that have zero publicly-visible versions.
 
-        TODO: See if we need to denormalize this into a field.  I don't think we
-        will (and would strongly prefer not to (see the has_version/had_version
-        mess we were in before)).
+        This uses the denormalized tip pointers (see SubtitleLanguage.extant_tip).
 
         """
-        return self.get_query_set().extra(where=[
-            """
-            NOT EXISTS (
-                SELECT 1
-                  FROM subtitles_subtitleversion AS sv
-                 WHERE sv.subtitle_language_id = subtitles_subtitlelanguage.id
-               AND NOT sv.visibility_override = 'deleted'
-               AND NOT sv.visibility_override = 'private'
-               AND NOT (sv.visibility = 'private' AND sv.visibility_override = '')
-            )
-            """,
-        ])
+        return self.get_query_set().filter(public_tip__isnull=True)
 
 
 class SubtitleLanguage(models.Model):
@@ -364,6 +295,21 @@ class SubtitleLanguage(models.Model):
     followers = models.ManyToManyField(User, blank=True,
             related_name='new_followed_languages', editable=False)
 
+    # Denormalized pointers to the tip versions, as returned by get_tip() with
+    # its three possible arguments (extant, public and full).  They're kept in
+    # sync by SubtitleVersion.save() (which add_version, publish, unpublish and
+    # nuke_language all go through) using update_tips().  Don't set them
+    # yourself.
+    extant_tip = models.ForeignKey('SubtitleVersion', null=True, blank=True,
+                                   editable=False, related_name='extant_tip_of',
+                                   on_delete=models.SET_NULL)
+    public_tip = models.ForeignKey('SubtitleVersion', null=True, blank=True,
+                                   editable=False, related_name='public_tip_of',
+                                   on_delete=models.SET_NULL)
+    full_tip = models.ForeignKey('SubtitleVersion', null=True, blank=True,
+                                 editable=False, related_name='full_tip_of',
+                                 on_delete=models.SET_NULL)
+
     # Statistics
     subtitles_fetched_count = models.IntegerField(default=0, editable=False)
     subtitles_fetched_counter = RedisSimpleField()
@@ -462,7 +408,19 @@ class SubtitleLanguage(models.Model):
         if creating and not self.created:
             self.created = datetime.now()
 
-        return super(SubtitleLanguage, self).save(*args, **kwargs)
+        if not creating:
+            # The tip pointers are maintained with update() by the versions, so
+            # this instance may hold stale ones.  Don't write them back.
+            rows = (SubtitleLanguage.objects.filter(pk=self.pk)
+                                    .values_list('extant_tip', 'public_tip',
+                                                 'full_tip'))
+            if rows:
+                (self.extant_tip_id, self.public_tip_id,
+                 self.full_tip_id) = rows[0]
+
+        result = super(SubtitleLanguage, self).save(*args, **kwargs)
+        cache.invalidate_language_status(self.video_id)
+        return result
 
 
     def get_tip(self, public=False, full=False):
@@ -478,15 +436,20 @@ class SubtitleLanguage(models.Model):
         if public and full:
             assert False, "Cannot specify public and full in get_tip()!"
 
+        if not self.pk:
+            return None
+
+        # Follow the tip pointer through a join instead of reading it off
+        # self, so we don't return a stale tip if the versions were changed
+        # through another instance of this language.
         if public:
-            versions = SubtitleVersion.objects.public()
+            lookup = 'public_tip_of'
         elif full:
-            versions = SubtitleVersion.objects.full()
+            lookup = 'full_tip_of'
         else:
-            versions = SubtitleVersion.objects.extant()
+            lookup = 'extant_tip_of'
 
-        versions = versions.filter(subtitle_language=self)
-        versions = versions.order_by('-version_number')
+        versions = SubtitleVersion.objects.full().filter(**{lookup: self.pk})
         versions = versions[:1]
 
         if versions:
@@ -494,6 +457,29 @@ class SubtitleLanguage(models.Model):
         else:
             return None
 
+    def update_tips(self):
+        """Recompute the tip pointers from the versions and store them."""
+        def _tip_pk(versions):
+            pks = (versions.filter(subtitle_language=self)
+                           .order_by('-version_number')
+                           .values_list('pk', flat=True)[:1])
+            return pks[0] if pks else None
+
+        self._set_tips(extant_tip=_tip_pk(SubtitleVersion.objects.extant()),
+                       public_tip=_tip_pk(SubtitleVersion.objects.public()),
+                       full_tip=_tip_pk(SubtitleVersion.objects.full()))
+
+    def _set_tips(self, **tips):
+        """Store the given tip pointers (field name -> version pk)."""
+        for name, pk in tips.items():
+            field = self._meta.get_field(name)
+            setattr(self, field.attname, pk)
+            # Drop the cached related object, it's the old tip.
+            self.__dict__.pop(field.get_cache_name(), None)
+
+        SubtitleLanguage.objects.filter(pk=self.pk).update(
+            **dict(('%s_id' % name, pk) for name, pk in tips.items()))
+
     def get_public_tip(self):
         """Return the latest public tip for a particular version.
 
@@ -528,9 +514,7 @@ class SubtitleLanguage(models.Model):
         if not version:
             return False
 
-        subtitles = version.get_subtitles()
-
-        return subtitles.fully_synced
+        return version.is_synced()
 
     def _sanity_check_parents(self, version, parents):
         r"""Check that the given parents are sane for an SV about to be created.
@@ -615,9 +599,17 @@ class SubtitleLanguage(models.Model):
         ensure_stringy(kwargs.get('description'))
 
         sv = SubtitleVersion(*args, **kwargs)
+        sv._adding_at_tip = True
 
         sv.set_subtitles(kwargs.get('subtitles', None))
         self._sanity_check_parents(sv, parents)
+        sv.set_translation_source(parents)
+
+        if tip and tip.is_deleted():
+            previous = self.get_tip()
+        else:
+            previous = tip
+        sv.set_changes(previous)
 
         sv.full_clean()
         sv.save()
@@ -792,23 +784,7 @@ class SubtitleLanguage(models.Model):
         if not current_version:
             return None
 
-        while True:
-            parents = current_version.parents.full().order_by('-pk')
-            # parents can be on the same language, try other languages at first
-            other_languages = parents.exclude(subtitle_language=self)
-            try:
-                return other_languages[0]
-            except IndexError:
-                if current_version.version_number > 1:
-                    try:
-                        # previous versions might have parents in other languages
-                        # so set the current version to the same language, and
-                        # check that out
-                        current_version = parents[0]
-                    except IndexError:
-                        return None
-                else:
-                    return None
+        return current_version.get_translation_source()
 
 
     def get_dependent_subtitle_languages(self, direct=False):
@@ -826,7 +802,8 @@ class SubtitleLanguage(models.Model):
             >>> en.get_dsl(direct=True)
             [fr]
 
-        Note that this is NOT going to be very performant.
+        This costs a fixed number of queries however many languages the video
+        has.
 
         This is a shim for the existing UI.  Once the new one comes this
         monstrosity will be torn out.
@@ -847,18 +824,20 @@ class SubtitleLanguage(models.Model):
 
         # Check the lineage maps for the candidates to determine if they're
         # dependents.
-        results = []
-        for sl in sls:
-            tip = sl.get_tip()
-            if tip and self.language_code in tip.lineage:
-                results.append(sl)
+        tips = SubtitleVersion.objects.tips([sl.pk for sl in sls],
+                                            defer_subtitles=True)
+        results = [sl for sl in sls
+                   if sl.pk in tips
+                   and self.language_code in tips[sl.pk].lineage]
 
         # Direct translations are restricted to those that come directly from
         # the source language (this).
         if direct:
+            sources = SubtitleVersion.objects.translation_sources(
+                [tips[sl.pk] for sl in results])
             lc = self.language_code
             results = [sl for sl in results
-                       if sl.get_translation_source_language_code() == lc]
+                       if sources.get(tips[sl.pk].pk, (None, None))[1] == lc]
 
         return results
 
@@ -896,7 +875,7 @@ class SubtitleLanguage(models.Model):
             qs = qs.exclude(pk__in=[u.pk for u in exclude if u])
         return qs
 
-    def in_progress(self):
+    def in_progress(self, tip=-1):
         """Return whether this SubtitleLanguage is "in progress".
 
         Moderated teams:
@@ -907,13 +886,19 @@ class SubtitleLanguage(models.Model):
 
             It's in progress if it has subs but not marked as complete
 
+        If you already have the result of get_tip() you can pass it as tip to
+        save the query.
+
         """
+        if tip == -1:
+            tip = self.get_tip()
+
         if self.video.is_moderated:
-            if self.get_tip().is_private():
+            if tip.is_private():
                 return True
         else:
             if not self.subtitles_complete and \
-                    self.get_tip().get_subtitle_count() > 0:
+                    tip.get_subtitle_count() > 0:
                 return True
 
         return False
@@ -977,6 +962,59 @@ class SubtitleVersionManager(models.Manager):
         assert False, ('all() is disabled on SubtitleVersion sets.  '
                        'Use full(), extant(), or public() instead.')
 
+    def tips(self, language_ids, public=False, defer_subtitles=False):
+        """Return a dict of SubtitleLanguage pk -> tip version for many languages.
+
+        This is the bulk version of SubtitleLanguage.get_tip (without the full
+        option) and costs one query no matter how many languages you give it.
+        Languages without a matching version are left out.
+
+        If defer_subtitles is given the subtitle blobs are not loaded, which
+        is a lot cheaper if you only need the version metadata.
+
+        """
+        language_ids = list(language_ids)
+        if not language_ids:
+            return {}
+
+        lookup = 'public_tip_of__in' if public else 'extant_tip_of__in'
+        tips = self.full().filter(**{lookup: language_ids})
+        if defer_subtitles:
+            tips = tips.defer('serialized_subtitles')
+
+        return dict((sv.subtitle_language_id, sv) for sv in tips)
+
+    def translation_sources(self, versions):
+        """Return a dict of version pk -> (source SL pk, source language code).
+
+        This is the bulk version of SubtitleVersion.get_translation_source.
+        Versions that aren't translations are left out.  It costs one query
+        for all the versions that have their source stored, plus the lineage
+        walk of those that don't.
+
+        """
+        sources = {}
+        source_pks = {}
+        for version in versions:
+            if version.is_translation is None:
+                source = version.get_translation_source()
+                if source:
+                    sources[version.pk] = (source.subtitle_language_id,
+                                           source.language_code)
+            elif version.translation_source_id:
+                source_pks[version.pk] = version.translation_source_id
+
+        if source_pks:
+            rows = (self.full().filter(pk__in=set(source_pks.values()))
+                               .values_list('pk', 'subtitle_language',
+                                            'language_code'))
+            languages = dict((pk, (sl_pk, code)) for pk, sl_pk, code in rows)
+            for pk, source_pk in source_pks.items():
+                if source_pk in languages:
+                    sources[pk] = languages[source_pk]
+
+        return sources
+
 ORIGIN_API = 'api'
 ORIGIN_IMPORTED = 'imported'
 ORIGIN_LEGACY_EDITOR = 'web-legacy-editor'
@@ -1071,6 +1109,34 @@ class SubtitleVersion(models.Model):
     # easier filtering later.
     subtitle_count = models.PositiveIntegerField(default=0)
 
+    # Denormalized timing facts, so billing and the completeness checks don't
+    # have to parse the subtitles.  All of them are set by set_subtitles.
+    # start_time is the start of the first subtitle, end_time the end of the
+    # last one (falling back to its start for legacy data without one), both
+    # in milliseconds.  fully_synced is None for versions written before these
+    # fields existed (see the fill_version_timing command).
+    start_time = models.IntegerField(null=True, blank=True)
+    end_time = models.IntegerField(null=True, blank=True)
+    fully_synced = models.NullBooleanField()
+
+    # Denormalized result of diffing the subtitles against the previous extant
+    # version (see get_changes), as ratios between 0 and 1.  add_version fills
+    # them in, and they're reset when deleting or undeleting the version
+    # before this one.  NULL means they need to be computed again.
+    time_changed = models.FloatField(null=True, blank=True)
+    text_changed = models.FloatField(null=True, blank=True)
+
+    # Denormalized translation source: the version in another language that
+    # this one (or one of its ancestors in this language) was translated from.
+    # add_version sets both.  is_translation is None for versions written
+    # before these fields existed (see fill_translation_sources), in which case
+    # the lineage has to be walked instead.  translation_source can also be
+    # NULL for a translation if its source was deleted from the database.
+    is_translation = models.NullBooleanField()
+    translation_source = models.ForeignKey('self', null=True, blank=True,
+                                           related_name='translations',
+                                           on_delete=models.SET_NULL)
+
     created = models.DateTimeField(editable=False)
 
     # Subtitles are stored in a text blob, serialized as base64'ed zipped XML
@@ -1098,6 +1164,16 @@ class SubtitleVersion(models.Model):
 
         return self._subtitles
 
+    def get_subtitles_xml(self):
+        """Return the DFXP for this version as it is stored.
+
+        This only decompresses the blob, which is much cheaper than
+        get_subtitles().to_xml() for long transcripts.  Use it when you just
+        need to hand the XML to someone else.
+
+        """
+        return decompress(self.serialized_subtitles)
+
     def set_subtitles(self, subtitles):
         """Set the SubtitleSet for this version.
 
@@ -1126,12 +1202,45 @@ class SubtitleVersion(models.Model):
                                 % str(type(subtitles)))
 
         self.subtitle_count = len(subtitles)
+        self.set_timing(subtitles)
         self.serialized_subtitles = compress(subtitles.to_xml())
 
         # We cache the parsed subs for speed.
         self._subtitles = subtitles
 
 
+    def set_timing(self, subtitles):
+        """Fill in the denormalized timing fields from a SubtitleSet."""
+        if len(subtitles):
+            first, last = subtitles[0], subtitles[-1]
+            self.start_time = first.start_time
+            # The -1 value for the end_time isn't allowed anymore but some
+            # legacy data will still have it.
+            if last.end_time and last.end_time != -1:
+                self.end_time = last.end_time
+            else:
+                self.end_time = last.start_time
+        else:
+            self.start_time = self.end_time = None
+
+        self.fully_synced = subtitles.fully_synced
+
+    def get_time_bounds(self):
+        """Return (start_time, end_time) of the subtitles, or None if empty.
+
+        Uses the denormalized fields, only parsing the subtitles for versions
+        they haven't been filled in for yet.
+
+        """
+        if self.fully_synced is None:
+            subtitles = self.get_subtitles()
+            self.subtitle_count = len(subtitles)
+            self.set_timing(subtitles)
+
+        if not self.subtitle_count:
+            return None
+        return self.start_time, self.end_time
+
     def get_lineage(self):
         # We cache the parsed lineage for speed.
         if self._lineage == None:
@@ -1186,6 +1295,10 @@ class SubtitleVersion(models.Model):
         if lineage != None:
             self.lineage = lineage
 
+        # Read them from __dict__ so deferred loads don't fetch the fields.
+        self._saved_visibility = (self.__dict__.get('visibility'),
+                                  self.__dict__.get('visibility_override'))
+
     def __unicode__(self):
         return u'SubtitleVersion %s / %s / %s v%s' % (
             (self.id or '(unsaved)'), self.video.video_id,
@@ -1224,8 +1337,92 @@ class SubtitleVersion(models.Model):
         else:
             Action.create_caption_handler(self, self.created)
 
-        return super(SubtitleVersion, self).save(*args, **kwargs)
+        result = super(SubtitleVersion, self).save(*args, **kwargs)
+        cache.invalidate_language_status(self.video_id)
+
+        visibility = (self.visibility, self.visibility_override)
+        if creating and getattr(self, '_adding_at_tip', False):
+            # add_version always adds at the tip, no need to look.
+            tips = {'full_tip': self.pk}
+            if not self.is_deleted():
+                tips['extant_tip'] = self.pk
+            if self.is_public():
+                tips['public_tip'] = self.pk
+            self.subtitle_language._set_tips(**tips)
+        elif creating or visibility != self._saved_visibility:
+            self.subtitle_language.update_tips()
+
+            was_deleted = self._saved_visibility[1] == 'deleted'
+            if self.is_deleted() != was_deleted:
+                # The next version was diffed against a different version.
+                next_version = self.next_version()
+                if next_version:
+                    SubtitleVersion.objects.full().filter(
+                        pk=next_version.pk).update(time_changed=None,
+                                                   text_changed=None)
+        self._saved_visibility = visibility
+
+        return result
+
+
+    def set_translation_source(self, parents):
+        """Fill in the translation source fields from the version's parents.
+
+        parents should be every parent the version is going to have (the
+        previous version of the language included).  Doesn't save anything.
+
+        """
+        parents = sorted(parents, key=lambda p: p.pk, reverse=True)
+        other_languages = [p for p in parents
+                           if p.subtitle_language_id != self.subtitle_language_id]
+
+        if other_languages:
+            source = other_languages[0]
+        elif self.version_number > 1 and parents:
+            # previous versions might have parents in other languages
+            parent = parents[0]
+            if parent.is_translation is not None:
+                # Copy the id over, no need to fetch the source itself.
+                self.is_translation = parent.is_translation
+                self.translation_source_id = parent.translation_source_id
+                return
+            source = parent.get_translation_source()
+        else:
+            source = None
+
+        self.is_translation = source is not None
+        self.translation_source = source
+
+    def get_translation_source(self):
+        """Return the version in another language this one was translated from.
+
+        Returns None if this version is not a translation.  Forking is up to
+        the caller (see SubtitleLanguage.get_translation_source_version).
 
+        """
+        if self.is_translation is not None:
+            return self.translation_source if self.is_translation else None
+
+        # Versions written before the source was stored: walk the lineage.
+        current_version = self
+        while True:
+            parents = current_version.parents.full().order_by('-pk')
+            # parents can be on the same language, try other languages at first
+            other_languages = parents.exclude(
+                subtitle_language=self.subtitle_language_id)
+            try:
+                return other_languages[0]
+            except IndexError:
+                if current_version.version_number > 1:
+                    try:
+                        # previous versions might have parents in other languages
+                        # so set the current version to the same language, and
+                        # check that out
+                        current_version = parents[0]
+                    except IndexError:
+                        return None
+                else:
+                    return None
 
     def get_ancestors(self):
         """Return all ancestors of this version.  WARNING: MAY EAT YOUR DB!
@@ -1244,9 +1441,29 @@ class SubtitleVersion(models.Model):
         return set(mapcat(_ancestors, self.parents.full()))
 
     def get_subtitle_count(self):
+        if self.fully_synced is not None:
+            return self.subtitle_count
         # TODO: babelsubs now supports len() on SubtitleSet instances
         return len([s for s in self.get_subtitles().subtitle_items()])
 
+    def set_changes(self, previous):
+        """Fill in time_changed and text_changed by diffing against previous.
+
+        previous should be the version before this one (excluding deleted
+        ones), or None if this is the first one.  Doesn't save anything.
+
+        """
+        if not previous:
+            self.time_changed, self.text_changed = 1.0, 1.0
+            return
+
+        diff_data = diff_subtitles(previous.get_subtitles(),
+                                   self.get_subtitles(),
+                                   HTMLGenerator.MAPPINGS)
+
+        self.text_changed = diff_data['text_changed']
+        self.time_changed = diff_data['time_changed']
+
     def get_changes(self):
         """Return (time_change, text_change).
 
@@ -1259,44 +1476,40 @@ class SubtitleVersion(models.Model):
         diffing subtitle versions meaningfully.  Until then, we have this
         monstrosity.  Godspeed.
 
+        The result is stored on the version when it's created, so this only
+        has to diff versions that were written before that, or that follow
+        a version that was deleted since.
+
         """
         # TODO: Time only changes aren't quite right.
 
-        if hasattr(self, '_time_change') and hasattr(self, '_text_change'):
-            return (self._time_change, self._text_change)
+        if self.time_changed is None or self.text_changed is None:
+            self.set_changes(self.previous_version())
 
-        parent = self.previous_version()
+            if self.pk:
+                SubtitleVersion.objects.full().filter(pk=self.pk).update(
+                    time_changed=self.time_changed,
+                    text_changed=self.text_changed)
 
-        if not parent:
-            return (1.0, 1.0)
-
-        diff_data = diff_subtitles(parent.get_subtitles(), self.get_subtitles(),
-                                   HTMLGenerator.MAPPINGS)
-
-        self._text_change = diff_data['text_changed']
-        self._time_change = diff_data['time_changed']
-
-        return self._time_change, self._text_change
+        return self.time_changed, self.text_changed
 
     @property
     def time_change(self):
-        if not hasattr(self, '_time_change'):
-            self.get_changes()
+        time_change = self.get_changes()[0]
 
-        if not self._time_change:
+        if not time_change:
             return '0%'
         else:
-            return '%.0f%%' % (self._time_change * 100)
+            return '%.0f%%' % (time_change * 100)
 
     @property
     def text_change(self):
-        if not hasattr(self, '_text_change'):
-            self.get_changes()
+        text_change = self.get_changes()[1]
 
-        if not self._text_change:
+        if not text_change:
             return '0%'
         else:
-            return '%.0f%%' % (self._text_change * 100)
+            return '%.0f%%' % (text_change * 100)
 
 
     def is_private(self):
@@ -1453,6 +1666,8 @@ class SubtitleVersion(models.Model):
         return self.subtitle_count is not 0
 
     def is_synced(self):
+        if self.fully_synced is not None:
+            return self.fully_synced
         return self.get_subtitles().fully_synced
 
     def publish(self):
@@ -1584,3 +1799,10 @@ class Collaborator(models.Model):
         return result
 
 
+def _invalidate_language_status(sender, instance, **kwargs):
+    cache.invalidate_language_status(instance.video_id)
+
+models.signals.post_delete.connect(_invalidate_language_status,
+                                   sender=SubtitleLanguage)
+models.signals.post_delete.connect(_invalidate_language_status,
+                                   sender=SubtitleVersion)
@@ -60,6 +60,7 @@ from apps.subtitles.models import (
     SubtitleLanguage, SubtitleVersion, ORIGIN_ROLLBACK, ORIGIN_API,
     ORIGIN_UPLOAD
 )
+from apps.subtitles.language_status import refresh_language_status
 
 
 # Utility Functions -----------------------------------------------------------
@@ -505,10 +506,15 @@ def add_subtitles(video, language_code, subtitles,
 
     """
     with transaction.commit_on_success():
-        return _add_subtitles(video, language_code, subtitles, title,
-                              description, author, visibility,
-                              visibility_override, parents, None, committer,
-                              complete, created, note, origin)
+        version = _add_subtitles(video, language_code, subtitles, title,
+                                 description, author, visibility,
+                                 visibility_override, parents, None, committer,
+                                 complete, created, note, origin)
+
+    # Only rebuild once the transaction is committed, or a concurrent request
+    # could cache what it saw before the commit.
+    refresh_language_status(video)
+    return version
 
 
 def unsafe_rollback_to(video, language_code, version_number,
@@ -548,6 +554,9 @@ def rollback_to(video, language_code, version_number,
 
     """
     with transaction.commit_on_success():
-        return _rollback_to(video, language_code, version_number,
-                            rollback_author)
+        version = _rollback_to(video, language_code, version_number,
+                               rollback_author)
+
+    refresh_language_status(video)
+    return version
 
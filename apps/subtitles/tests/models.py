@@ -26,7 +26,7 @@ from django.test import TestCase
 from babelsubs.storage import SubtitleSet
 
 from apps.auth.models import CustomUser as User
-from apps.subtitles import pipeline
+from apps.subtitles import language_status, pipeline
 from apps.subtitles.models import SubtitleLanguage, SubtitleVersion
 from apps.subtitles.tests.utils import (
     make_video, make_video_2, make_video_3, make_sl, refresh, ids, parent_ids,
@@ -146,6 +146,79 @@ class TestSubtitleLanguage(TestCase):
             source_lang.language_code
         )
 
+    def test_stored_translation_source(self):
+        en = make_sl(self.video, 'en')
+        en_v1 = en.add_version()
+        self.assertFalse(en_v1.is_translation)
+
+        fr = make_sl(self.video, 'fr')
+        fr_v1 = fr.add_version(parents=[en_v1])
+        fr_v2 = fr.add_version()
+        self.assertTrue(refresh(fr_v1).is_translation)
+        self.assertEqual(refresh(fr_v1).translation_source, en_v1)
+        # later versions inherit the source of the one before
+        self.assertEqual(refresh(fr_v2).translation_source, en_v1)
+
+        de = make_sl(self.video, 'de')
+        de.add_version(parents=[fr_v2])
+
+        self.assertEqual(
+            sorted(sl.language_code
+                   for sl in en.get_dependent_subtitle_languages()),
+            ['de', 'fr'])
+        self.assertEqual(
+            [sl.language_code
+             for sl in en.get_dependent_subtitle_languages(direct=True)],
+            ['fr'])
+
+        # Versions from before the source was stored walk the lineage.
+        SubtitleVersion.objects.full().update(is_translation=None,
+                                              translation_source=None)
+        self.assertEqual(refresh(fr).get_translation_source_language(), en)
+        self.assertEqual(
+            [sl.language_code
+             for sl in fr.get_dependent_subtitle_languages(direct=True)],
+            ['de'])
+
+    def test_tip_pointers(self):
+        sl = make_sl(self.video, 'en')
+
+        def _assert_pointers(extant, public, full):
+            sl = SubtitleLanguage.objects.get(video=self.video,
+                                              language_code='en')
+            def _number(version):
+                return version.version_number if version else None
+            self.assertEqual(_number(sl.extant_tip), extant)
+            self.assertEqual(_number(sl.public_tip), public)
+            self.assertEqual(_number(sl.full_tip), full)
+
+        _assert_pointers(None, None, None)
+
+        v1 = sl.add_version()
+        v2 = sl.add_version(visibility='private')
+        _assert_pointers(2, 1, 2)
+
+        # publish() needs a team video, this is what it does
+        v2.visibility = 'public'
+        v2.save()
+        _assert_pointers(2, 2, 2)
+
+        v2.unpublish(delete=True)
+        _assert_pointers(1, 1, 2)
+
+        # A stale instance doesn't write its pointers back.
+        sl.subtitles_complete = True
+        sl.save()
+        _assert_pointers(1, 1, 2)
+
+        self.assertEqual(
+            list(SubtitleLanguage.objects.having_public_versions()), [sl])
+
+        sl.nuke_language()
+        _assert_pointers(None, None, 2)
+        self.assertEqual(
+            list(SubtitleLanguage.objects.not_having_versions()), [sl])
+
     def test_get_tip(self):
         sl = make_sl(self.video, 'en')
 
@@ -182,6 +255,24 @@ class TestSubtitleLanguage(TestCase):
         _assert_tip(False, 6)
         _assert_tip(True, 6)
 
+    def test_tips(self):
+        sl_en = make_sl(self.video, 'en')
+        sl_fr = make_sl(self.video, 'fr')
+        sl_de = make_sl(self.video, 'de')
+
+        sl_en.add_version()
+        sl_en.add_version(visibility='private')
+        sl_fr.add_version(visibility='private')
+
+        def _tip_numbers(public):
+            tips = SubtitleVersion.objects.tips(
+                [sl_en.pk, sl_fr.pk, sl_de.pk], public=public)
+            return dict((pk, sv.version_number) for pk, sv in tips.items())
+
+        self.assertEqual(_tip_numbers(False), {sl_en.pk: 2, sl_fr.pk: 1})
+        self.assertEqual(_tip_numbers(True), {sl_en.pk: 1})
+        self.assertEqual(SubtitleVersion.objects.tips([]), {})
+
     def test_get_version(self):
         # Actually tests the .version() method whose name we should update at
         # some point to fit with the rest.
@@ -318,6 +409,14 @@ class TestSubtitleVersion(TestCase):
         sv = refresh(sv)
         self.assertEqual(sv.get_subtitles(), SubtitleSet.from_list('en', [s0, s1]))
 
+    def test_subtitles_xml(self):
+        s0 = (100, 200, "a")
+        s1 = (300, 400, "b")
+
+        sv = self.sl_en.add_version(subtitles=[s0, s1])
+        sv = refresh(sv)
+        self.assertEqual(sv.get_subtitles_xml(), sv.get_subtitles().to_xml())
+
     def test_denormalization_sanity_checks(self):
         """Test the sanity checks for data denormalized into the version model."""
 
@@ -477,6 +576,10 @@ class TestSubtitleVersion(TestCase):
         # text is the same, but 50% of the timing is new
         self.assertEquals((0.5, 0.0), sv4.get_changes())
 
+        # The changes are stored when the version is added.
+        sv4 = refresh(sv4)
+        self.assertEquals((0.5, 0.0), (sv4.time_changed, sv4.text_changed))
+
         # Deleting versions should make their children diff against the
         # still-remaining ones instead of the deleted ones.
         sv2.visibility_override = 'deleted'
@@ -484,6 +587,7 @@ class TestSubtitleVersion(TestCase):
         sv3 = refresh(sv3)
         self.assertAlmostEqual(1/3.0, sv3.get_changes()[0])
         self.assertEquals(1.0, sv3.get_changes()[1])
+        self.assertEquals(1.0, refresh(sv3).text_changed)
 
     def test_subtitle_count(self):
         s0 = (100, 200, "a")
@@ -511,6 +615,30 @@ class TestSubtitleVersion(TestCase):
         sv4 = refresh(sv4)
         self.assertEqual(200, sv4.subtitle_count)
 
+    def test_timing_fields(self):
+        sv1 = refresh(self.sl_en.add_version(subtitles=[]))
+        self.assertEqual(sv1.get_time_bounds(), None)
+        self.assertTrue(sv1.fully_synced)
+
+        sv2 = refresh(self.sl_en.add_version(
+            subtitles=[(100, 200, "a"), (300, 400, "b")]))
+        self.assertEqual(sv2.get_time_bounds(), (100, 400))
+        self.assertTrue(sv2.fully_synced)
+        self.assertTrue(sv2.is_synced())
+
+        sv3 = refresh(self.sl_en.add_version(
+            subtitles=[(100, 200, "a"), (300, None, "b")]))
+        self.assertEqual(sv3.get_time_bounds(), (100, 300))
+        self.assertFalse(sv3.fully_synced)
+        self.assertFalse(sv3.is_synced())
+
+        # Versions written before the fields existed are parsed on demand.
+        SubtitleVersion.objects.full().filter(pk=sv2.pk).update(
+            start_time=None, end_time=None, fully_synced=None)
+        sv2 = refresh(sv2)
+        self.assertEqual(sv2.get_time_bounds(), (100, 400))
+        self.assertTrue(sv2.is_synced())
+
     def test_sibling_set(self):
         def _assert_siblings(sv, *vns):
             siblings = sv.sibling_set.full().order_by('version_number')
@@ -1878,3 +2006,55 @@ class TestSubtitleMetadata(TestCase):
 
         self.assertEqual(version.get_approved_by(), None,
             "Versions should not inherit approved_by metadata.")
+
+
+class TestLanguageStatus(TestCase):
+    def setUp(self):
+        self.video = make_video()
+
+    def _status(self):
+        statuses = language_status.get_language_status(self.video)
+        return dict((s['language_code'], s) for s in statuses)
+
+    def test_matches_language_methods(self):
+        pipeline.add_subtitles(self.video, 'en', [(100, 200, 'foo'),
+                                                  (300, 400, 'bar')])
+        pipeline.add_subtitles(self.video, 'fr', [(100, 200, 'le foo'),
+                                                  (None, None, 'le bar')],
+                               parents=[('en', 1)], visibility='private')
+        pipeline.add_subtitles(self.video, 'de', None)
+
+        statuses = self._status()
+        for sl in self.video.newsubtitlelanguage_set.all():
+            status = statuses[sl.language_code]
+            tip = sl.get_tip()
+            source = sl.get_translation_source_language()
+
+            self.assertEqual(status['pk'], sl.pk)
+            self.assertEqual(status['subtitle_count'], sl.get_subtitle_count())
+            self.assertEqual(status['is_synced'], tip.is_synced())
+            self.assertEqual(status['has_public_version'],
+                             sl.has_public_version())
+            self.assertEqual(status['translation_source_pk'],
+                             source.pk if source else None)
+
+        self.assertEqual(statuses['fr']['translation_source_code'], 'en')
+        self.assertFalse(statuses['de']['has_nonempty_versions'])
+        self.assertTrue(statuses['en']['has_nonempty_versions'])
+
+    def test_refreshed_on_save(self):
+        pipeline.add_subtitles(self.video, 'en', [(100, 200, 'foo')])
+        self.assertFalse(self._status()['en']['subtitles_complete'])
+
+        sl = self.video.newsubtitlelanguage_set.get(language_code='en')
+        sl.subtitles_complete = True
+        sl.save()
+        self.assertTrue(self._status()['en']['subtitles_complete'])
+
+        tip = sl.get_tip()
+        tip.visibility_override = 'private'
+        tip.save()
+        self.assertFalse(self._status()['en']['has_public_version'])
+
+        sl.delete()
+        self.assertEqual(self._status(), {})
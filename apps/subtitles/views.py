@@ -44,7 +44,7 @@ def _version_data(version):
     '''
     return {
         'number': version.version_number,
-        'subtitlesXML': version.get_subtitles().to_xml(),
+        'subtitlesXML': version.get_subtitles_xml(),
         'title': version.title,
         'description': version.description,
     }
@@ -69,6 +69,7 @@ logger = logging.getLogger(__name__)
 celery_logger = logging.getLogger('celery.task')
 
 BILLING_CUTOFF = getattr(settings, 'BILLING_CUTOFF', None)
+BILLING_REPORT_CHUNK_SIZE = getattr(settings, 'BILLING_REPORT_CHUNK_SIZE', 100)
 ALL_LANGUAGES = [(val, _(name))for val, name in settings.ALL_LANGUAGES]
 VALID_LANGUAGE_CODES = [unicode(x[0]) for x in ALL_LANGUAGES]
 
@@ -314,15 +315,15 @@ class Team(models.Model):
 
         If no role is given, simply return whether the user is a member of this team at all.
 
-        TODO: Change this to use the stuff in teams.permissions.
-
         """
+        from teams.permissions import get_member
+
         if not user or not user.is_authenticated():
             return False
-        qs = self.members.filter(user=user)
-        if role:
-            qs = qs.filter(role=role)
-        return qs.exists()
+        member = get_member(user, self)
+        if not member:
+            return False
+        return not role or member.role == role
 
     def is_owner(self, user):
         """
@@ -757,6 +758,7 @@ class TeamVideo(models.Model):
         video = self.video
 
         video.newsubtitleversion_set.extant().update(visibility='public')
+        NewSubtitleLanguage.objects.update_tips(video)
         video.is_public = new_team.is_visible
         video.moderated_by = new_team if new_team.moderates_videos() else None
         video.save()
@@ -808,7 +810,7 @@ def _create_translation_tasks(team_video, subtitle_version=None):
         # wasted tasks
         task.save(update_team_video_index=False)
 
-    update_one_team_video.delay(team_video.pk)
+    update_one_team_video(team_video.pk)
 
 def autocreate_tasks(team_video):
     workflow = Workflow.get_for_team_video(team_video)
@@ -842,7 +844,7 @@ def team_video_save(sender, instance, created, **kwargs):
     TODO: Rename this to something more specific.
 
     """
-    update_one_team_video.delay(instance.id)
+    update_one_team_video(instance.id)
 
 def team_video_delete(sender, instance, **kwargs):
     """Perform necessary actions for when a TeamVideo is deleted.
@@ -862,6 +864,7 @@ def team_video_delete(sender, instance, **kwargs):
         # we need to publish all unpublished subs for this video:
         NewSubtitleVersion.objects.filter(video=video,
                 visibility='private').update(visibility='public')
+        NewSubtitleLanguage.objects.update_tips(video)
 
         video.is_public = True
         video.moderated_by = None
@@ -2125,7 +2128,7 @@ class Task(models.Model):
         result = super(Task, self).save(*args, **kwargs)
 
         if update_team_video_index:
-            update_one_team_video.delay(self.team_video.pk)
+            update_one_team_video(self.team_video.pk)
 
         return result
 
@@ -2419,7 +2422,14 @@ class TeamNotificationSetting(models.Model):
             logger.exception("Apparently unisubs-integration is not installed")
 
     def notify(self, event_name,  **kwargs):
-        """Resolve the notification class for this setting and fires notfications."""
+        """Resolve the notification class for this setting and fires notfications.
+
+        The http request is queued and delivered by the deliver_webhooks task
+        (see teams.webhooks), so there is nothing to return.  Notification
+        classes with their own transport (they override send_http_request,
+        like some from unisubs-integration do) are still called right away.
+
+        """
         notification_class = self.get_notification_class()
 
         if not notification_class:
@@ -2430,12 +2440,21 @@ class TeamNotificationSetting(models.Model):
                 event_name,  **kwargs)
 
         if self.request_url:
-            success, content = notification.send_http_request(
+            from teams import notifications, webhooks
+            if notifications.has_custom_transport(notification):
+                notification.send_http_request(
+                    self.request_url,
+                    self.basic_auth_username,
+                    self.basic_auth_password
+                )
+                return
+
+            webhooks.queue_delivery(self.pk, notification.build_http_request(
                 self.request_url,
                 self.basic_auth_username,
                 self.basic_auth_password
-            )
-            return success, content
+            ))
+            return
         # FIXME: spec and test this, for now just return
         return
 
@@ -2485,7 +2504,7 @@ class BillingReport(models.Model):
         # complete
         tv = version.video.get_team_video()
         if not tv or tv.team.is_moderated:
-            if language.in_progress():
+            if language.in_progress(self._get_tip(language)):
                 return False
 
         if (version.created <= start or
@@ -2494,8 +2513,84 @@ class BillingReport(models.Model):
 
         return True
 
-    def _get_lang_data(self, languages, from_date, team):
-        workflow = team.get_workflow()
+    # The report walks team videos in chunks.  For every chunk the languages
+    # and the handful of versions billing looks at (first, tip and first
+    # public) are fetched with a few grouped queries and stashed on the
+    # language objects; the helpers below fall back to querying when they
+    # aren't there.
+    def _get_first_version(self, language):
+        if hasattr(language, '_billing_first_version'):
+            return language._billing_first_version
+        try:
+            return language.subtitleversion_set.order_by('version_number')[0]
+        except IndexError:
+            return None
+
+    def _get_tip(self, language):
+        if hasattr(language, '_billing_tip'):
+            return language._billing_tip
+        return language.get_tip()
+
+    def _get_first_public_version(self, language):
+        if hasattr(language, '_billing_first_public_version'):
+            return language._billing_first_public_version
+        return language.first_public_version()
+
+    def _prefetch_languages(self, team_videos):
+        """Return a dict of video pk -> languages, with their versions attached."""
+        videos = dict((tv.video_id, tv.video) for tv in team_videos)
+        languages = list(NewSubtitleLanguage.objects.filter(
+            video__in=videos.keys()))
+
+        first, tip, first_public = {}, {}, {}
+        rows = (NewSubtitleVersion.objects.full()
+                                          .filter(subtitle_language__in=languages)
+                                          .values_list('pk', 'subtitle_language',
+                                                       'version_number',
+                                                       'visibility',
+                                                       'visibility_override'))
+        for pk, language_id, number, visibility, override in rows:
+            item = (number, pk)
+            if language_id not in first or item < first[language_id]:
+                first[language_id] = item
+            if override != 'deleted':
+                if language_id not in tip or item > tip[language_id]:
+                    tip[language_id] = item
+            is_public = (override == 'public' or
+                         (override == '' and visibility == 'public'))
+            if is_public:
+                if (language_id not in first_public or
+                        item < first_public[language_id]):
+                    first_public[language_id] = item
+
+        pks = set(pk for d in (first, tip, first_public)
+                  for number, pk in d.values())
+        versions = (NewSubtitleVersion.objects.full()
+                                              .defer('serialized_subtitles')
+                                              .in_bulk(pks))
+
+        def _version(d, language):
+            if language.pk not in d:
+                return None
+            version = versions[d[language.pk][1]]
+            version.subtitle_language = language
+            version.video = language.video
+            return version
+
+        by_video = {}
+        for language in languages:
+            language.video = videos[language.video_id]
+            language._billing_first_version = _version(first, language)
+            language._billing_tip = _version(tip, language)
+            language._billing_first_public_version = _version(first_public,
+                                                              language)
+            by_video.setdefault(language.video_id, []).append(language)
+
+        return by_video
+
+    def _get_lang_data(self, languages, from_date, team, workflow=None):
+        if workflow is None:
+            workflow = team.get_workflow()
 
         # TODO:
         # These do the same for now.  If a workflow is enabled, we should get
@@ -2505,14 +2600,14 @@ class BillingReport(models.Model):
         # TODO: Are we going to count deleted versions here?  If so, the
         # get_tip() calls here may need full=True to get deleted tips...
         if workflow.approve_enabled:
-            imported_data = [(language, language.first_public_version())
+            imported_data = [(language, self._get_first_public_version(language))
                              for language in imported]
-            crowd_created_data = [(language, language.first_public_version())
+            crowd_created_data = [(language, self._get_first_public_version(language))
                                   for language in crowd_created]
         else:
-            imported_data = [(language, language.get_tip()) for
+            imported_data = [(language, self._get_tip(language)) for
                              language in imported]
-            crowd_created_data = [(language, language.get_tip()) for
+            crowd_created_data = [(language, self._get_tip(language)) for
                                   language in crowd_created]
 
         old_version_counter = 1
@@ -2548,9 +2643,8 @@ class BillingReport(models.Model):
         crowd_created = set()
 
         for lang in languages:
-            try:
-                v = lang.subtitleversion_set.order_by('version_number')[0]
-            except IndexError:
+            v = self._get_first_version(lang)
+            if not v:
                 # Throw away languages that don't have a zero version.
                 continue
 
@@ -2566,37 +2660,51 @@ class BillingReport(models.Model):
 
         return imported, crowd_created
 
-    def _get_row_data(self, host, header=None):
-        if not header:
-            header = []
+    def _iter_row_data(self, host, header=None):
+        """Yield the report rows, team video by team video.
+
+        Only BILLING_REPORT_CHUNK_SIZE team videos (and their languages and
+        versions) are in memory at any time.
 
-        rows = [header]
+        """
+        if header:
+            yield header
 
         start_date = self.start_datetime()
         end_date = self.end_datetime()
 
         for team in self.teams.all():
-            tvs = TeamVideo.objects.filter(team=team).order_by('video__title')
-
-            for tv in tvs:
-                languages = tv.video.newsubtitlelanguage_set.all()
-
-                created_data, imported_data, old_version_counter = \
-                        self._get_lang_data(languages, start_date, team)
-
-                created_rows = self._loop(created_data, 'created', start_date,
-                        end_date, tv, host, old_version_counter)
-
-                imported_rows = self._loop(imported_data, 'imported', start_date,
-                        end_date, tv, host)
-
-                rows = rows + created_rows + imported_rows
-
-        return rows
+            workflow = team.get_workflow()
+            tv_pks = list(TeamVideo.objects.filter(team=team)
+                                           .order_by('video__title')
+                                           .values_list('pk', flat=True))
+
+            for i in xrange(0, len(tv_pks), BILLING_REPORT_CHUNK_SIZE):
+                chunk = tv_pks[i:i + BILLING_REPORT_CHUNK_SIZE]
+                tvs = (TeamVideo.objects.filter(pk__in=chunk)
+                                        .select_related('video', 'team'))
+                tvs = dict((tv.pk, tv) for tv in tvs)
+                languages = self._prefetch_languages(tvs.values())
+
+                for pk in chunk:
+                    tv = tvs.get(pk)
+                    if tv is None:
+                        # deleted while the report was running
+                        continue
+
+                    created_data, imported_data, old_version_counter = \
+                            self._get_lang_data(languages.get(tv.video_id, []),
+                                                start_date, team, workflow)
+
+                    for row in self._loop(created_data, 'created', start_date,
+                            end_date, tv, host, old_version_counter):
+                        yield row
+
+                    for row in self._loop(imported_data, 'imported',
+                            start_date, end_date, tv, host):
+                        yield row
 
     def _loop(self, iterable, source, start, end, tv, host, counter=None):
-        rows = []
-
         for language, v in iterable:
 
             if not self._should_bill(language, v, start, end):
@@ -2607,29 +2715,18 @@ class BillingReport(models.Model):
             if not row:
                 continue
 
-            rows.append(row)
+            yield row
 
             if counter is not None:
                 counter += 1
 
-        return rows
-
     def _prepare_row(self, tv, language, version, source, counter, host):
-        subs = version.get_subtitles()
+        bounds = version.get_time_bounds()
 
-        if len(subs) == 0:
+        if not bounds:
             return None
 
-        start = subs[0].start_time
-        end = subs[-1].end_time
-
-        # The -1 value for the end_time isn't allowed anymore but some
-        # legacy data will still have it.
-        if end == -1:
-            end = subs[-1].start_time
-
-        if not end:
-            end = subs[-1].start_time
+        start, end = bounds
 
         return [
             tv.video.title_display_unabridged().encode('utf-8'),
@@ -2652,27 +2749,35 @@ class BillingReport(models.Model):
                 'Team'
         ]
 
-        return  self._get_row_data(host, header)
+        return self._iter_row_data(host, header)
+
+    def generate_rows_type_new(self):
+        for i, team in enumerate(self.teams.all()):
+            for row in BillingRecord.objects.iter_csv_report_for_team(
+                    team, self.start_date, self.end_date, add_header=i == 0):
+                yield row
+
     def process(self):
         """
         Generate the correct rows (including headers), saves it to a tempo file,
         then set's that file to the csv_file property, which if , using the S3
         storage will take care of exporting it to s3.
+
+        Rows are written as they are generated, so the report is never held
+        in memory as a whole.
         """
         if self.type == BillingReport.TYPE_OLD:
             rows = self.generate_rows_type_old()
         elif self.type == BillingReport.TYPE_NEW:
-            rows = []
-            for i,team in enumerate(self.teams.all()):
-                rows = rows + BillingRecord.objects.csv_report_for_team(team,
-                    self.start_date, self.end_date, add_header=i == 0)
+            rows = self.generate_rows_type_new()
         fn = '/tmp/bill-%s-%s-%s-%s-%s.csv' % ("-".join([x.slug for x in self.teams.all()]),
                                                self.start_str, self.end_str,
                                                self.get_type_display(), self.pk)
 
         with open(fn, 'w') as f:
             writer = csv.writer(f)
-            writer.writerows(rows)
+            for row in rows:
+                writer.writerow(row)
 
         self.csv_file = File(open(fn, 'r'))
         self.processed = datetime.datetime.utcnow()
@@ -2692,6 +2797,10 @@ class BillingRecordManager(models.Manager):
         return self.filter(team=team, created__gte=start, created__lte=end)
 
     def csv_report_for_team(self, team, start, end, add_header=True):
+        return list(self.iter_csv_report_for_team(team, start, end,
+                                                  add_header))
+
+    def iter_csv_report_for_team(self, team, start, end, add_header=True):
 
         header = [
             'Video Title',
@@ -2706,14 +2815,15 @@ class BillingRecordManager(models.Manager):
         ]
 
         if add_header:
-            rows = [header]
-        else:
-            rows = []
+            yield header
 
-        all_records = self.data_for_team(team, start, end)
+        all_records = (self.data_for_team(team, start, end)
+                           .select_related('video', 'new_subtitle_language',
+                                           'team', 'user')
+                           .iterator())
         for video, records in groupby(all_records, lambda r: r.video):
             for r in records:
-                rows.append([
+                yield [
                     video.title_display_unabridged().encode('utf-8'),
                     video.video_id,
                     r.new_subtitle_language.language_code,
@@ -2723,9 +2833,7 @@ class BillingRecordManager(models.Manager):
                     r.created.strftime('%Y-%m-%d %H:%M:%S'),
                     r.source,
                     r.user.username
-                ])
-
-        return rows
+                ]
 
     def insert_records_for_translations(self, billing_record):
         """
@@ -2848,21 +2956,12 @@ class BillingRecord(models.Model):
         Return the number of minutes the subtitles specified in `version`
         cover as an int.
         """
-        subs = self.new_subtitle_version.get_subtitles()
+        bounds = self.new_subtitle_version.get_time_bounds()
 
-        if len(subs) == 0:
+        if not bounds:
             return 0
 
-        start = subs[0].start_time
-        end = subs[-1].end_time
-
-        # The -1 value for the end_time isn't allowed anymore but some
-        # legacy data will still have it.
-        if end == -1:
-            end = subs[-1].star_time
-
-        if not end:
-            end = subs[-1].start_time
+        start, end = bounds
         duration_seconds =  (end - start) / 1000.0
         minutes = duration_seconds/60.0
         return  int(ceil(minutes))
@@ -16,7 +16,6 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
-from httplib2 import Http
 from urllib import urlencode
 
 from django.conf import settings
@@ -25,6 +24,7 @@ DEFAULT_PROTOCOL = getattr(settings, "DEFAULT_PROTOCOL", 'https')
 from django.contrib.sites.models import Site
 from django.utils.translation import ugettext_lazy as _
 
+from teams import webhooks
 from utils import send_templated_email
 from utils.metrics import Meter
 from unilangs import LanguageCode
@@ -41,7 +41,7 @@ class BaseNotification(object):
     from_internal_video_id
 
     Also, subclasses should implement a more specialized version of
-    'send_http_request'
+    'build_http_request' (or 'send_http_request' for a custom transport)
     'send_email'
     """
     codec = "unisubs"
@@ -139,11 +139,8 @@ class BaseNotification(object):
         if self.language:
             return  self.from_internal_lang(self.language.language_code)
 
-    def send_http_request(self, url, basic_auth_username, basic_auth_password):
-        h = Http()
-        if basic_auth_username and basic_auth_password:
-            h.add_credentials(basic_auth_username, basic_auth_password)
-
+    def build_http_request(self, url, basic_auth_username, basic_auth_password):
+        """Return the request that notifies the team, for teams.webhooks."""
         project = self.video.get_team_video().project.slug if self.video else None
         data = {
             'event': self.event_name,
@@ -161,31 +158,28 @@ class BaseNotification(object):
             data['application_id'] = self.application_pk
         if self.language_code:
             data.update({"language_code":self.language_code} )
-        data_sent = data
         data = urlencode(data)
-        url = "%s?%s" % (url , data)
-        try:
-            resp, content = h.request(url, method="POST", body=data, headers={
+        return {
+            'url': "%s?%s" % (url , data),
+            'body': data,
+            'headers': {
                 'referer': '%s://%s' % (DEFAULT_PROTOCOL, Site.objects.get_current().domain)
-            }, verify=False)
-            success = 200 <= resp.status < 400
-            if success is False:
-                logger.error("Failed to notify team %s " % (self.team),
-                     extra={
-                        'team': self.team or self.partner,
-                        'url': url,
-                        'response': resp,
-                        'content': content,
-                        'data_sent':data_sent,
-                    })
-
-                Meter('http-callback-notification-error').inc()
-            else:
-                Meter('http-callback-notification-success').inc()
-            return success, content
-        except:
-            logger.exception("Failed to send http notification ")
-        return None, None
+            },
+            'username': basic_auth_username,
+            'password': basic_auth_password,
+            'team': unicode(self.team or self.partner),
+        }
+
+    def send_http_request(self, url, basic_auth_username, basic_auth_password):
+        """Send the notification right away and return (success, content).
+
+        TeamNotificationSetting.notify queues the request built by
+        build_http_request instead, unless a subclass overrides this, see
+        has_custom_transport.
+        """
+        request = self.build_http_request(url, basic_auth_username,
+                                          basic_auth_password)
+        return webhooks.deliver(request)
 
     def send_email(self, email_to):
         Meter('templated-emails-sent-by-type.teams.team-video-activity').inc()
@@ -200,3 +194,8 @@ class BaseNotification(object):
                 }
             )
 
+
+def has_custom_transport(notification):
+    """Does the notification class send its http requests itself?"""
+    send = type(notification).send_http_request.im_func
+    return send is not BaseNotification.send_http_request.im_func
@@ -16,6 +16,9 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import operator
+
+from django.db.models import Q, signals
 from django.utils.translation import ugettext as _
 from teams.models import Team, MembershipNarrowing, Workflow, TeamMember, Task
 
@@ -72,6 +75,84 @@ def _perms_equal_or_greater(role, include_outsiders=False):
     return roles[:roles.index(role) + 1]
 
 
+# Permission context
+class TeamPermissionContext(object):
+    """All of a user's team memberships and narrowings.
+
+    They are loaded with two queries the first time they are needed, after
+    which get_member() for any team is answered from memory.  Use
+    get_permission_context() to get the one attached to a user object, which
+    lives as long as that object does (a request, or a batch in a task).
+
+    Any change to a TeamMember or MembershipNarrowing in this process makes
+    every context reload on its next use, so a context never hands out
+    memberships that were changed in the same request.
+
+    """
+    def __init__(self, user):
+        self.user = user
+        self._members = None
+        self._generation = None
+
+    def __getstate__(self):
+        # Users get pickled into the cache; don't carry memberships along.
+        return {'user': self.user, '_members': None, '_generation': None}
+
+    def _load(self):
+        # team pk -> TeamMember
+        self._members = {}
+        self._generation = _membership_generation[0]
+
+        if not self.user.is_authenticated():
+            return
+
+        members = TeamMember.objects.filter(user=self.user).select_related('team')
+        by_pk = {}
+        for member in members:
+            member._cached_narrowings = []
+            self._members[member.team_id] = member
+            by_pk[member.pk] = member
+
+        if by_pk:
+            narrowings = (MembershipNarrowing.objects
+                                             .filter(member__in=by_pk.keys())
+                                             .select_related('project'))
+            for narrowing in narrowings:
+                by_pk[narrowing.member_id]._cached_narrowings.append(narrowing)
+
+    def _get_members(self):
+        if (self._members is None or
+            self._generation != _membership_generation[0]):
+            self._load()
+        return self._members
+
+    def get_member(self, team):
+        """Return the TeamMember object (or None) for this user in team."""
+        return self._get_members().get(team.pk)
+
+    def get_members(self):
+        """Return a dict of team pk -> TeamMember for every team of the user."""
+        return dict(self._get_members())
+
+# Bumped whenever a membership or narrowing changes, see TeamPermissionContext.
+_membership_generation = [0]
+
+def _membership_changed(sender, **kwargs):
+    _membership_generation[0] += 1
+
+# No dispatch_uid here: this module is imported both as teams.permissions and
+# apps.teams.permissions, and each copy needs its own counter bumped.
+for _model in (TeamMember, MembershipNarrowing):
+    signals.post_save.connect(_membership_changed, _model)
+    signals.post_delete.connect(_membership_changed, _model)
+
+def get_permission_context(user):
+    """Return the TeamPermissionContext of the given user object."""
+    if not hasattr(user, '_team_permission_context'):
+        user._team_permission_context = TeamPermissionContext(user)
+    return user._team_permission_context
+
+
 # Utility functions
 def get_member(user, team):
     """Return the TeamMember object (or None) for the given user/team."""
@@ -79,18 +160,7 @@ def get_member(user, team):
     if not user.is_authenticated():
         return None
 
-    if hasattr(user, '_cached_teammember') and user._cached_teammember.get(team.pk):
-        return user._cached_teammember[team.pk]
-    else:
-        if not hasattr(user, '_cached_teammember'):
-            user._cached_teammember = {}
-
-        try:
-            user._cached_teammember[team.pk] = team.members.get(user=user)
-        except TeamMember.DoesNotExist:
-            user._cached_teammember[team.pk] = None
-
-        return user._cached_teammember[team.pk]
+    return get_permission_context(user).get_member(team)
 
 def get_role(member):
     """Return the member's general role in the team.
@@ -809,6 +879,180 @@ def can_delete_task(task, user):
     return can_delete and can_perform_task(user, task)
 
 
+# Task eligibility
+#
+# The functions below turn the rules of can_perform_task into queryset
+# filters, so pages that list performable tasks don't have to walk every open
+# task in Python.  The filter is exact except for the "can't review your own
+# subtitles" rule, which depends on each language's latest version, so
+# callers should still run can_perform_task on the (few) tasks they show.
+
+_SUBTITLE_POLICY_ROLES = {
+    10: ROLE_OUTSIDER,
+    20: ROLE_CONTRIBUTOR,
+    30: ROLE_MANAGER,
+    40: ROLE_ADMIN,
+}
+_REVIEW_ROLES = {
+    10: ROLE_CONTRIBUTOR,
+    20: ROLE_MANAGER,
+    30: ROLE_ADMIN,
+}
+_APPROVE_ROLES = {
+    10: ROLE_MANAGER,
+    20: ROLE_ADMIN,
+}
+
+class TeamWorkflows(object):
+    """Every Workflow of a team, resolved per team video without queries.
+
+    Mirrors Workflow.get_for_target: a video workflow beats a project one
+    (if the project has workflows enabled), which beats the team one (if the
+    team has workflows enabled).
+
+    """
+    def __init__(self, team):
+        self.team = team
+        self.default = Workflow(team=team)
+        self.videos = {}
+        self.projects = {}
+        self.team_workflow = None
+
+        for w in Workflow.objects.filter(team=team).select_related('project'):
+            if w.team_video_id:
+                self.videos[w.team_video_id] = w
+            elif w.project_id:
+                if w.project.workflow_enabled:
+                    self.projects[w.project_id] = w
+            else:
+                self.team_workflow = w
+
+        if not team.workflow_enabled or not self.team_workflow:
+            self.team_workflow = self.default
+
+    def for_team_video(self, team_video):
+        return (self.videos.get(team_video.pk) or
+                self.projects.get(team_video.project_id) or
+                self.team_workflow)
+
+    def cache_on(self, team_videos):
+        """Set _cached_workflow on team videos (see Workflow.get_for_team_video)."""
+        for team_video in team_videos:
+            team_video._cached_workflow = self.for_team_video(team_video)
+
+    def scopes(self):
+        """Yield (workflow, Q matching the tasks it applies to) pairs."""
+        video_ids = self.videos.keys()
+        project_ids = self.projects.keys()
+
+        for team_video_id, workflow in self.videos.items():
+            yield workflow, Q(team_video=team_video_id)
+
+        not_video = ~Q(team_video__in=video_ids) if video_ids else Q()
+        for project_id, workflow in self.projects.items():
+            yield workflow, Q(team_video__project=project_id) & not_video
+
+        q = not_video
+        if project_ids:
+            q &= ~Q(team_video__project__in=project_ids)
+        yield self.team_workflow, q
+
+def _role_meets(role, role_required):
+    return role in _perms_equal_or_greater(role_required,
+                                           include_outsiders=True)
+
+def _role_q(role, narrowed_role, narrowing_q, role_required):
+    """Return a Q for the targets where the user has role_required.
+
+    The user has `role` on the targets matched by narrowing_q (None meaning no
+    target) and `narrowed_role` everywhere else.  Returns None if there's no
+    target at all.
+
+    """
+    if not role_required:
+        return None
+    if _role_meets(narrowed_role, role_required):
+        return Q()
+    if narrowing_q is not None and _role_meets(role, role_required):
+        return narrowing_q
+    return None
+
+def performable_tasks_q(team, user, workflows=None):
+    """Return a Q matching the tasks of team the user can perform, or None.
+
+    workflows may be given as a TeamWorkflows to avoid loading them again.
+
+    """
+    member = get_member(user, team) if user else None
+    role = get_role(member)
+    narrowings = get_narrowings(member)
+
+    # Mirror get_role_for_target(): outside their narrowings a member only
+    # has the contributor role.
+    project_pks = [n.project_id for n in narrowings
+                   if n.project and not n.project.is_default_project]
+    has_project_narrowings = any(n.project for n in narrowings)
+    languages = [n.language for n in narrowings if n.language]
+
+    if narrowings:
+        narrowed_role = ROLE_CONTRIBUTOR
+        project_q = Q()
+        if has_project_narrowings:
+            project_q = Q(team_video__project__in=project_pks) if project_pks else None
+        language_q = project_q
+        if languages and language_q is not None:
+            language_q = language_q & Q(language__in=languages)
+        # Subtitle tasks are checked without a language, which never matches
+        # a language narrowing.
+        subtitle_q = None if languages else project_q
+    else:
+        narrowed_role = role
+        subtitle_q = language_q = Q()
+
+    if workflows is None:
+        workflows = TeamWorkflows(team)
+
+    parts = []
+
+    q = _role_q(role, narrowed_role, subtitle_q,
+                _SUBTITLE_POLICY_ROLES[team.subtitle_policy])
+    if q is not None:
+        parts.append(Q(type=Task.TYPE_IDS['Subtitle']) & q)
+
+    q = _role_q(role, narrowed_role, language_q,
+                _SUBTITLE_POLICY_ROLES[team.translate_policy])
+    if q is not None:
+        parts.append(Q(type=Task.TYPE_IDS['Translate']) & q)
+
+    for workflow, scope_q in workflows.scopes():
+        q = _role_q(role, narrowed_role, language_q,
+                    _REVIEW_ROLES.get(workflow.review_allowed))
+        if q is not None:
+            parts.append(Q(type=Task.TYPE_IDS['Review']) & scope_q & q)
+
+        q = _role_q(role, narrowed_role, language_q,
+                    _APPROVE_ROLES.get(workflow.approve_allowed))
+        if q is not None:
+            parts.append(Q(type=Task.TYPE_IDS['Approve']) & scope_q & q)
+
+    # See the assignee special case in can_perform_task().
+    if user:
+        parts.append(Q(type__in=[Task.TYPE_IDS['Review'],
+                                 Task.TYPE_IDS['Approve']],
+                       assignee=user))
+
+    if not parts:
+        return None
+    return reduce(operator.or_, parts)
+
+def filter_performable_tasks(tasks, team, user, workflows=None):
+    """Narrow a Task queryset of team down to the ones user can perform."""
+    q = performable_tasks_q(team, user, workflows)
+    if q is None:
+        return tasks.none()
+    return tasks.filter(q)
+
+
 def _user_can_create_task_subtitle(user, team_video):
     role = get_role_for_target(user, team_video.team, team_video.project, None)
 
@@ -26,7 +26,9 @@ from haystack.indexes import (
 )
 from haystack.query import SearchQuerySet
 from teams import models
-from apps.subtitles.models import SubtitleLanguage
+from apps.subtitles.models import SubtitleLanguage, SubtitleVersion
+from utils.celery_search_index import BatchPrepareMixin
+from videos.models import VideoUrl
 
 from haystack.exceptions import AlreadyRegistered
 
@@ -34,7 +36,7 @@ from haystack.exceptions import AlreadyRegistered
 LANGUAGES_DICT = dict(settings.ALL_LANGUAGES)
 
 
-class TeamVideoLanguagesIndex(SearchIndex):
+class TeamVideoLanguagesIndex(BatchPrepareMixin, SearchIndex):
     text = CharField(
         document=True, use_template=True,
         template_name="teams/teamvideo_languages_for_search.txt")
@@ -86,16 +88,85 @@ class TeamVideoLanguagesIndex(SearchIndex):
     # * Fully translated, if a translation
     num_completed_langs = IntegerField()
 
+    def index_queryset(self):
+        return self.model._default_manager.select_related(
+            'team', 'video', 'project')
+
+    def _prefetch(self, team_videos):
+        """Gather the languages, tips, tasks and urls for many team videos.
+
+        Returns a dict of team video pk -> dict of prepared values, built from
+        a fixed number of grouped queries.
+
+        """
+        video_pks = [tv.video_id for tv in team_videos]
+        primary_codes = dict((tv.video_id, tv.video.primary_audio_language_code)
+                             for tv in team_videos)
+
+        languages = list(SubtitleLanguage.objects.filter(video__in=video_pks)
+                                                 .select_related('video'))
+        original_languages = dict((sl.video_id, sl) for sl in languages
+                                  if sl.language_code == primary_codes[sl.video_id])
+
+        extant_tips = SubtitleVersion.objects.tips(
+            [sl.pk for sl in languages], defer_subtitles=True)
+        # completeness needs the subtitles of the public tips, the title only
+        # the version of the original language
+        public_tips = SubtitleVersion.objects.tips(
+            [sl.pk for sl in languages if sl.subtitles_complete] +
+            [sl.pk for sl in original_languages.values()], public=True)
+
+        task_counts = dict(models.Task.objects.incomplete()
+                                              .filter(team_video__in=team_videos)
+                                              .values('team_video')
+                                              .annotate(n=Count('id'))
+                                              .values_list('team_video', 'n'))
+
+        video_urls = {}
+        for vurl in VideoUrl.objects.filter(video__in=video_pks, primary=True):
+            video_urls.setdefault(vurl.video_id, vurl.effective_url)
+
+        languages_by_video = {}
+        for sl in languages:
+            languages_by_video.setdefault(sl.video_id, []).append(sl)
+
+        data = {}
+
+        for tv in team_videos:
+            video_languages = languages_by_video.get(tv.video_id, [])
+            original_sl = original_languages.get(tv.video_id)
+            completed_sls = [
+                sl for sl in video_languages
+                if sl.subtitles_complete and sl.pk in public_tips
+                and public_tips[sl.pk].get_subtitles().fully_synced]
+            nonempty_tip_sls = [
+                sl for sl in video_languages
+                if sl.pk in extant_tips and extant_tips[sl.pk].subtitle_count > 0]
+
+            data[tv.pk] = {
+                'original_sl': original_sl,
+                'latest_version': public_tips.get(original_sl.pk) if original_sl else None,
+                'completed_sls': completed_sls,
+                'num_total_langs': len(nonempty_tip_sls),
+                'task_count': task_counts.get(tv.pk, 0),
+                'video_url': video_urls.get(tv.video_id),
+            }
+
+        return data
+
     def prepare(self, obj):
         self.prepared_data = super(TeamVideoLanguagesIndex, self).prepare(obj)
+
+        data = self.get_prefetched(obj)
+
         self.prepared_data['team_id'] = obj.team.id
         self.prepared_data['team_video_pk'] = obj.id
         self.prepared_data['video_pk'] = obj.video.id
         self.prepared_data['video_id'] = obj.video.video_id
         self.prepared_data['video_title'] = obj.video.title.strip()
-        self.prepared_data['video_url'] = obj.video.get_video_url()
+        self.prepared_data['video_url'] = data['video_url']
 
-        original_sl = obj.video.subtitle_language()
+        original_sl = data['original_sl']
 
         if original_sl:
             self.prepared_data['original_language_display'] = original_sl.get_language_code_display
@@ -106,7 +177,8 @@ class TeamVideoLanguagesIndex(SearchIndex):
 
         self.prepared_data['absolute_url'] = obj.get_absolute_url()
         self.prepared_data['thumbnail'] = obj.get_thumbnail()
-        self.prepared_data['title'] = obj.video.title_display_unabridged()
+        self.prepared_data['title'] = obj.video.title_display(
+            truncate=False, latest_version=data['latest_version'])
         self.prepared_data['description'] = obj.description
         self.prepared_data['is_complete'] = obj.video.complete_date is not None
         self.prepared_data['video_complete_date'] = obj.video.complete_date
@@ -115,10 +187,9 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['project_slug'] = obj.project.slug
         self.prepared_data['team_video_create_date'] = obj.created
 
-        completed_sls = obj.video.completed_subtitle_languages()
-        all_sls = obj.video.newsubtitlelanguage_set.having_nonempty_tip()
+        completed_sls = data['completed_sls']
 
-        self.prepared_data['num_total_langs'] = len(all_sls)
+        self.prepared_data['num_total_langs'] = data['num_total_langs']
         self.prepared_data['num_completed_langs'] = len(completed_sls)
 
         self.prepared_data['video_completed_langs'] = \
@@ -126,12 +197,10 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['video_completed_lang_urls'] = \
             [sl.get_absolute_url() for sl in completed_sls]
 
-        self.prepared_data['task_count'] = models.Task.objects.incomplete().filter(team_video=obj).count()
-
-        team_video = obj.video.get_team_video()
+        self.prepared_data['task_count'] = data['task_count']
 
-        self.prepared_data['is_public'] =  team_video.team.is_visible 
-        self.prepared_data["owned_by_team_id"] = team_video.team.id if team_video else None
+        self.prepared_data['is_public'] = obj.team.is_visible
+        self.prepared_data["owned_by_team_id"] = obj.team.id
 
         return self.prepared_data
 
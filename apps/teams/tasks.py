@@ -10,9 +10,9 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
-from haystack import site
 
 from utils import send_templated_email
+from utils.celery_search_index import queue_search_index_update
 from utils.metrics import Gauge, Meter
 from widget.video_cache import (
     invalidate_cache as invalidate_video_cache,
@@ -130,16 +130,13 @@ def add_videos_notification(*args, **kwargs):
 
 @task()
 def update_one_team_video(team_video_id):
-    """Update the Solr index for the given team video."""
-    from teams.models import TeamVideo
-    try:
-        team_video = TeamVideo.objects.get(id=team_video_id)
-    except TeamVideo.DoesNotExist:
-        return
+    """Queue the given team video for the next batched Solr update.
+
+    This is cheap, so call it directly rather than through delay().
 
-    tv_search_index = site.get_index(TeamVideo)
-    tv_search_index.backend.update(
-        tv_search_index, [team_video])
+    """
+    from teams.models import TeamVideo
+    queue_search_index_update(TeamVideo, team_video_id)
 
 
 @task()
@@ -171,6 +168,20 @@ def api_notify_on_application_activity(team_pk, event_name, application_pk):
         team_pk, event_name, application_pk=application_pk)
 
 
+@task()
+def deliver_webhooks(setting_pk):
+    """Send the http notifications queued for a TeamNotificationSetting."""
+    from teams import webhooks
+    webhooks.deliver_pending(setting_pk)
+
+@periodic_task(run_every=timedelta(seconds=30))
+def retry_webhooks():
+    """Resend the failed http notifications that are due for a retry."""
+    from teams import webhooks
+    webhooks.retry_due()
+    webhooks.deliver_stale_pending()
+
+
 @periodic_task(run_every=timedelta(seconds=5))
 def gauge_teams():
     from teams.models import Task, Team, TeamMember
@@ -50,7 +50,8 @@ from apps.teams.permissions import (
 from apps.teams.permissions import (
     can_invite, can_add_video_somewhere,
     can_create_tasks, can_create_task_subtitle, can_create_task_translate,
-    can_create_and_edit_subtitles, can_create_and_edit_translations
+    can_create_and_edit_subtitles, can_create_and_edit_translations,
+    get_member
 )
 
 from haystack import site
@@ -126,20 +127,11 @@ def is_team_member(team, user):
     if not user.is_authenticated():
         return False
 
-    # We cache this here because we need to use it all over the place and
-    # there's no point in making 3+ queries to the DB when one will do.
-    if not hasattr(user, '_cached_teammember_status'):
-        user._cached_teammember_status = {}
-
-    if team.pk not in user._cached_teammember_status:
-        user._cached_teammember_status[team.pk] = team.is_member(user)
-
-    return user._cached_teammember_status[team.pk]
+    return team.is_member(user)
 
 @register.filter
 def user_role(team, user):
-    member = TeamMember.objects.get(team=team,user=user)
-    return member.role
+    return get_member(user, team).role
 
 @register.filter
 def user_tasks_count(team, user):
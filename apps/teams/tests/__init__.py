@@ -4,3 +4,4 @@ from apps.teams.tests.members import *
 from apps.teams.tests.tasks import *
 from apps.teams.tests.test_views import *
 from apps.teams.tests.billing import *
+from apps.teams.tests.webhooks import *
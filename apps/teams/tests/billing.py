@@ -124,6 +124,30 @@ class BillingTest(TestCase):
         self.assertTrue(sl_es.pk in imported_pks)
         self.assertTrue(sl_cs.pk in imported_pks)
 
+    def test_prefetched_versions(self):
+        english = make_subtitle_language(self.video, 'en')
+        for i in range(1, 4):
+            add_subtitles(self.video, english.language_code, [],
+                          created=datetime(2012, 1, i, 0, 0, 0),
+                          visibility='private')
+        SubtitleVersion.objects.get(subtitle_language=english,
+                                    version_number=2).publish()
+        make_subtitle_language(self.video, 'fr')
+
+        b = BillingReport.objects.create(start_date=date(2012, 1, 1),
+                                         end_date=date(2012, 1, 2))
+        tv = self.video.get_team_video()
+        languages = b._prefetch_languages([tv])[self.video.pk]
+        self.assertEquals(len(languages), 2)
+
+        for language in languages:
+            versions = list(language.subtitleversion_set.order_by('version_number'))
+            self.assertEquals(b._get_first_version(language),
+                              versions[0] if versions else None)
+            self.assertEquals(b._get_tip(language), language.get_tip())
+            self.assertEquals(b._get_first_public_version(language),
+                              language.first_public_version())
+
     def test_record_insertion(self):
 
         BillingRecord.objects.all().delete()
@@ -36,7 +36,9 @@ from apps.teams.permissions import (
     can_create_task_translate, can_join_team, can_edit_video, can_approve,
     roles_user_can_invite, can_add_video_somewhere, can_assign_tasks,
     can_create_and_edit_translations, save_role, can_remove_video,
-    can_delete_team, can_delete_video
+    can_delete_team, can_delete_video, get_member, get_role,
+    get_role_for_target, can_perform_task, filter_performable_tasks,
+    add_narrowing_to_member
 )
 
 
@@ -983,3 +985,69 @@ class TestViews(BaseTestPermission):
         resp = self.client.get(video_url, follow=True)
         self.assertEqual(resp.status_code, 200)
 
+
+
+class TestPermissionContext(BaseTestPermission):
+    def test_memberships_loaded_once(self):
+        user, team = self.user, self.team
+
+        with self.role(ROLE_ADMIN, self.test_project):
+            # one query for the memberships and one for the narrowings
+            with self.assertNumQueries(2):
+                for i in xrange(5):
+                    self.assertEqual(get_role_for_target(user, team),
+                                     ROLE_CONTRIBUTOR)
+                    self.assertTrue(team.is_admin(user))
+                    self.assertEqual(
+                        get_role_for_target(user, team, self.test_project),
+                        ROLE_ADMIN)
+
+    def test_membership_changes_reload(self):
+        user, team = self.user, self.team
+
+        self.assertEqual(get_member(user, team), None)
+        with self.role(ROLE_MANAGER):
+            self.assertEqual(get_role(get_member(user, team)), ROLE_MANAGER)
+            self.assertTrue(team.is_member(user))
+        self.assertEqual(get_member(user, team), None)
+        self.assertFalse(team.is_member(user))
+
+    def test_performable_tasks_filter(self):
+        user, team = self.user, self.team
+
+        team.workflow_enabled = True
+        team.save()
+        workflow = Workflow.get_for_team_video(self.nonproject_video)
+        workflow.review_allowed = Workflow.REVIEW_IDS['Manager must review']
+        workflow.approve_allowed = Workflow.APPROVE_IDS['Admin must approve']
+        workflow.save()
+
+        tasks = []
+        for team_video in (self.nonproject_video, self.project_video):
+            tasks.append(Task.objects.create(
+                type=Task.TYPE_IDS['Subtitle'], team=team,
+                team_video=team_video))
+            for type in ('Translate', 'Review', 'Approve'):
+                for language in ('fr', 'de'):
+                    tasks.append(Task.objects.create(
+                        type=Task.TYPE_IDS[type], team=team,
+                        team_video=team_video, language=language))
+
+        def _assert_filter_matches():
+            for task in tasks:
+                task.team_video = TeamVideo.objects.get(pk=task.team_video_id)
+            expected = set(t.pk for t in tasks if can_perform_task(user, t))
+            found = filter_performable_tasks(Task.objects.all(), team, user)
+            self.assertEqual(set(t.pk for t in found), expected)
+
+        _assert_filter_matches()
+        for r in [ROLE_CONTRIBUTOR, ROLE_MANAGER, ROLE_ADMIN, ROLE_OWNER]:
+            with self.role(r):
+                _assert_filter_matches()
+            with self.role(r, self.test_project):
+                _assert_filter_matches()
+
+        with self.role(ROLE_ADMIN):
+            member = get_member(user, team)
+            add_narrowing_to_member(member, language='fr')
+            _assert_filter_matches()
@@ -194,7 +194,7 @@ class TeamVideoTest(TestCase):
         }
 
         response = self.client.post(url, data, follow=True)
-        test_utils.update_search_index.run_original()
+        test_utils.update_search_index(Video, TeamVideo)
         self.failUnlessEqual(response.status_code, 200)
         self.assertFalse(Team.objects.get(id=1).is_visible)
 
@@ -207,7 +207,7 @@ class TeamVideoTest(TestCase):
         data['is_visible'] = u'1'
 
         response = self.client.post(url, data, follow=True)
-        test_utils.update_search_index.run_original()
+        test_utils.update_search_index(Video, TeamVideo)
         self.failUnlessEqual(response.status_code, 200)
         self.assertTrue(Team.objects.get(id=1).is_visible)
 
@@ -348,7 +348,7 @@ class TeamsTest(TestCase):
             }
 
     def _tv_search_record_list(self, team):
-        test_utils.update_team_video.run_original()
+        test_utils.update_search_index(TeamVideo)
         url = reverse("teams:detail", kwargs={"slug": team.slug})
         response = self.client.get(url)
         return response.context['team_video_md_list']
@@ -837,7 +837,7 @@ class TeamsTest(TestCase):
 
         team_video, _ = TeamVideo.objects.get_or_create(video=video, team=team,
                                                         added_by=self.user)
-        test_utils.update_team_video.run_original()
+        test_utils.update_search_index(TeamVideo)
         url = reverse("teams:detail", kwargs={"slug": team.slug})
         response = self.client.get(url + u"?q=" + title)
         videos = response.context['team_video_md_list']
@@ -1628,3 +1628,30 @@ class PartnerTest(TestCase):
 
         br = BillingRecord.objects.all()[0]
         self.assertEquals(br.minutes, 1)
+
+class TeamVideoLanguagesIndexTest(TestCase):
+    def setUp(self):
+        from teams.search_indexes import TeamVideoLanguagesIndex
+        self.index = TeamVideoLanguagesIndex(TeamVideo)
+        user = test_factories.create_user()
+        team = test_factories.create_team()
+        self.team_videos = [test_factories.create_team_video(team, user)
+                            for i in xrange(3)]
+        subs = [(0, 1000, 'Hello'), (1000, 2000, 'world')]
+        add_subtitles(self.team_videos[0].video, 'en', subs, complete=True)
+        add_subtitles(self.team_videos[0].video, 'fr', subs)
+        add_subtitles(self.team_videos[1].video, 'de', subs, complete=True)
+
+    def test_prepare_batch(self):
+        one_by_one = [self.index.prepare(tv) for tv in self.team_videos]
+
+        self.index.prepare_batch(self.team_videos)
+        batched = [self.index.prepare(tv) for tv in self.team_videos]
+
+        self.assertEquals(batched, one_by_one)
+        self.assertEquals(self.index._prefetched, {})
+
+    def test_clear_prefetched(self):
+        self.index.prepare_batch(self.team_videos)
+        self.index.clear_prefetched()
+        self.assertEquals(self.index._prefetched, {})
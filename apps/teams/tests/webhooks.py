@@ -0,0 +1,149 @@
+import socket
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from urlparse import parse_qs
+
+import mock
+from django.test import TestCase
+
+from teams import notifications, webhooks
+from utils.redis_utils import default_connection
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        self.server.received.append({
+            'path': self.path,
+            'body': parse_qs(body),
+            'client_port': self.client_address[1],
+            'authorization': self.headers.get('authorization'),
+        })
+        content = 'ok'
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(HTTPServer):
+    """Local HTTP server that records the notifications it gets."""
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.received = []
+        self.status = 200
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/notify' % self.server_port
+
+class WebhookDeliveryTest(TestCase):
+    SETTING_PK = 'test'
+
+    def setUp(self):
+        self.server = StubServer()
+        self._clear_redis()
+        # pretend a delivery is already scheduled so we control when it runs
+        default_connection.set(webhooks._window_key(self.SETTING_PK), 1)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._clear_redis()
+
+    def _clear_redis(self):
+        default_connection.delete(webhooks._pending_key(self.SETTING_PK),
+                                  webhooks._window_key(self.SETTING_PK),
+                                  webhooks.RETRY_KEY)
+        default_connection.srem(webhooks.PENDING_SET_KEY, self.SETTING_PK)
+
+    def _request(self, event):
+        return {
+            'url': self.server.url,
+            'body': 'event=%s' % event,
+            'headers': {},
+            'username': 'user',
+            'password': 'secret',
+            'team': 'team',
+        }
+
+    def test_batched_delivery(self):
+        for event in ('video-new', 'language-new', 'subs-new'):
+            webhooks.queue_delivery(self.SETTING_PK, self._request(event))
+        self.assertEquals(self.server.received, [])
+
+        self.assertEquals(webhooks.deliver_pending(self.SETTING_PK), 3)
+        self.assertEquals([r['body']['event'] for r in self.server.received],
+                          [['video-new'], ['language-new'], ['subs-new']])
+        self.assert_(self.server.received[0]['authorization'])
+        # all of them went over the same connection
+        ports = set(r['client_port'] for r in self.server.received)
+        self.assertEquals(len(ports), 1)
+
+        # the queue is empty now and the window is closed
+        self.assertEquals(webhooks.deliver_pending(self.SETTING_PK), 0)
+        self.assertFalse(default_connection.exists(
+            webhooks._window_key(self.SETTING_PK)))
+
+    def test_retry(self):
+        self.server.status = 500
+        webhooks.queue_delivery(self.SETTING_PK, self._request('video-new'))
+        self.assertEquals(webhooks.deliver_pending(self.SETTING_PK), 0)
+
+        # not due yet
+        self.assertEquals(webhooks.pop_due_retries(), [])
+        due = webhooks.pop_due_retries(time.time() + webhooks.RETRY_DELAY)
+        self.assertEquals(len(due), 1)
+        self.assertEquals(due[0]['attempts'], 1)
+        # claimed, nobody else gets it
+        self.assertEquals(webhooks.pop_due_retries(time.time() + 3600), [])
+
+        self.server.status = 200
+        self.assertEquals(webhooks.deliver(due[0])[0], True)
+
+    def test_give_up(self):
+        request = dict(self._request('video-new'),
+                       attempts=webhooks.MAX_ATTEMPTS - 1)
+        webhooks.schedule_retry(request)
+        self.assertEquals(default_connection.zcard(webhooks.RETRY_KEY), 0)
+
+    def test_dead_host(self):
+        # a port nobody listens on
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        for event in ('video-new', 'language-new', 'subs-new'):
+            request = dict(self._request(event),
+                           url='http://127.0.0.1:%s/notify' % port)
+            webhooks.queue_delivery(self.SETTING_PK, request)
+
+        with mock.patch.object(webhooks, 'deliver',
+                               wraps=webhooks.deliver) as deliver:
+            self.assertEquals(webhooks.deliver_pending(self.SETTING_PK), 0)
+        # we only tried the first one
+        self.assertEquals(deliver.call_count, 1)
+
+        due = webhooks.pop_due_retries(time.time() + webhooks.RETRY_DELAY)
+        self.assertEquals(sorted(r['attempts'] for r in due), [0, 0, 1])
+
+class CustomTransportTest(TestCase):
+    def test_has_custom_transport(self):
+        class CustomNotification(notifications.BaseNotification):
+            def send_http_request(self, url, username, password):
+                return True, ''
+
+        base = notifications.BaseNotification.__new__(
+            notifications.BaseNotification)
+        custom = CustomNotification.__new__(CustomNotification)
+        self.assertFalse(notifications.has_custom_transport(base))
+        self.assert_(notifications.has_custom_transport(custom))
@@ -61,7 +61,7 @@ from teams.permissions import (
     roles_user_can_assign, can_join_team, can_edit_video, can_delete_tasks,
     can_perform_task, can_rename_team, can_change_team_settings,
     can_perform_task_for, can_delete_team, can_delete_video, can_remove_video,
-    can_delete_language,
+    can_delete_language, filter_performable_tasks, get_member, TeamWorkflows
 )
 from teams.signals import api_teamvideo_new
 from teams.tasks import (
@@ -71,6 +71,7 @@ from teams.tasks import (
 )
 from apps.videos.tasks import video_changed_tasks
 from utils import render_to, render_to_json, DEFAULT_PROTOCOL
+from utils.celery_search_index import search_index_queue_depth
 from utils.forms import flatten_errorlists
 from utils.metrics import time as timefn
 from utils.panslugify import pan_slugify
@@ -78,7 +79,6 @@ from utils.searching import get_terms
 from utils.translation import (
     get_language_choices, languages_with_labels, get_user_languages_from_request
 )
-from utils.chunkediter import chunkediter
 from videos.types import UPDATE_VERSION_ACTION
 from videos import metadata_manager
 from videos.tasks import (
@@ -521,7 +521,11 @@ def detail(request, slug, project_slug=None, languages=None):
                         .select_related('project', 'team', 'team_video'))
 
     if not filtered and not query:
-        if project:
+        # Only count the team's videos if there are any team videos waiting
+        # in the search index update queue at all.
+        if not search_index_queue_depth(TeamVideo):
+            is_indexing = False
+        elif project:
             is_indexing = project.videos_count != extra_context['current_videos_count']
         else:
             is_indexing = team.videos.all().count() != extra_context['current_videos_count']
@@ -1184,16 +1188,56 @@ def _cache_video_url(tasks):
     for t in tasks:
         t.cached_video_url = video_urls.get(t.team_video.video_id)
 
+def _first_team_video_ids(tasks, count, chunk_size=100):
+    """Return the pks of the first count distinct team videos of tasks."""
+    team_video_ids = []
+    offset = 0
+
+    while len(team_video_ids) < count:
+        chunk = list(tasks.values_list('team_video', flat=True)
+                          [offset:offset + chunk_size])
+
+        for team_video_id in chunk:
+            if team_video_id not in team_video_ids:
+                team_video_ids.append(team_video_id)
+                if len(team_video_ids) >= count:
+                    break
+
+        if len(chunk) < chunk_size:
+            break
+        offset += chunk_size
+
+    return team_video_ids
+
+def _group_tasks_by_team_video(tasks, user, workflows, count):
+    """Return the first count team videos of tasks, with a .tasks list each.
+
+    tasks should already be narrowed with filter_performable_tasks, so this
+    only looks at the tasks of the videos that end up on the page.
+
+    """
+    team_video_ids = _first_team_video_ids(tasks, count)
+    videos = {}
+
+    for task in tasks.filter(team_video__in=team_video_ids):
+        workflows.cache_on([task.team_video])
+        if not can_perform_task(user, task):
+            continue
+
+        if task.team_video_id not in videos:
+            videos[task.team_video_id] = task.team_video
+            task.team_video.tasks = []
+        videos[task.team_video_id].tasks.append(task)
+
+    return [videos[pk] for pk in team_video_ids if pk in videos]
+
 @timefn
 @render_to('teams/dashboard.html')
 def dashboard(request, slug):
 
     team = Team.get(slug, request.user)
     user = request.user if request.user.is_authenticated() else None
-    try:
-        member = team.members.get(user=user)
-    except TeamMember.DoesNotExist:
-        member = None
+    member = get_member(user, team) if user else None
 
     if user:
         user_languages = set([ul for ul in user.get_languages()])
@@ -1231,24 +1275,13 @@ def dashboard(request, slug):
                                          project, filters,
                                          user))
 
+        workflows = TeamWorkflows(team)
+        tasks = filter_performable_tasks(tasks, team, user, workflows)
         tasks = tasks.select_related('team_video', 'team_video__team',
                                      'team_video__project', 'team_video__video')
 
-        for task in chunkediter(tasks, 100):
-            if not can_perform_task(user, task):
-                continue
-
-            task_vid = task.team_video
-
-            if not task_vid in videos:
-                task_vid.tasks = []
-                videos.append(task_vid)
-
-            vid_index = videos.index(task_vid)
-            videos[vid_index].tasks.append(task)
-
-            if len(videos) >= VIDEOS_ON_PAGE:
-                break
+        videos = _group_tasks_by_team_video(tasks, user, workflows,
+                                            VIDEOS_ON_PAGE)
 
         for video in videos:
             _cache_video_url(video.tasks)
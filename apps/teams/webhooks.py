@@ -0,0 +1,233 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Delivery of the http notifications teams and partners subscribe to.
+
+Notifications aren't POSTed from the task that fired them anymore.  They are
+pushed on a redis list per TeamNotificationSetting, and the first one pushed
+schedules a deliver_webhooks task BATCH_WINDOW seconds later.  That task
+sends everything that piled up for the team in the meantime, one request per
+event like before, over a keep-alive connection to the team's host.
+
+Failed deliveries go to a redis sorted set scored by the time of their next
+attempt, RETRY_DELAY * 2 ** (attempts - 1) seconds later, and
+retry_webhooks picks them up.  After MAX_ATTEMPTS we give up and log it.
+When a host can't be reached, the rest of the batch for it goes straight to
+the retries instead of waiting TIMEOUT seconds each.
+
+Both tasks run on their own "webhooks" queue (see CELERY_ROUTES), so slow
+partners don't hold up the default workers.
+
+A request is a dict with the url, the body, the headers and optionally the
+basic auth credentials, see BaseNotification.build_http_request.
+
+"""
+
+import logging
+import os
+import time
+import uuid
+from urlparse import urlparse
+
+import requests
+import simplejson as json
+from django.conf import settings
+
+from utils.metrics import Meter
+from utils.redis_utils import default_connection
+
+logger = logging.getLogger("team-notifier")
+
+BATCH_WINDOW = getattr(settings, 'WEBHOOK_BATCH_WINDOW', 5)
+TIMEOUT = getattr(settings, 'WEBHOOK_TIMEOUT', 10)
+RETRY_DELAY = getattr(settings, 'WEBHOOK_RETRY_DELAY', 30)
+MAX_ATTEMPTS = getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 8)
+
+PENDING_SET_KEY = 'webhooks:pending'
+RETRY_KEY = 'webhooks:retry'
+
+def _pending_key(setting_pk):
+    return 'webhooks:pending:%s' % setting_pk
+
+def _window_key(setting_pk):
+    return 'webhooks:window:%s' % setting_pk
+
+
+# HTTP
+_session = None
+_session_pid = None
+
+def get_session():
+    """Return this process's requests session.
+
+    The session keeps a pool of keep-alive connections per host, so
+    notifications to the same partner reuse the same connection.
+
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        _session = requests.session(config={
+            'pool_connections': 50,
+            'pool_maxsize': 2,
+        })
+        _session_pid = os.getpid()
+    return _session
+
+def deliver(request):
+    """POST a notification right away.
+
+    Returns (success, content) like BaseNotification.send_http_request,
+    (None, None) if we couldn't talk to the server.
+
+    """
+    auth = None
+    if request.get('username') and request.get('password'):
+        auth = (request['username'], request['password'])
+
+    try:
+        response = get_session().post(request['url'], data=request['body'],
+                                      headers=request['headers'], auth=auth,
+                                      timeout=TIMEOUT, verify=False)
+    except Exception:
+        logger.exception("Failed to send http notification",
+                         extra={'url': request['url']})
+        Meter('http-callback-notification-error').inc()
+        return None, None
+
+    success = 200 <= response.status_code < 400
+    if success:
+        Meter('http-callback-notification-success').inc()
+    else:
+        logger.error("Failed to notify %s" % request.get('team'),
+                     extra={
+                        'url': request['url'],
+                        'status': response.status_code,
+                        'content': response.content,
+                        'data_sent': request['body'],
+                    })
+        Meter('http-callback-notification-error').inc()
+    return success, response.content
+
+
+# Queueing
+def queue_delivery(setting_pk, request):
+    """Queue a notification for the team/partner of a TeamNotificationSetting.
+    """
+    request = dict(request, id=uuid.uuid4().hex, attempts=0)
+    pipe = default_connection.pipeline()
+    pipe.rpush(_pending_key(setting_pk), json.dumps(request))
+    pipe.sadd(PENDING_SET_KEY, setting_pk)
+    pipe.execute()
+
+    # The first notification of a window schedules the delivery of all of
+    # them.  The key expires in case that task gets lost, retry_webhooks
+    # then picks up the leftovers.
+    if default_connection.setnx(_window_key(setting_pk), 1):
+        default_connection.expire(_window_key(setting_pk), BATCH_WINDOW * 10)
+        from teams.tasks import deliver_webhooks
+        deliver_webhooks.apply_async(args=[setting_pk], countdown=BATCH_WINDOW)
+
+def _pop_pending(setting_pk):
+    pipe = default_connection.pipeline()
+    pipe.lrange(_pending_key(setting_pk), 0, -1)
+    pipe.delete(_pending_key(setting_pk))
+    pipe.srem(PENDING_SET_KEY, setting_pk)
+    values = pipe.execute()[0]
+    return [json.loads(value) for value in values]
+
+def deliver_pending(setting_pk):
+    """Send every queued notification of a TeamNotificationSetting.
+
+    Returns the number of notifications that were delivered.
+
+    """
+    # Anything queued from now on starts a new window.
+    default_connection.delete(_window_key(setting_pk))
+
+    return _deliver_all(_pop_pending(setting_pk))
+
+def _deliver_all(pending):
+    """Deliver the pending requests, schedule a retry for the ones that fail.
+
+    Once a host can't be reached (connection error, timeout) the rest of its
+    requests go straight to the retry queue, so a dead partner only costs
+    one TIMEOUT.  Returns the number of requests delivered.
+
+    """
+    delivered = 0
+    dead_hosts = set()
+    for request in pending:
+        host = urlparse(request['url']).netloc
+        if host in dead_hosts:
+            schedule_retry(request, attempted=False)
+            continue
+
+        success = deliver(request)[0]
+        if success:
+            delivered += 1
+        else:
+            if success is None:
+                dead_hosts.add(host)
+            schedule_retry(request)
+    return delivered
+
+def deliver_stale_pending():
+    """Deliver the notifications whose delivery task got lost."""
+    for setting_pk in default_connection.smembers(PENDING_SET_KEY):
+        if not default_connection.exists(_window_key(setting_pk)):
+            deliver_pending(setting_pk)
+
+
+# Retries
+def schedule_retry(request, attempted=True):
+    """Queue a request for another attempt.
+
+    attempted is False for requests we didn't even try to send, they don't
+    use up one of their MAX_ATTEMPTS.
+
+    """
+    if not attempted:
+        default_connection.zadd(RETRY_KEY,
+                                **{json.dumps(request): time.time() + RETRY_DELAY})
+        return
+
+    request = dict(request, attempts=request.get('attempts', 0) + 1)
+    if request['attempts'] >= MAX_ATTEMPTS:
+        logger.error("Giving up on http notification after %s attempts" %
+                     request['attempts'], extra={'url': request['url']})
+        Meter('http-callback-notification-dropped').inc()
+        return
+
+    delay = RETRY_DELAY * 2 ** (request['attempts'] - 1)
+    default_connection.zadd(RETRY_KEY,
+                            **{json.dumps(request): time.time() + delay})
+
+def pop_due_retries(now=None):
+    """Remove the retries that are due from the queue and return them."""
+    if now is None:
+        now = time.time()
+    due = []
+    for value in default_connection.zrangebyscore(RETRY_KEY, 0, now):
+        # Only the worker that manages to remove it gets to send it.
+        if default_connection.zrem(RETRY_KEY, value):
+            due.append(json.loads(value))
+    return due
+
+def retry_due():
+    """Resend the failed notifications that are due for another attempt."""
+    _deliver_all(pop_due_retries())
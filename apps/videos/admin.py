@@ -26,7 +26,7 @@ from videos.tasks import (
 )
 
 from django.core.urlresolvers import reverse
-from utils.celery_search_index import update_search_index
+from utils.celery_search_index import queue_search_index_update
 
 
 class VideoUrlInline(admin.StackedInline):
@@ -64,7 +64,7 @@ class VideoAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         obj.save()
-        update_search_index.delay(obj.__class__, obj.pk)
+        queue_search_index_update(obj.__class__, obj.pk)
 
 class VideoMetadataAdmin(admin.ModelAdmin):
     list_display = ['video', 'key', 'data']
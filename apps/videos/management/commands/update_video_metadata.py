@@ -1,38 +1,53 @@
+import logging
+from optparse import make_option
+
 from django.core.management.base import BaseCommand
 from apps.videos.models import Video
-from apps.videos.metadata_manager import update_metadata
-from time import sleep
-import logging 
-import sys
-from time import sleep
-import math
+from apps.videos.metadata_manager import update_metadata_many
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    
+    help = u'Recompute the denormalized metadata of every video'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', '-b', dest='batch_size', type='int',
+            default=500),
+        make_option('--start', '-s', dest='start', type='int', default=0,
+            help='Only update videos with a pk greater than this'),
+    )
+
     def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        last_pk = kwargs['start']
+
         print 'Run update_metadata command'
-        targets = Video.objects.all()
-        percent_printed = 0
-        num = targets.count()
-        count = 0
+        num = Video.objects.filter(pk__gt=last_pk).count()
         print "%s videos to go " % num
-        must_return = False
-        for x in targets.iterator():
+
+        count = 0
+        percent_printed = 0
+        while True:
+            # walk the table by pk so every batch is a cheap range scan
+            pks = list(Video.objects.filter(pk__gt=last_pk)
+                                    .order_by('pk')
+                                    .values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+
             try:
-                update_metadata(x.pk)
-                percent =  (((count * 1.0) / num) * 100)
-                count +=1          
-                if int(percent) > percent_printed:
-                    percent_printed = int(percent)
-                    print "Done %2s %%" % (percent_printed)
+                update_metadata_many(pks)
             except (KeyboardInterrupt, SystemExit):
-                must_return = True
+                print "stopped after pk %s, rerun with --start=%s" % (
+                    last_pk, last_pk)
+                return
             except:
-                print "failed for pk %s"  % x.pk
+                print "failed for pks %s-%s" % (pks[0], pks[-1])
                 logger.exception("metadata import")
-            if must_return:
-                print "stopped at %s" % count
-                return
-            sleep(0.2)
+
+            last_pk = pks[-1]
+            count += len(pks)
+            percent = int(((count * 1.0) / max(num, 1)) * 100)
+            if percent > percent_printed:
+                percent_printed = percent
+                print "Done %2s %%" % (percent_printed)
@@ -16,60 +16,123 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from collections import defaultdict
 from datetime import datetime
+
 from utils.metrics import Timer
 
+# The denormalized Video columns maintained here.
+METADATA_FIELDS = ('edited', 'is_public', 'is_subtitled', 'was_subtitled',
+                   'languages_count', 'complete_date')
+
 def update_metadata(video_pk):
-    from videos.models import Video
     with Timer('metadata-update-time'):
-        video = Video.objects.get(pk=video_pk)
-        video.edited = datetime.now()
-        video.save()
-        _update_is_public(video)
-        _update_is_was_subtitled(video)
-        _update_languages_count(video)
-        _update_complete_date(video)
-        _invalidate_cache(video)
-
-def _update_is_was_subtitled(video):
-    from subtitles.models import SubtitleLanguage
-    language_code = video.primary_audio_language_code
-    has_version = (SubtitleLanguage.objects.having_nonempty_tip()
-                                           .filter(video=video, 
-                                                   language_code=language_code)
-                                           .exists())
-
-    if not has_version:
-        if video.is_subtitled:
-            video.is_subtitled = False
-            video.save()
-    else:
-        if not video.is_subtitled or not video.was_subtitled:
-            video.is_subtitled = True
-            video.was_subtitled = True
-            video.save()
-
-def _update_languages_count(video):
-    video.languages_count = video.newsubtitlelanguage_set.having_nonempty_tip().count()
-    video.save()
-
-def _update_complete_date(video):
-    is_complete = video.is_complete
-    if is_complete and video.complete_date is None:
-        video.complete_date = datetime.now()
-        video.save()
-    elif not is_complete and video.complete_date is not None:
-        video.complete_date = None
-        video.save()
-
-def _invalidate_cache(video):
-    from widget import video_cache
-    video_cache.invalidate_cache(video.video_id)
+        update_metadata_many([video_pk])
+
+def update_metadata_many(video_pks):
+    """Recompute the denormalized metadata of many videos at once.
+
+    All the data is gathered with a fixed number of queries for the whole
+    batch and only the columns that changed are written, with one UPDATE per
+    distinct set of changes.  Video.save() is never called, so the widget
+    cache and the search index are refreshed explicitly.
+
+    Returns the number of videos updated.
+
+    """
+    from videos.models import Video
+    from utils.celery_search_index import queue_search_index_update
+
+    videos = list(Video.objects.filter(pk__in=video_pks)
+                               .values('pk', 'video_id',
+                                       'primary_audio_language_code',
+                                       *METADATA_FIELDS))
+    if not videos:
+        return 0
+
+    languages = _get_language_info([v['pk'] for v in videos])
+    team_visibility = _get_team_visibility([v['pk'] for v in videos])
+    now = datetime.now()
+
+    updates = defaultdict(list)
+    for video in videos:
+        values = _compute_metadata(video, languages[video['pk']],
+                                   team_visibility.get(video['pk']), now)
+        changes = tuple(sorted((field, value)
+                               for field, value in values.items()
+                               if video[field] != value))
+        updates[changes].append(video['pk'])
+
+    for changes, pks in updates.items():
+        if changes:
+            Video.objects.filter(pk__in=pks).update(**dict(changes))
 
-def _update_is_public(video):
-    team_video = video.get_team_video()
-    if team_video:
-        video.is_public = team_video.team.is_visible
+    for video in videos:
+        _invalidate_cache(video['video_id'])
+        queue_search_index_update(Video, video['pk'])
+
+    return len(videos)
+
+def _get_language_info(video_pks):
+    """Return a dict of video pk -> list of (language_code, nonempty, complete).
+
+    nonempty is True if the language's tip has subtitles, complete if the
+    language is marked complete and its tip is fully synced (the same test as
+    Video.is_complete).
+
+    """
+    from subtitles.models import SubtitleLanguage, SubtitleVersion
+
+    rows = list(SubtitleLanguage.objects.filter(video__in=video_pks)
+                                        .values_list('pk', 'video',
+                                                     'language_code',
+                                                     'subtitles_complete'))
+    tips = SubtitleVersion.objects.tips([row[0] for row in rows],
+                                        defer_subtitles=True)
+
+    # Only the tips of complete languages need their subtitles parsed.
+    complete_tip_pks = [tips[pk].pk for pk, _, _, complete in rows
+                        if complete and pk in tips]
+    synced = set(sv.subtitle_language_id
+                 for sv in SubtitleVersion.objects.full()
+                                          .filter(pk__in=complete_tip_pks)
+                 if sv.get_subtitles().fully_synced)
+
+    languages = defaultdict(list)
+    for pk, video_pk, language_code, complete in rows:
+        nonempty = pk in tips and tips[pk].subtitle_count > 0
+        languages[video_pk].append((language_code, nonempty, pk in synced))
+    return languages
+
+def _get_team_visibility(video_pks):
+    """Return a dict of video pk -> is_visible for the team of team videos."""
+    from teams.models import TeamVideo
+
+    return dict(TeamVideo.objects.filter(video__in=video_pks)
+                                 .values_list('video', 'team__is_visible'))
+
+def _compute_metadata(video, languages, team_is_visible, now):
+    """Return the new values of METADATA_FIELDS for one video."""
+    is_subtitled = any(nonempty
+                       for language_code, nonempty, complete in languages
+                       if language_code == video['primary_audio_language_code'])
+    is_complete = any(complete for _, _, complete in languages)
+
+    if is_complete:
+        complete_date = video['complete_date'] or now
     else:
-        video.is_public = True
-    video.save()
+        complete_date = None
+
+    return {
+        'edited': now,
+        'is_public': True if team_is_visible is None else team_is_visible,
+        'is_subtitled': is_subtitled,
+        # was_subtitled sticks once set
+        'was_subtitled': video['was_subtitled'] or is_subtitled,
+        'languages_count': len([l for l in languages if l[1]]),
+        'complete_date': complete_date,
+    }
+
+def _invalidate_cache(video_id):
+    from widget import video_cache
+    video_cache.invalidate_cache(video_id)
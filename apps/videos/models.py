@@ -43,7 +43,8 @@ from videos.types import video_type_registrar
 from videos.feed_parser import FeedParser
 from comments.models import Comment
 from statistic import st_widget_view_statistic
-from statistic.tasks import st_sub_fetch_handler_update, st_video_view_handler_update
+from statistic import st_sub_fetch_handler, st_video_view_handler
+from statistic.buffer import counter_buffer
 from widget import video_cache
 from utils.redis_utils import RedisSimpleField
 from utils.amazon import S3EnabledImageField
@@ -185,9 +186,9 @@ class Video(models.Model):
         return title
 
     def update_search_index(self):
-        """Queue a Celery task that will update this video's Solr entry."""
-        from utils.celery_search_index import update_search_index
-        update_search_index.delay(self.__class__, self.pk)
+        """Queue this video for the next batched update of its Solr entry."""
+        from utils.celery_search_index import queue_search_index_update
+        queue_search_index_update(self.__class__, self.pk)
 
     @property
     def views(self):
@@ -213,8 +214,16 @@ class Video(models.Model):
 
         return self._video_views_statistic
 
-    def title_display(self, truncate=True):
-        v = self.latest_version()
+    def title_display(self, truncate=True, latest_version=-1):
+        """Return a title for this video, falling back to its URL.
+
+        The latest version can be given to avoid an extra database lookup.
+
+        """
+        if latest_version == -1:
+            latest_version = self.latest_version()
+
+        v = latest_version
 
         if v and v.title and v.title.strip():
             title = v.title
@@ -251,21 +260,27 @@ class Video(models.Model):
         return self.title_display(False)
 
     def update_view_counter(self):
-        """Queue a Celery task that will increment the number of views for this video."""
+        """Count a view of this video.
+
+        The increment is buffered in-process and flushed to Redis in batches,
+        see statistic.buffer.
+
+        """
         try:
-            st_video_view_handler_update.delay(video_id=self.video_id)
+            counter_buffer.incr_statistic(st_video_view_handler,
+                                          video_id=self.video_id)
         except:
             client.captureException()
 
     def update_subtitles_fetched(self, lang=None):
-        """Queue a Celery task that will increment the number of times this video's subtitles were fetched."""
+        """Count a fetch of this video's subtitles (buffered like views)."""
         try:
             sl_pk = lang.pk if lang else None
-            st_sub_fetch_handler_update.delay(video_id=self.video_id, sl_pk=sl_pk)
+            counter_buffer.incr_statistic(st_sub_fetch_handler,
+                                          video_id=self.video_id, sl_pk=sl_pk)
             if lang:
-                from videos.tasks import update_subtitles_fetched_counter_for_sl
-
-                update_subtitles_fetched_counter_for_sl.delay(sl_pk=lang.pk)
+                counter_buffer.incr_key(
+                    lang.subtitles_fetched_counter.redis_key)
         except:
             client.captureException()
 
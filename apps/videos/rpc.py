@@ -17,24 +17,28 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 import datetime
+import hashlib
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.template import RequestContext
 from django.template.defaultfilters import slugify
 from django.template.loader import render_to_string
-from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext as _, get_language
+from haystack.query import EmptySearchQuerySet, SearchQuerySet
 
 from apps.subtitles.models import SubtitleLanguage
 from apps.videos.models import Video, Action
 from apps.videos.search_indexes import VideoIndex
 from apps.videos.tasks import send_change_title_email
-from utils.celery_search_index import update_search_index
-from utils.multi_query_set import MultiQuerySet
+from utils.celery_search_index import queue_search_index_update
 from utils.rpc import Error, Msg, RpcExceptionEvent, add_request_to_kwargs
 from utils.translation import get_user_languages_from_request
 
 VIDEOS_ON_PAGE = VideoIndex.IN_ROW*5
+# how long the listings shown to anonymous users are cached
+LISTING_CACHE_TIMEOUT = getattr(settings, 'VIDEO_LISTING_CACHE_TIMEOUT', 60)
 
 class VideosApiClass(object):
     authentication_error_msg = _(u'You should be authenticated.')
@@ -58,7 +62,7 @@ class VideosApiClass(object):
         if not c:
             raise RpcExceptionEvent(_(u'Video does not exist'))
 
-        update_search_index.delay(Video, video_id)
+        queue_search_index_update(Video, video_id)
 
         return {}
 
@@ -74,7 +78,7 @@ class VideosApiClass(object):
         if not c:
             raise RpcExceptionEvent(_(u'Video does not exist'))
 
-        update_search_index.delay(Video, video_id)
+        queue_search_index_update(Video, video_id)
 
         return {}
 
@@ -145,15 +149,17 @@ class VideosApiClass(object):
 
     @add_request_to_kwargs
     def load_featured_page(self, page, request, user):
-        sqs = VideoIndex.get_featured_videos()
-
-        return render_page(page, sqs, request=request)
+        def build():
+            sqs = VideoIndex.get_featured_videos()
+            return render_page(page, sqs, request=request)
+        return cached_listing(request, ('featured', page), build)
 
     @add_request_to_kwargs
     def load_latest_page(self, page, request, user):
-        sqs = VideoIndex.public().order_by('-created')
-
-        return render_page(page, sqs, request=request)
+        def build():
+            sqs = VideoIndex.public().order_by('-created')
+            return render_page(page, sqs, request=request)
+        return cached_listing(request, ('latest', page), build)
 
     @add_request_to_kwargs
     def load_popular_page(self, page, sort, request, user):
@@ -167,56 +173,68 @@ class VideosApiClass(object):
 
         sort_field = sort_types.get(sort, 'week_views')
 
-        sqs = VideoIndex.get_popular_videos('-%s' % sort_field)
+        def build():
+            sqs = VideoIndex.get_popular_videos('-%s' % sort_field)
+            return render_page(page, sqs, request=request, display_views=sort)
+        return cached_listing(request, ('popular', page, sort), build)
 
-        return render_page(page, sqs, request=request, display_views=sort)
 
+    def _get_volunteer_sqs(self, request, user):
+        """Return the videos in the user's languages and all the others."""
+        user_langs = get_user_languages_from_request(request)
+
+        rel = VideoIndex.public().filter(video_language_exact__in=user_langs) \
+            .filter_or(languages_exact__in=user_langs)
+        rest = VideoIndex.public().exclude(video_language_exact__in=user_langs) \
+            .exclude(languages_exact__in=user_langs)
+        return rel, rest
+
+    def _volunteer_listing_key(self, request, *args):
+        user_langs = sorted(get_user_languages_from_request(request))
+        return ('volunteer',) + args + tuple(user_langs)
 
     @add_request_to_kwargs
     def load_featured_page_volunteer(self, page, request, user):
-        rel, rest = self._get_volunteer_sqs(request, user)
-
-        rel = rel.filter(featured__gt=datetime.datetime(datetime.MINYEAR, 1, 1)) \
-            .order_by('-featured')
+        def build():
+            rel, rest = self._get_volunteer_sqs(request, user)
 
-        rest = rest.filter(featured__gt=datetime.datetime(datetime.MINYEAR, 1, 1)) \
-            .order_by('-featured')
+            rel = rel.filter(featured__gt=datetime.datetime(datetime.MINYEAR, 1, 1)) \
+                .order_by('-featured')
 
-        count = rel.count() + rest.count()
+            rest = rest.filter(featured__gt=datetime.datetime(datetime.MINYEAR, 1, 1)) \
+                .order_by('-featured')
 
-        mqs = MultiQuerySet(rel, rest)
-        mqs.set_count(count)
+            return render_page(page, SearchListing(rel, rest), request=request)
 
-        return render_page(page, mqs, request=request)
+        key = self._volunteer_listing_key(request, 'featured', page)
+        return cached_listing(request, key, build)
 
     @add_request_to_kwargs
     def load_requested_page_volunteer(self, page, request, user):
-        user_langs = get_user_languages_from_request(request)
+        def build():
+            user_langs = get_user_languages_from_request(request)
 
-        rel, rest = self._get_volunteer_sqs(request, user)
+            rel, rest = self._get_volunteer_sqs(request, user)
 
-        rel = rel.filter(requests_exact__in=user_langs)
-        rest = rest.filter(requests_exact__in=user_langs)
+            rel = rel.filter(requests_exact__in=user_langs)
+            rest = rest.filter(requests_exact__in=user_langs)
 
-        count = rel.count() + rest.count()
+            return render_page(page, SearchListing(rel, rest), request=request)
 
-        mqs = MultiQuerySet(rel, rest)
-        mqs.set_count(count)
-
-        return render_page(page, mqs, request=request)
+        key = self._volunteer_listing_key(request, 'requested', page)
+        return cached_listing(request, key, build)
 
     @add_request_to_kwargs
     def load_latest_page_volunteer(self, page, request, user):
-        rel, rest = self._get_volunteer_sqs(request, user)
-        rel = rel.order_by('-created')
-        rest = rest.order_by('-created')
-
-        count = rel.count() + rest.count()
+        def build():
+            rel, rest = self._get_volunteer_sqs(request, user)
+            rel = rel.order_by('-created')
+            rest = rest.order_by('-created')
 
-        mqs = MultiQuerySet(rel, rest)
-        mqs.set_count(count)
+            return render_page(page, SearchListing(rel, rest), request=request)
 
-        return render_page(page, mqs, request=request)
+        key = self._volunteer_listing_key(request, 'latest', page)
+        return cached_listing(request, key, build)
 
     @add_request_to_kwargs
     def load_popular_page_volunteer(self, page, sort, request, user):
@@ -231,16 +249,15 @@ class VideosApiClass(object):
 
         sort_field = sort_types.get(sort, 'week_views')
 
-        rel, rest = self._get_volunteer_sqs(request, user)
-        rel = rel.order_by('-%s' % sort_field)
-        rest = rest.order_by('-%s' % sort_field)
-
-        count = rel.count() + rest.count()
+        def build():
+            rel, rest = self._get_volunteer_sqs(request, user)
+            rel = rel.order_by('-%s' % sort_field)
+            rest = rest.order_by('-%s' % sort_field)
 
-        mqs = MultiQuerySet(rel, rest)
-        mqs.set_count(count)
+            return render_page(page, SearchListing(rel, rest), request=request)
 
-        return render_page(page, mqs,  request=request)
+        key = self._volunteer_listing_key(request, 'popular', page, sort)
+        return cached_listing(request, key, build)
 
     @add_request_to_kwargs
     def load_popular_videos(self, sort, request, user):
@@ -259,18 +276,20 @@ class VideosApiClass(object):
             display_views = 'week'
             sort_field = 'week_views'
 
-        popular_videos = VideoIndex.get_popular_videos('-%s' % sort_field)[:VideoIndex.IN_ROW]
+        def build():
+            popular_videos = VideoIndex.get_popular_videos('-%s' % sort_field)[:VideoIndex.IN_ROW]
 
-        context = {
-            'display_views': display_views,
-            'video_list': popular_videos
-        }
+            context = {
+                'display_views': display_views,
+                'video_list': popular_videos
+            }
 
-        content = render_to_string('videos/_watch_page.html', context, RequestContext(request))
+            content = render_to_string('videos/_watch_page.html', context, RequestContext(request))
 
-        return {
-            'content': content
-        }
+            return {
+                'content': content
+            }
+        return cached_listing(request, ('popular-videos', sort_field), build)
 
     @add_request_to_kwargs
     def load_popular_videos_volunteer(self, sort, request, user):
@@ -284,25 +303,24 @@ class VideosApiClass(object):
 
         sort_field = sort_types.get(sort, 'week_views')
 
-        rel, rest = self._get_volunteer_sqs(request, user)
-
-        rel = rel.order_by('-%s' % sort_field)[:5]
-        rest = rest.order_by('-%s' % sort_field)[:5]
+        def build():
+            rel, rest = self._get_volunteer_sqs(request, user)
 
-        count = rel.count() + rest.count()
+            rel = rel.order_by('-%s' % sort_field)
+            rest = rest.order_by('-%s' % sort_field)
 
-        mqs = MultiQuerySet(rel, rest)
-        mqs.set_count(count)
+            context = {
+                'video_list': list(rel[:5]) + list(rest[:5])
+            }
 
-        context = {
-            'video_list': mqs
-        }
+            content = render_to_string('videos/_watch_page.html', context, RequestContext(request))
 
-        content = render_to_string('videos/_watch_page.html', context, RequestContext(request))
+            return {
+                'content': content
+            }
 
-        return {
-            'content': content
-        }
+        key = self._volunteer_listing_key(request, 'popular-videos', sort_field)
+        return cached_listing(request, key, build)
 
     def change_title_video(self, video_pk, title, user):
         title = title.strip()
@@ -320,7 +338,7 @@ class VideosApiClass(object):
                     video.title = title
                     video.slug = slugify(video.title)
                     video.save()
-                    update_search_index.delay(Video, video.pk)
+                    queue_search_index_update(Video, video.pk)
                     Action.change_title_handler(video, user)
                     send_change_title_email.delay(video.id, user and user.id, old_title.encode('utf8'), video.title.encode('utf8'))
             else:
@@ -388,24 +406,89 @@ class VideosApiClass(object):
 
         return Msg(_(u'You stopped following this subtitles now.'))
 
+class SearchListing(object):
+    """Search results from several SearchQuerySets, one after the other.
+
+    get_page() fetches a page of the results along with the total with a
+    single Solr request per queryset.  There's no counting upfront: the hit
+    count of each request tells how far into the next queryset the page
+    continues.
+    """
+    def __init__(self, *querysets):
+        self.querysets = querysets
+
+    def get_page(self, offset, limit):
+        """Return (results, total) for results offset to offset+limit."""
+        results = []
+        total = 0
+        for sqs in self.querysets:
+            wanted = limit - len(results)
+            page_results, count = _search_page(sqs, max(0, offset - total),
+                                               wanted)
+            results.extend(page_results)
+            total += count
+        return results, total
+
+def _search_page(sqs, offset, limit):
+    if isinstance(sqs, EmptySearchQuerySet):
+        return [], 0
+
+    sqs = sqs._clone()
+    if limit <= 0:
+        # we only need the total
+        return [], sqs.count()
+
+    # slicing runs the search, the hit count comes back with it
+    results = list(sqs[offset:offset + limit])
+    return results, len(sqs)
+
+def cached_listing(request, key, build):
+    """Return build() for a listing, cached for a bit for anonymous users.
+
+    key identifies the listing (method, page, sort...), the UI language is
+    added to it.
+    """
+    if request is None or request.user.is_authenticated():
+        return build()
+
+    key = 'video-listing:%s' % hashlib.md5(
+        repr(tuple(key) + (get_language(),))).hexdigest()
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, LISTING_CACHE_TIMEOUT)
+    return value
+
 def render_page(page, qs, on_page=VIDEOS_ON_PAGE, request=None,
                  template='videos/_watch_page.html', extra_context={},
                  display_views='total'):
-    paginator = Paginator(qs, on_page)
-
     try:
         page = int(page)
     except ValueError:
         page = 1
 
-    try:
-        page_obj = paginator.page(page)
-    except (EmptyPage, InvalidPage):
-        page_obj = paginator.page(paginator.num_pages)
+    if isinstance(qs, SearchQuerySet):
+        qs = SearchListing(qs)
+    if isinstance(qs, SearchListing):
+        video_list, total = qs.get_page((max(page, 1) - 1) * on_page, on_page)
+        num_pages = max(1, (total + on_page - 1) // on_page)
+        if page < 1 or page > num_pages:
+            # out of range, show the last page like the Paginator does
+            page = num_pages
+            video_list, total = qs.get_page((page - 1) * on_page, on_page)
+    else:
+        paginator = Paginator(qs, on_page)
+        try:
+            page_obj = paginator.page(page)
+        except (EmptyPage, InvalidPage):
+            page_obj = paginator.page(paginator.num_pages)
+        page = page_obj.number
+        video_list = page_obj.object_list
+        num_pages = paginator.num_pages
+        total = paginator.count
 
     context = {
-        'video_list': page_obj.object_list,
-        'page': page_obj,
+        'video_list': video_list,
         'display_views': display_views
     }
     context.update(extra_context)
@@ -416,7 +499,6 @@ def render_page(page, qs, on_page=VIDEOS_ON_PAGE, request=None,
         context['STATIC_URL'] = settings.STATIC_URL
         content = render_to_string(template, context)
 
-    total = qs.count()
     from_value = (page - 1) * on_page + 1
     to_value = from_value + on_page - 1
 
@@ -426,8 +508,7 @@ def render_page(page, qs, on_page=VIDEOS_ON_PAGE, request=None,
     return {
         'content': content,
         'total': total,
-        'pages': paginator.num_pages,
+        'pages': num_pages,
         'from': from_value,
         'to': to_value
     }
-
@@ -1,16 +1,20 @@
+import itertools
+
+from django.db.models import Count
 from haystack.indexes import *
 from haystack.models import SearchResult
 from haystack import site
-from models import Video
-from apps.subtitles.models import SubtitleLanguage, Collaborator
-from utils.celery_search_index import CelerySearchIndex
+from models import Video, Action
+from apps.subtitles.models import SubtitleLanguage, SubtitleVersion, Collaborator
+from statistic import st_widget_view_statistic
+from utils.celery_search_index import BatchPrepareMixin, CelerySearchIndex
 from django.conf import settings
 from haystack.query import SearchQuerySet
 import datetime
 
 from haystack.exceptions import AlreadyRegistered
 
-class VideoIndex(CelerySearchIndex):
+class VideoIndex(BatchPrepareMixin, CelerySearchIndex):
     text = CharField(document=True, use_template=True)
     title = CharField(model_attr='title_display', boost=2)
     languages = MultiValueField(faceted=True)
@@ -41,23 +45,78 @@ class VideoIndex(CelerySearchIndex):
 
     IN_ROW = getattr(settings, 'VIDEO_IN_ROW', 6)
 
+    def _prefetch(self, videos):
+        """Gather the related data prepare() needs for many videos at once.
+
+        Returns a dict of video pk -> dict of prepared values, built from a
+        fixed number of grouped queries.
+
+        """
+        pks = [v.pk for v in videos]
+        data = dict((pk, {'languages': [], 'contributors_count': 0,
+                          'activity_count': 0, 'latest_version': None})
+                    for pk in pks)
+
+        languages = (SubtitleLanguage.objects.having_nonempty_versions()
+                                             .filter(video__in=pks)
+                                             .values_list('video', 'language_code'))
+        for video_pk, language_code in languages:
+            data[video_pk]['languages'].append(language_code)
+
+        collaborators = (Collaborator.objects.filter(subtitle_language__video__in=pks)
+                                             .values('subtitle_language__video')
+                                             .annotate(n=Count('user', distinct=True))
+                                             .values_list('subtitle_language__video', 'n'))
+        followers = (SubtitleLanguage.objects.filter(video__in=pks)
+                                             .values('video')
+                                             .annotate(n=Count('followers', distinct=True))
+                                             .values_list('video', 'n'))
+        for video_pk, n in itertools.chain(collaborators, followers):
+            data[video_pk]['contributors_count'] += n
+
+        actions = (Action.objects.filter(video__in=pks)
+                                 .values('video')
+                                 .annotate(n=Count('id'))
+                                 .values_list('video', 'n'))
+        for video_pk, n in actions:
+            data[video_pk]['activity_count'] = n
+
+        views = st_widget_view_statistic.get_views_many('video', pks)
+
+        primary_codes = dict((v.pk, v.primary_audio_language_code) for v in videos)
+        primary_languages = dict(
+            (language_pk, video_pk) for video_pk, language_code, language_pk
+            in SubtitleLanguage.objects.filter(video__in=pks)
+                                       .values_list('video', 'language_code', 'pk')
+            if language_code == primary_codes[video_pk])
+        tips = SubtitleVersion.objects.tips(primary_languages.keys(),
+                                            public=True, defer_subtitles=True)
+        for language_pk, version in tips.items():
+            data[primary_languages[language_pk]]['latest_version'] = version
+
+        for video in videos:
+            video_views = views[video.pk]
+            video_views['total'] = video.widget_views_count
+            data[video.pk]['views'] = video_views
+
+        return data
+
     def prepare(self, obj):
         self.prepared_data = super(VideoIndex, self).prepare(obj)
 
-        languages = SubtitleLanguage.objects.having_nonempty_versions().filter(video=obj)
-        collaborators = Collaborator.objects.filter(subtitle_language__video=obj).values("user").distinct().count()
-        followers = obj.newsubtitlelanguage_set.all().values("followers").distinct().count()
+        data = self.get_prefetched(obj)
 
-        self.prepared_data['languages_count'] = languages.count()
+        self.prepared_data['languages_count'] = len(data['languages'])
         self.prepared_data['video_language'] = obj.primary_audio_language_code
-        self.prepared_data['languages'] = [language.language_code for language in languages]
-        self.prepared_data['contributors_count'] = collaborators + followers
-        self.prepared_data['activity_count'] = obj.action_set.count()
-        self.prepared_data['week_views'] = obj.views['week']
-        self.prepared_data['month_views'] = obj.views['month']
-        self.prepared_data['year_views'] = obj.views['year']
-        self.prepared_data['today_views'] = obj.views['today']
-        self.prepared_data['title'] = obj.title_display(truncate=False).strip()
+        self.prepared_data['languages'] = data['languages']
+        self.prepared_data['contributors_count'] = data['contributors_count']
+        self.prepared_data['activity_count'] = data['activity_count']
+        self.prepared_data['week_views'] = data['views']['week']
+        self.prepared_data['month_views'] = data['views']['month']
+        self.prepared_data['year_views'] = data['views']['year']
+        self.prepared_data['today_views'] = data['views']['today']
+        self.prepared_data['title'] = obj.title_display(
+            truncate=False, latest_version=data['latest_version']).strip()
         self.prepared_data['is_public'] = obj.is_public
 
         return self.prepared_data
@@ -26,7 +26,8 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.files.base import ContentFile
 from django.db.models import ObjectDoesNotExist
-from haystack import site
+from kombu_backends.amazonsqs import batch_publish
+from utils.celery_search_index import queue_search_index_update
 from raven.contrib.django.models import client
 
 from babelsubs.storage import diff as diff_subtitles
@@ -93,8 +94,9 @@ def save_thumbnail_in_s3(video_id):
 
 @periodic_task(run_every=crontab(minute=0, hour=1))
 def update_from_feed(*args, **kwargs):
-    for feed in VideoFeed.objects.all():
-        update_video_feed.delay(feed.pk)
+    with batch_publish():
+        for feed in VideoFeed.objects.all():
+            update_video_feed.delay(feed.pk)
 
 @task
 def update_subtitles_fetched_counter_for_sl(sl_pk):
@@ -159,8 +161,7 @@ def video_changed_tasks(video_pk, new_version_id=None, skip_third_party_sync=Fal
     tv = video.get_team_video()
 
     if tv:
-        tv_search_index = site.get_index(TeamVideo)
-        tv_search_index.backend.update(tv_search_index, [tv])
+        queue_search_index_update(TeamVideo, tv.pk)
 
     video.update_search_index()
 
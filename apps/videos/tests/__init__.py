@@ -1,3 +1,4 @@
+from apps.videos.tests.broker import *
 from apps.videos.tests.celery_tasks import *
 from apps.videos.tests.downloads import *
 from apps.videos.tests.feeds import *
@@ -6,6 +7,7 @@ from apps.videos.tests.forms import *
 from apps.videos.tests.metadata import *
 from apps.videos.tests.models import *
 from apps.videos.tests.rpc import *
+from apps.videos.tests.search_indexes import *
 from apps.videos.tests.template_tags import *
 from apps.videos.tests.uploads import *
 from apps.videos.tests.video_types import *
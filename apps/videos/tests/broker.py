@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from Queue import Empty
+
+from django.test import TestCase
+from kombu import BrokerConnection
+
+from kombu_backends import amazonsqs
+
+
+class FakeMessage(object):
+    def __init__(self, body):
+        self.body = body
+        self.receipt_handle = id(self)
+
+    def get_body(self):
+        return self.body
+
+    def get_body_encoded(self):
+        return self.body
+
+class FakeQueue(object):
+    def __init__(self, name):
+        self.name = self.id = name
+        self.messages = []
+        # received but not deleted, hidden like during a visibility timeout
+        self.in_flight = []
+
+    def new_message(self, body):
+        return FakeMessage(body)
+
+    def write(self, message):
+        self.messages.append(message)
+
+    def receive(self, count):
+        received = self.messages[:count]
+        del self.messages[:count]
+        self.in_flight.extend(received)
+        return received
+
+    def delete_message(self, message):
+        self.in_flight.remove(message)
+
+    def time_out(self):
+        """Make the undeleted messages visible again."""
+        self.messages.extend(self.in_flight)
+        self.in_flight = []
+
+    def count(self):
+        return len(self.messages)
+
+    def clear(self):
+        self.messages = []
+
+class FakeBatchResults(object):
+    def __init__(self, errors=()):
+        self.results = []
+        self.errors = list(errors)
+
+class FakeSQSClient(object):
+    """Stands in for BatchSQSConnection, records the calls it gets."""
+    def __init__(self, access_key, secret_key):
+        self.queues = {}
+        self.calls = []
+        self.failing_sends = set()
+        self.fail_batches = False
+
+    def get_all_queues(self, prefix=''):
+        return [q for name, q in self.queues.items()
+                if name.startswith(prefix)]
+
+    def create_queue(self, name):
+        return self.queues.setdefault(name, FakeQueue(name))
+
+    def receive_messages(self, queue, number_messages=1, wait_time_seconds=0):
+        self.calls.append(('receive', number_messages, wait_time_seconds))
+        return queue.receive(number_messages)
+
+    def delete_message_batch(self, queue, messages):
+        self.calls.append(('delete_batch', len(messages)))
+        for message in messages:
+            queue.delete_message(message)
+        return FakeBatchResults()
+
+    def send_message_batch(self, queue, messages):
+        self.calls.append(('send_batch', len(messages)))
+        if self.fail_batches:
+            raise IOError('connection reset')
+        errors = []
+        for i, message in enumerate(messages):
+            if message.body in self.failing_sends:
+                errors.append({'Id': str(i), 'Code': 'InternalError'})
+            else:
+                queue.write(message)
+        return FakeBatchResults(errors)
+
+class FakeChannel(amazonsqs.Channel):
+    Client = FakeSQSClient
+
+class FakeTransport(amazonsqs.Transport):
+    Channel = FakeChannel
+
+class SQSChannelTest(TestCase):
+    def setUp(self):
+        self.connection = BrokerConnection(transport=FakeTransport)
+        self.channel = self.connection.channel()
+        self.channel.prefetch_count = 10
+        self.client = self.channel.client
+
+    def tearDown(self):
+        self.connection.close()
+
+    def _queue(self):
+        return self.channel._get_queue('celery')
+
+    def _write(self, count):
+        queue = self._queue()
+        for i in xrange(count):
+            payload = {'n': i, 'properties': {'delivery_tag': 'tag%d' % i}}
+            queue.write(queue.new_message(amazonsqs.serialize(payload)))
+
+    def _ack(self, *ns):
+        for n in ns:
+            # what QoS.ack needs to know about the message
+            self.channel.qos._delivered['tag%d' % n] = None
+            self.channel.basic_ack('tag%d' % n)
+
+    def test_get_prefetches(self):
+        self._write(12)
+
+        received = [self.channel._get('celery')['n'] for i in xrange(10)]
+        self.assertEquals(received, range(10))
+        self.assertEquals(self.client.calls, [
+            ('receive', 10, amazonsqs.WAIT_TIME_SECONDS),
+        ])
+        # the prefetched messages are hidden, not deleted
+        self.assertEquals(self._queue().count(), 2)
+        self.assertEquals(len(self._queue().in_flight), 10)
+
+        self.assertEquals(self.channel._get('celery')['n'], 10)
+        self.assertEquals(self.channel._get('celery')['n'], 11)
+        self.assertRaises(Empty, self.channel._get, 'celery')
+
+    def test_delete_after_ack(self):
+        self._write(3)
+        for i in xrange(3):
+            self.channel._get('celery')
+
+        self._ack(0, 1)
+        # nothing is deleted while some of the batch is still running
+        self.assertEquals(len(self._queue().in_flight), 3)
+        self.assertEquals(self.client.calls, [
+            ('receive', 10, amazonsqs.WAIT_TIME_SECONDS),
+        ])
+
+        self._ack(2)
+        self.assertEquals(self._queue().in_flight, [])
+        self.assertEquals(self.client.calls[1:], [('delete_batch', 3)])
+
+    def test_unacked_messages_come_back(self):
+        self._write(2)
+        self.channel._get('celery')
+        self.channel._get('celery')
+        self._ack(0)
+
+        # the worker dies, SQS hands out the message it didn't ack again
+        self._queue().time_out()
+        self.channel._prefetched.clear()
+        self.assertEquals(self.channel._get('celery')['n'], 1)
+
+    def test_message_without_delivery_tag(self):
+        queue = self._queue()
+        queue.write(queue.new_message(amazonsqs.serialize({'n': 1})))
+        self.assertEquals(self.channel._get('celery')['n'], 1)
+        # nothing will ack it, so it's deleted right away
+        self.assertEquals(queue.in_flight, [])
+
+    def test_size_includes_prefetched(self):
+        self._write(12)
+        self.channel._get('celery')
+        self.assertEquals(self.channel._size('celery'), 11)
+
+        self.channel._purge('celery')
+        self.assertEquals(self.channel._size('celery'), 0)
+        self.assertRaises(Empty, self.channel._get, 'celery')
+
+    def test_put(self):
+        self.channel._put('celery', {'n': 1})
+        self.assertEquals(self._queue().count(), 1)
+        self.assertEquals(self.client.calls, [])
+
+    def test_batch_publish(self):
+        with amazonsqs.batch_publish():
+            for i in xrange(25):
+                self.channel._put('celery', {'n': i})
+            # full batches go out right away
+            self.assertEquals(self._queue().count(), 20)
+
+        self.assertEquals(self._queue().count(), 25)
+        self.assertEquals(self.client.calls, [
+            ('send_batch', 10),
+            ('send_batch', 10),
+            ('send_batch', 5),
+        ])
+        received = [self.channel._get('celery')['n'] for i in xrange(25)]
+        self.assertEquals(received, range(25))
+
+    def test_batch_publish_retries_failed_entries(self):
+        self.client.failing_sends.add(amazonsqs.serialize({'n': 1}))
+        with amazonsqs.batch_publish():
+            for i in xrange(3):
+                self.channel._put('celery', {'n': i})
+
+        self.assertEquals(self._queue().count(), 3)
+
+    def test_batch_publish_falls_back_to_single_sends(self):
+        self.client.fail_batches = True
+        with amazonsqs.batch_publish():
+            for i in xrange(3):
+                self.channel._put('celery', {'n': i})
+
+        self.assertEquals(self._queue().count(), 3)
+        received = [self.channel._get('celery')['n'] for i in xrange(3)]
+        self.assertEquals(received, range(3))
+
+    def test_batch_publish_flushes_every_channel(self):
+        other = self.connection.channel()
+        def fail():
+            raise IOError('boom')
+        self.channel.flush_puts = fail
+        try:
+            with amazonsqs.batch_publish():
+                self.channel._put('celery', {'n': 1})
+                other._put('celery', {'n': 2})
+        except IOError:
+            pass
+        else:
+            self.fail('the flush error should be raised')
+
+        # the other channel was still flushed
+        self.assertEquals(other._get_queue('celery').count(), 1)
@@ -59,3 +59,32 @@ class TestMetadataManager(TestCase):
 
         make_subtitle_version(sl_fr, subtitles=[(100, 200, 'bar')])
         _assert_count(2)
+
+    def test_update_many(self):
+        video_1 = get_video(1)
+        video_2 = get_video(2)
+        Video.objects.filter(pk__in=[video_1.pk, video_2.pk]).update(
+            primary_audio_language_code='en')
+
+        sl_en = make_subtitle_language(video_1, 'en')
+        sl_en.subtitles_complete = True
+        sl_en.save()
+        make_subtitle_version(sl_en, subtitles=[(100, 200, 'foo')])
+        sl_fr = make_subtitle_language(video_2, 'fr')
+        make_subtitle_version(sl_fr, subtitles=[(100, 200, 'bar')])
+
+        updated = metadata_manager.update_metadata_many(
+            [video_1.pk, video_2.pk])
+        self.assertEqual(updated, 2)
+
+        video_1 = Video.objects.get(pk=video_1.pk)
+        self.assertEqual(video_1.languages_count, 1)
+        self.assertTrue(video_1.is_subtitled)
+        self.assertTrue(video_1.was_subtitled)
+        self.assertNotEqual(video_1.complete_date, None)
+
+        video_2 = Video.objects.get(pk=video_2.pk)
+        self.assertEqual(video_2.languages_count, 1)
+        self.assertFalse(video_2.is_subtitled)
+        self.assertFalse(video_2.was_subtitled)
+        self.assertEqual(video_2.complete_date, None)
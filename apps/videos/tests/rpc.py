@@ -20,7 +20,7 @@
 from django.test import TestCase
 
 from apps.auth.models import CustomUser as User
-from apps.videos.rpc import VideosApiClass
+from apps.videos.rpc import SearchListing, VideosApiClass
 from apps.videos.models import Video, Action
 
 
@@ -45,3 +45,45 @@ class RpcTest(TestCase):
         except Action.DoesNotExist:
             self.fail()
 
+
+
+class FakeSearchQuerySet(object):
+    """Counts the search requests slicing/counting would send to Solr."""
+    def __init__(self, items, requests):
+        self.items = items
+        self.requests = requests
+
+    def _clone(self):
+        return FakeSearchQuerySet(self.items, self.requests)
+
+    def __getitem__(self, k):
+        self.requests.append((k.start, k.stop))
+        return self.items[k]
+
+    def __len__(self):
+        return len(self.items)
+
+    def count(self):
+        self.requests.append('count')
+        return len(self.items)
+
+class SearchListingTest(TestCase):
+    def setUp(self):
+        self.requests = []
+        self.listing = SearchListing(
+            FakeSearchQuerySet(range(5), self.requests),
+            FakeSearchQuerySet(range(100, 120), self.requests))
+
+    def test_first_source(self):
+        self.assertEquals(self.listing.get_page(0, 4), ([0, 1, 2, 3], 25))
+        self.assertEquals(self.requests, [(0, 4), 'count'])
+
+    def test_spanning_page(self):
+        self.assertEquals(self.listing.get_page(4, 4),
+                          ([4, 100, 101, 102], 25))
+        self.assertEquals(self.requests, [(4, 8), (0, 3)])
+
+    def test_second_source(self):
+        self.assertEquals(self.listing.get_page(8, 4),
+                          ([103, 104, 105, 106], 25))
+        self.assertEquals(self.requests, [(8, 12), (3, 7)])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from django.test import TestCase
+
+from apps.videos.search_indexes import VideoIndex
+from apps.videos.models import Video
+from subtitles.models import Collaborator
+from subtitles.pipeline import add_subtitles
+from utils import test_factories
+
+
+class VideoIndexTest(TestCase):
+    def setUp(self):
+        self.index = VideoIndex(Video)
+        users = [test_factories.create_user() for i in xrange(3)]
+        self.videos = [test_factories.create_video() for i in xrange(3)]
+        subs = [(0, 1000, 'Hello'), (1000, 2000, 'world')]
+
+        en = add_subtitles(self.videos[0], 'en', subs, author=users[0],
+                           complete=True).subtitle_language
+        fr = add_subtitles(self.videos[0], 'fr', subs,
+                           author=users[1]).subtitle_language
+        de = add_subtitles(self.videos[1], 'de', subs, author=users[0],
+                           complete=True).subtitle_language
+        # several followers per language, some of them on more than one
+        # language and video, and collaborators on top
+        for user in users:
+            en.followers.add(user)
+        fr.followers.add(users[0])
+        de.followers.add(users[0], users[2])
+        Collaborator.objects.create(user=users[1], subtitle_language=en)
+        Collaborator.objects.create(user=users[2], subtitle_language=en)
+        Collaborator.objects.create(user=users[2], subtitle_language=fr)
+
+    def test_prepare_batch(self):
+        one_by_one = [self.index.prepare(v) for v in self.videos]
+
+        self.index.prepare_batch(self.videos)
+        batched = [self.index.prepare(v) for v in self.videos]
+
+        self.assertEquals(batched, one_by_one)
+        self.assertEquals(self.index._prefetched, {})
+
+    def test_counts(self):
+        prepared = dict((v.pk, self.index.prepare(v)) for v in self.videos)
+        first, second, third = [prepared[v.pk] for v in self.videos]
+
+        self.assertEquals(sorted(first['languages']), ['en', 'fr'])
+        self.assertEquals(first['languages_count'], 2)
+        self.assertEquals(second['languages'], ['de'])
+        self.assertEquals(third['languages_count'], 0)
+        self.assertEquals(third['contributors_count'], 0)
+        # every follower and collaborator of the video counted once, like
+        # the per-video queries prepare() used to run
+        video = self.videos[0]
+        collaborators = (Collaborator.objects.filter(subtitle_language__video=video)
+                                             .values('user').distinct().count())
+        followers = (video.newsubtitlelanguage_set.values('followers')
+                                                  .distinct().count())
+        self.assertEquals(first['contributors_count'], collaborators + followers)
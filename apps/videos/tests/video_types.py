@@ -18,7 +18,12 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 import datetime
+import socket
+import threading
+import time
 
+import mock
+import requests
 from django.test import TestCase
 
 from babelsubs.storage import SubtitleLine, SubtitleSet
@@ -37,9 +42,11 @@ from apps.videos.types.flv import FLVVideoType
 from apps.videos.types.htmlfive import HtmlFiveVideoType
 from apps.videos.types.mp3 import Mp3VideoType
 from apps.videos.types.vimeo import VimeoVideoType
+from apps.videos.types import youtube
 from apps.videos.types.youtube import (
-    YoutubeVideoType, save_subtitles_for_lang,
-    _prepare_subtitle_data_for_version, add_credit, should_add_credit
+    YoutubeVideoType, YouTubeFetcher, TooManyRecentCallsException,
+    save_subtitles_for_lang, _prepare_subtitle_data_for_version, add_credit,
+    should_add_credit
 )
 from utils import test_utils
 
@@ -137,6 +144,165 @@ class YoutubeVideoTypeTest(TestCase):
         self.assertEquals('', t)
         self.assertEquals('en', code)
 
+class FakeQuota(object):
+    def __init__(self):
+        self.acquired = 0
+        self.paused = None
+        self.available = True
+
+    def acquire(self, timeout=None):
+        self.acquired += 1
+        return self.available
+
+    def pause(self, seconds):
+        self.paused = seconds
+
+class FakeResponse(object):
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+class FakeYouTubeSession(object):
+    """Stands in for the requests session, answers from a dict of urls."""
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        with self.lock:
+            self.requested.append(url)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        if url not in self.responses:
+            raise requests.exceptions.ConnectionError("connection refused")
+        return FakeResponse(*self.responses[url])
+
+class YouTubeFetcherTest(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.quota = FakeQuota()
+        self.srt = "1\r\n00:00:00,000 --> 00:00:01,000\r\nHi\r\n"
+        self.urls = ['http://youtube.test/%s' % i for i in xrange(6)]
+        responses = dict((url, (200, self.srt)) for url in self.urls)
+        responses[self.urls[2]] = (404, 'Not found')
+        del responses[self.urls[3]]
+        self.session = FakeYouTubeSession(responses)
+        self.fetcher = YouTubeFetcher(quota=self.quota, concurrency=3,
+                                      session=self.session)
+
+    def test_fetch_many(self):
+        responses = self.fetcher.fetch_many(self.urls)
+        self.assertEquals(len(responses), 6)
+        self.assertEquals(responses[0].content, self.srt)
+        self.assertEquals(responses[2].status_code, 404)
+        self.assertEquals(responses[3], None)
+
+        self.assertEquals(sorted(self.session.requested), self.urls)
+        self.assertEquals(self.quota.acquired, 6)
+        self.assert_(1 < self.session.max_running <= 3)
+
+    def test_too_many_recent_calls(self):
+        url = 'http://youtube.test/quota'
+        self.session.responses[url] = (403, '<error>too_many_recent_calls</error>')
+        self.assertRaises(TooManyRecentCallsException, self.fetcher.get, url)
+        self.assertEquals(self.quota.paused, youtube.YOUTUBE_API_PAUSE)
+
+    def test_save_subtitles(self):
+        video = Video.objects.all()[0]
+        langs = [
+            {'lang_code': 'en', 'name': ''},
+            {'lang_code': 'fr', 'name': ''},
+            {'lang_code': 'xx-unknown', 'name': ''},
+        ]
+        self.session.responses = dict(
+            (youtube._subtitles_url(lang, 'abc'), (200, self.srt))
+            for lang in langs)
+
+        old_fetcher, youtube.fetcher = youtube.fetcher, self.fetcher
+        try:
+            youtube.save_subtitles.run(langs, video.pk, 'abc')
+        finally:
+            youtube.fetcher = old_fetcher
+
+        # unsupported languages aren't fetched
+        self.assertEquals(len(self.session.requested), 2)
+        for language_code in ('en', 'fr'):
+            sl = video.subtitle_language(language_code)
+            self.assertEquals(len(sl.get_tip().get_subtitles()), 1)
+
+    def test_save_subtitles_failure(self):
+        video = Video.objects.all()[0]
+        langs = [{'lang_code': 'en', 'name': ''}, {'lang_code': 'fr', 'name': ''}]
+        self.session.responses = dict(
+            (youtube._subtitles_url(lang, 'abc'), (200, self.srt))
+            for lang in langs)
+        saved = []
+        def save(video, lc, content):
+            if lc == 'en':
+                raise ValueError("broken track")
+            saved.append(lc)
+
+        old_fetcher, youtube.fetcher = youtube.fetcher, self.fetcher
+        try:
+            with mock.patch('apps.videos.types.youtube._save_subtitles', save):
+                youtube.save_subtitles.run(langs, video.pk, 'abc')
+        finally:
+            youtube.fetcher = old_fetcher
+        self.assertEquals(saved, ['fr'])
+
+    def test_get_entry_errors(self):
+        get_entry = youtube.get_video_entry
+        old_fetcher, youtube.fetcher = youtube.fetcher, self.fetcher
+        try:
+            self.quota.available = False
+            self.assertRaises(VideoTypeError, get_entry, 'abc')
+
+            # nothing answers in the fake session
+            self.quota.available = True
+            self.assertRaises(VideoTypeError, get_entry, 'abc')
+        finally:
+            youtube.fetcher = old_fetcher
+
+class GDataConnectionReuseTest(TestCase):
+    def setUp(self):
+        import atom.http_core
+        self.client = atom.http_core.HttpClient()
+        self.uri = atom.http_core.Uri.parse_uri('http://gdata.test/feeds')
+        self.key = (self.uri.scheme, self.uri.host, self.uri.port)
+        # pretend we already talked to that server
+        youtube._connections.pool = {self.key: (mock.Mock(), None)}
+        self.sent = []
+
+    def tearDown(self):
+        youtube._connections.pool = {}
+
+    def _send_request(self, client, method, uri, headers, body_parts):
+        client._get_connection(uri)
+        self.sent.append(method)
+        if len(self.sent) == 1:
+            raise socket.error('connection reset by peer')
+        return mock.Mock()
+
+    def _request(self, method):
+        send = lambda *args: self._send_request(self.client, *args)
+        with mock.patch.object(self.client, '_send_request', send):
+            return self.client._http_request(method, self.uri, {}, [])
+
+    def test_get_is_retried(self):
+        self._request('GET')
+        self.assertEquals(self.sent, ['GET', 'GET'])
+
+    def test_upload_isnt_retried(self):
+        self.assertRaises(socket.error, self._request, 'POST')
+        self.assertEquals(self.sent, ['POST'])
+
 class HtmlFiveVideoTypeTest(TestCase):
     def setUp(self):
         self.vt = HtmlFiveVideoType
@@ -323,6 +489,50 @@ class VideoTypeRegistrarTest(TestCase):
         self.assertRaises(VideoTypeError, video_type_registrar.video_type_for_url,
                           'http://youtube.com/v=100500')
 
+    def test_candidate_types(self):
+        registrar = VideoTypeRegistrar()
+
+        class ExampleVideoType(VideoType):
+            abbreviation = 'example'
+            name = 'Example'
+            url_domains = ('example.com',)
+
+        class AnyHostVideoType(VideoType):
+            abbreviation = 'any'
+            name = 'Any'
+
+        registrar.register(AnyHostVideoType)
+        registrar.register(ExampleVideoType)
+        self.assertEqual(
+            registrar.candidate_types('http://videos.Example.com:80/1'),
+            [ExampleVideoType, AnyHostVideoType])
+        self.assertEqual(registrar.candidate_types('http://notexample.com/1'),
+                         [AnyHostVideoType])
+
+    def test_url_cache(self):
+        registrar = VideoTypeRegistrar()
+        calls = []
+
+        class CountingVideoType(VideoType):
+            abbreviation = 'counting'
+            name = 'Counting'
+
+            @classmethod
+            def matches_video_url(cls, url):
+                calls.append(url)
+                return url.endswith('.mp4')
+
+        registrar.register(CountingVideoType)
+        for i in xrange(3):
+            vt = registrar.video_type_for_url('http://example.com/a.mp4')
+            self.assertTrue(isinstance(vt, CountingVideoType))
+        self.assertEqual(len(calls), 1)
+
+        # misses aren't remembered
+        registrar.video_type_for_url('http://example.com/a.txt')
+        registrar.video_type_for_url('http://example.com/a.txt')
+        self.assertEqual(len(calls), 3)
+
 class BrightcoveVideoTypeTest(TestCase):
     def setUp(self):
         self.vt = BrightcoveVideoType
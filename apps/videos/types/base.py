@@ -16,13 +16,20 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import threading
+from collections import OrderedDict
 from urlparse import urlparse
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
 class VideoType(object):
 
     abbreviation = None
     name = None    
+    # Domains this type handles urls for, subdomains included.  Types that
+    # leave it empty are tried for urls on any host, after the others.
+    url_domains = ()
 
     CAN_IMPORT_SUBTITLES = False
 
@@ -62,6 +69,13 @@ class VideoType(object):
         parsed_url = urlparse(url.strip())
         return '%s://%s%s' % (parsed_url.scheme or 'http', parsed_url.netloc, parsed_url.path)    
     
+# How many url -> video type results video_type_for_url remembers
+URL_CACHE_SIZE = getattr(settings, 'VIDEO_TYPE_URL_CACHE_SIZE', 10000)
+
+def _hostname(url):
+    netloc = urlparse(url.strip()).netloc.lower()
+    return netloc.rsplit('@', 1)[-1].split(':', 1)[0]
+
 class VideoTypeRegistrar(dict):
     
     domains = []
@@ -69,17 +83,64 @@ class VideoTypeRegistrar(dict):
     def __init__(self, *args, **kwargs):
         super(VideoTypeRegistrar, self).__init__(*args, **kwargs)
         self.choices = []
+        # domain -> video types, see VideoType.url_domains
+        self.types_by_domain = {}
+        self.generic_types = []
+        self._url_cache = OrderedDict()
+        self._url_cache_lock = threading.Lock()
         
     def register(self, video_type):
         self[video_type.abbreviation] = video_type
         self.choices.append((video_type.abbreviation, video_type.name))
         domain = getattr(video_type, 'site', None)
         domain and self.domains.append(domain)
+        if video_type.url_domains:
+            for domain in video_type.url_domains:
+                self.types_by_domain.setdefault(domain, []).append(video_type)
+        else:
+            self.generic_types.append(video_type)
+        self._url_cache.clear()
+
+    def candidate_types(self, url):
+        """Return the video types that might handle url, in order.
+
+        Those that claim the url's host or one of its parent domains come
+        first, then the ones that work on any host.
+        """
+        candidates = []
+        parts = _hostname(url).split('.')
+        for i in xrange(len(parts)):
+            for video_type in self.types_by_domain.get('.'.join(parts[i:]), ()):
+                if video_type not in candidates:
+                    candidates.append(video_type)
+        return candidates + self.generic_types
+
+    def _find_type(self, url):
+        with self._url_cache_lock:
+            video_type = self._url_cache.pop(url, None)
+            if video_type is not None:
+                # move it to the end, it's the most recently used now
+                self._url_cache[url] = video_type
+                return video_type
+
+        for video_type in self.candidate_types(url):
+            if video_type.matches_video_url(url):
+                break
+        else:
+            # Misses aren't cached, matching can depend on remote services
+            # (dailymotion) that could be down right now.
+            return None
+
+        with self._url_cache_lock:
+            self._url_cache[url] = video_type
+            if len(self._url_cache) > URL_CACHE_SIZE:
+                self._url_cache.popitem(last=False)
+        return video_type
         
     def video_type_for_url(self, url):
-        for video_type in self.itervalues():
-            if video_type.matches_video_url(url):
-                return video_type(url)
+        video_type = self._find_type(url)
+        if video_type is not None:
+            return video_type(url)
             
 class VideoTypeError(Exception):
     pass
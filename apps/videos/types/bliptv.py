@@ -28,6 +28,7 @@ import re
 class BlipTvVideoType(VideoType):
 
     abbreviation = 'B'
+    url_domains = ('blip.tv',)
     name = 'Blip.tv'  
     site = 'blip.tv'
 
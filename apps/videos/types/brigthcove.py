@@ -38,6 +38,7 @@ BRIGHTCOVE_REGEXES = [re.compile(x) for x in BRIGHTCOVE_REGEXES]
 class BrightcoveVideoType(VideoType):
 
     abbreviation = 'C'
+    url_domains = ('brightcove.com', 'bcove.me')
     name = 'Brightcove'   
     site = 'brightcove.com'
     js_url = "http://admin.brightcove.com/js/BrightcoveExperiences_all.js"
@@ -28,6 +28,7 @@ DAILYMOTION_REGEX = re.compile(r'https?://(?:[^/]+[.])?dailymotion.com/video/(?P
 class DailymotionVideoType(VideoType):
 
     abbreviation = 'D'
+    url_domains = ('dailymotion.com',)
     name = 'dailymotion.com'
     site = 'dailymotion.com'
 
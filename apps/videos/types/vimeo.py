@@ -28,6 +28,7 @@ vimeo.VIMEO_API_SECRET = getattr(settings, 'VIMEO_API_SECRET')
 class VimeoVideoType(VideoType):
 
     abbreviation = 'V'
+    url_domains = ('vimeo.com',)
     name = 'Vimeo.com'   
     site = 'vimeo.com'
     
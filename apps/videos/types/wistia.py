@@ -28,6 +28,7 @@ from django.utils.html import strip_tags
 class WistiaVideoType(VideoType):
 
     abbreviation = 'W'
+    url_domains = ('wistia.com', 'wi.st', 'wistia.net')
     name = 'Wistia.com'   
     site = 'wistia.com'
     linkurl = None
@@ -16,7 +16,9 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 import logging
+import os
 import re
+from multiprocessing.pool import ThreadPool
 from urlparse import urlparse
 import babelsubs
 import requests
@@ -24,18 +26,19 @@ import requests
 import gdata.youtube.client
 from gdata.youtube.client import YouTubeError
 import httplib
-import httplib2
+import socket
+import threading
 from celery.task import task
 from django.conf import settings
 from django.utils.http import urlquote
 from django.utils.translation import ugettext_lazy as _
-from gdata.service import RequestError
 from gdata.youtube.service import YouTubeService
 from lxml import etree
 
 from base import VideoType, VideoTypeError
 from utils.translation import SUPPORTED_LANGUAGE_CODES
 from utils.metrics import Meter, Occurrence
+from utils.rate_limit import RateLimiter
 
 from unilangs import LanguageCode
 
@@ -45,6 +48,16 @@ logger = logging.getLogger("youtube")
 YOUTUBE_API_SECRET  = getattr(settings, "YOUTUBE_API_SECRET", None)
 YOUTUBE_ALWAYS_PUSH_USERNAME = getattr(settings,
     'YOUTUBE_ALWAYS_PUSH_USERNAME', None)
+# API calls per second, for all the workers together
+YOUTUBE_API_RATE = getattr(settings, 'YOUTUBE_API_RATE', 10)
+# how long everyone stops calling after a too_many_recent_calls
+YOUTUBE_API_PAUSE = getattr(settings, 'YOUTUBE_API_PAUSE', 30)
+# how long a call waits for the quota before giving up
+YOUTUBE_API_WAIT = getattr(settings, 'YOUTUBE_API_WAIT', 60)
+# same, for the calls made while a user waits on a web request
+YOUTUBE_API_REQUEST_WAIT = getattr(settings, 'YOUTUBE_API_REQUEST_WAIT', 2)
+YOUTUBE_FETCH_CONCURRENCY = getattr(settings, 'YOUTUBE_FETCH_CONCURRENCY', 4)
+YOUTUBE_FETCH_TIMEOUT = getattr(settings, 'YOUTUBE_FETCH_TIMEOUT', 20)
 
 
 _('Private video')
@@ -75,6 +88,9 @@ def monkeypatch_class(name, bases, namespace):
             setattr(base, name, value)
     return base
 
+# keep-alive connections of the gdata clients, see HttpClient._get_connection
+_connections = threading.local()
+
 class HttpClient(atom.http_core.HttpClient):
     __metaclass__ = monkeypatch_class
     debug = None
@@ -84,13 +100,28 @@ class HttpClient(atom.http_core.HttpClient):
                               http_request.headers, http_request._body_parts)
 
     def _get_connection(self, uri, headers=None):
-        """Opens a socket connection to the server to set up an HTTP request.
+        """Returns a keep-alive connection to the server for an HTTP request.
+
+        Connections are kept per thread and per (scheme, host, port), so the
+        requests of a task to the same server go over the same socket.
 
         Args:
         uri: The full URL for the request as a Uri object.
         headers: A dict of string pairs containing the HTTP headers for the
             request.
         """
+        pool = getattr(_connections, 'pool', None)
+        if pool is None:
+            pool = _connections.pool = {}
+        key = (uri.scheme, uri.host, uri.port)
+
+        if key in pool:
+            connection, response = pool[key]
+            # nobody read the last response, the socket can't be reused
+            if response is not None and not response.isclosed():
+                connection.close()
+            return connection
+
         connection = None
         if uri.scheme == 'https':
             if not uri.port:
@@ -102,8 +133,14 @@ class HttpClient(atom.http_core.HttpClient):
                 connection = httplib.HTTPConnection(uri.host)
             else:
                 connection = httplib.HTTPConnection(uri.host, int(uri.port))
+        pool[key] = (connection, None)
         return connection
 
+    def _drop_connection(self, uri):
+        pooled = _connections.pool.pop((uri.scheme, uri.host, uri.port), None)
+        if pooled is not None:
+            pooled[0].close()
+
     def _http_request(self, method, uri, headers=None, body_parts=None):
         """Makes an HTTP request using httplib.
 
@@ -134,6 +171,24 @@ class HttpClient(atom.http_core.HttpClient):
         if isinstance(uri, (str, unicode)):
             uri = Uri.parse_uri(uri)
 
+        key = (uri.scheme, uri.host, uri.port)
+        reused = key in getattr(_connections, 'pool', {})
+        try:
+            response = self._send_request(method, uri, headers, body_parts)
+        except (httplib.HTTPException, socket.error):
+            self._drop_connection(uri)
+            # The server may have closed the kept-alive connection in the
+            # meantime, try once more on a new one.  Only for requests that
+            # are safe to repeat: an upload may have gone through before the
+            # error.
+            if not reused or method not in ('GET', 'HEAD'):
+                raise
+            response = self._send_request(method, uri, headers, body_parts)
+
+        _connections.pool[key] = (_connections.pool[key][0], response)
+        return response
+
+    def _send_request(self, method, uri, headers, body_parts):
         connection = self._get_connection(uri, headers=headers)
 
         if self.debug:
@@ -207,15 +262,113 @@ def get_youtube_service():
 
 yt_service = get_youtube_service()
 
+# Shared by every process that talks to the YouTube API.
+youtube_quota = RateLimiter('youtube-api', rate=YOUTUBE_API_RATE)
 
-@task
-def save_subtitles_for_lang(lang, video_pk, youtube_id):
-    from django.utils.encoding import force_unicode
-    from videos.models import Video
-    from videos.tasks import video_changed_tasks
-    from subtitles.pipeline import add_subtitles
-    from subtitles.models import ORIGIN_IMPORTED
+def wait_for_quota(quota=None, wait=YOUTUBE_API_WAIT):
+    """Wait until we can make an API call."""
+    if not (quota or youtube_quota).acquire(timeout=wait):
+        raise TooManyRecentCallsException('timed out waiting for quota')
+    Meter('youtube.api_request').inc()
 
+def is_too_many_recent_calls(status_code, content):
+    return status_code == 403 and 'too_many_recent_calls' in (content or '')
+
+
+class YouTubeFetcher(object):
+    """GETs YouTube urls within our API quota.
+
+    Requests go over a requests session per process, which keeps the
+    connections to YouTube alive between calls.  fetch_many() runs up to
+    concurrency requests at a time.
+    """
+
+    def __init__(self, quota=None, concurrency=YOUTUBE_FETCH_CONCURRENCY,
+                 session=None):
+        self.quota = quota
+        self.concurrency = concurrency
+        self._session = session
+        self._session_pid = None
+
+    @property
+    def session(self):
+        if self._session is None or (self._session_pid is not None and
+                                     self._session_pid != os.getpid()):
+            self._session = requests.session(config={
+                'pool_maxsize': self.concurrency,
+            })
+            self._session_pid = os.getpid()
+        return self._session
+
+    def get(self, url, headers=None, wait=YOUTUBE_API_WAIT):
+        """GET a url, returns the response.
+
+        Raises TooManyRecentCallsException if we can't get quota within wait
+        seconds or YouTube says we're going too fast, in which case everyone
+        backs off for YOUTUBE_API_PAUSE seconds.
+        """
+        quota = self.quota or youtube_quota
+        wait_for_quota(quota, wait)
+
+        response = self.session.get(url, headers=headers or {},
+                                    timeout=YOUTUBE_FETCH_TIMEOUT)
+        if is_too_many_recent_calls(response.status_code, response.content):
+            quota.pause(YOUTUBE_API_PAUSE)
+            raise TooManyRecentCallsException(url, response.status_code)
+        return response
+
+    def _get_or_none(self, url):
+        try:
+            return self.get(url)
+        except Exception:
+            logger.exception("Youtube request failed", extra={
+                'data': {"url": url}})
+            return None
+
+    def fetch_many(self, urls):
+        """GET urls concurrently.
+
+        Returns the responses in the same order, None for the urls that
+        failed.
+        """
+        if len(urls) <= 1:
+            return [self._get_or_none(url) for url in urls]
+        pool = ThreadPool(min(self.concurrency, len(urls)))
+        try:
+            return pool.map(self._get_or_none, urls)
+        finally:
+            pool.close()
+            pool.join()
+
+fetcher = YouTubeFetcher()
+
+def get_video_entry(video_id):
+    """Fetch the gdata entry of a video, raises VideoTypeError if we can't."""
+    url = 'http://gdata.youtube.com/feeds/api/videos/%s' % video_id
+    headers = {}
+    if YOUTUBE_API_SECRET:
+        headers['X-GData-Key'] = 'key=%s' % YOUTUBE_API_SECRET
+    # This runs while users wait on the page that adds the video, so
+    # don't hold them for long and give them a form error rather than
+    # a 500 when YouTube can't be reached.
+    try:
+        response = fetcher.get(url, headers=headers,
+                               wait=YOUTUBE_API_REQUEST_WAIT)
+    except TooManyRecentCallsException:
+        raise VideoTypeError('Youtube error: too many requests, '
+                             'please try again later')
+    except requests.exceptions.RequestException, e:
+        raise VideoTypeError('Youtube error: %s' % e)
+    if response.status_code != 200:
+        err = response.content or 'Undefined error'
+        raise VideoTypeError('Youtube error: %s' % err)
+    return gdata.youtube.YouTubeVideoEntryFromString(response.content)
+
+
+def _subtitles_language_code(lang, youtube_id):
+    """Returns our language code for a track YouTube lists, None if we don't
+    support it.
+    """
     yt_lc = lang.get('lang_code')
 
     # TODO: Make sure we can store all language data given to us by Youtube.
@@ -229,7 +382,7 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
                 "youtube_id": youtube_id,
             }
         })
-        return
+        return None
 
     if not lc in SUPPORTED_LANGUAGE_CODES:
         logger.warn("Youtube import did not find language code", extra={
@@ -238,22 +391,21 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
                 "youtube_id": youtube_id,
             }
         })
-        return
-
-    try:
-        video = Video.objects.get(pk=video_pk)
-    except Video.DoesNotExist:
-        return
+        return None
+    return lc
 
+def _subtitles_url(lang, youtube_id):
     url = u'http://www.youtube.com/api/timedtext?v=%s&lang=%s&name=%s&fmt=srt'
-    url = url % (youtube_id, yt_lc, urlquote(lang.get('name', u'')))
-
-    xml = YoutubeVideoType._get_response_from_youtube(url, return_string=True)
+    return url % (youtube_id, lang.get('lang_code'),
+                  urlquote(lang.get('name', u'')))
 
-    if not bool(xml):
-        return
+def _save_subtitles(video, lc, content):
+    from django.utils.encoding import force_unicode
+    from videos.tasks import video_changed_tasks
+    from subtitles.pipeline import add_subtitles
+    from subtitles.models import ORIGIN_IMPORTED
 
-    xml = force_unicode(xml, 'utf-8')
+    xml = force_unicode(content, 'utf-8')
 
     subs = babelsubs.parsers.discover('srt').parse(xml).to_internal()
     version = add_subtitles(video, lc, subs, note="From youtube", complete=True, origin=ORIGIN_IMPORTED)
@@ -269,6 +421,46 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
     # when the video is already part of a team
     BillingRecord.objects.insert_record(version)
 
+@task
+def save_subtitles(langs, video_pk, youtube_id):
+    """Import the subtitles YouTube has for a video.
+
+    The tracks are downloaded concurrently, then saved one by one.
+    """
+    from videos.models import Video
+
+    to_fetch = []
+    for lang in langs:
+        lc = _subtitles_language_code(lang, youtube_id)
+        if lc is not None:
+            to_fetch.append((lc, _subtitles_url(lang, youtube_id)))
+    if not to_fetch:
+        return
+
+    try:
+        video = Video.objects.get(pk=video_pk)
+    except Video.DoesNotExist:
+        return
+
+    responses = fetcher.fetch_many([url for lc, url in to_fetch])
+    for (lc, url), response in zip(to_fetch, responses):
+        if response is None:
+            continue
+        content = YoutubeVideoType._check_response(
+            url, response.status_code, response.content, return_string=True)
+        if not content:
+            continue
+        # a failure on one track shouldn't lose the others
+        try:
+            _save_subtitles(video, lc, content)
+        except Exception:
+            logger.exception("Youtube subtitles import failed", extra={
+                'data': {"url": url, "language_code": lc}})
+
+@task
+def save_subtitles_for_lang(lang, video_pk, youtube_id):
+    save_subtitles.run([lang], video_pk, youtube_id)
+
 
 def should_add_credit(subtitle_version=None, video=None):
     # Only add credit to non-team videos
@@ -329,6 +521,7 @@ class YoutubeVideoType(VideoType):
     HOSTNAMES = ( "youtube.com", "youtu.be", "www.youtube.com",)
 
     abbreviation = 'Y'
+    url_domains = ('youtube.com', 'youtu.be')
     name = 'Youtube'
     site = 'youtube.com'
 
@@ -398,12 +591,7 @@ class YoutubeVideoType(VideoType):
         return video_obj
 
     def _get_entry(self, video_id):
-        Meter('youtube.api_request').inc()
-        try:
-            return yt_service.GetYouTubeVideoEntry(video_id=str(video_id))
-        except RequestError, e:
-            err = e[0].get('body', 'Undefined error')
-            raise VideoTypeError('Youtube error: %s' % err)
+        return get_video_entry(video_id)
 
     @classmethod
     def url_from_id(cls, video_id):
@@ -419,15 +607,19 @@ class YoutubeVideoType(VideoType):
         return False
 
     @classmethod
-    def _get_response_from_youtube(cls, url, return_string=False):
-        h = httplib2.Http()
-        resp, content = h.request(url, "GET")
+    def _get_response_from_youtube(cls, url, return_string=False,
+                                   wait=YOUTUBE_API_WAIT):
+        response = fetcher.get(url, wait=wait)
+        return cls._check_response(url, response.status_code,
+                                   response.content, return_string)
 
-        if resp.status < 200 or resp.status >= 400:
+    @classmethod
+    def _check_response(cls, url, status_code, content, return_string=False):
+        if status_code < 200 or status_code >= 400:
             logger.error("Youtube subtitles error", extra={
                     'data': {
                         "url": url,
-                        "status_code": resp.status,
+                        "status_code": status_code,
                         "response": content
                         }
                     })
@@ -448,7 +640,9 @@ class YoutubeVideoType(VideoType):
 
     def get_subtitled_languages(self):
         url = "http://www.youtube.com/api/timedtext?type=list&v=%s" % self.video_id
-        xml = self._get_response_from_youtube(url)
+        # called from set_values, while users wait on the page adding the video
+        xml = self._get_response_from_youtube(url,
+                                              wait=YOUTUBE_API_REQUEST_WAIT)
 
         if  xml is None:
             return []
@@ -466,12 +660,12 @@ class YoutubeVideoType(VideoType):
     def get_subtitles(self, video_obj, async=True):
         langs = self.get_subtitled_languages()
 
+        if not langs:
+            return
         if async:
-            func = save_subtitles_for_lang.delay
+            save_subtitles.delay(langs, video_obj.pk, self.video_id)
         else:
-            func = save_subtitles_for_lang.run
-        for item in langs:
-            func(item, video_obj.pk, self.video_id)
+            save_subtitles.run(langs, video_obj.pk, self.video_id)
 
     def _get_bridge(self, third_party_account):
         # Because somehow Django's ORM is case insensitive on CharFields.
@@ -553,11 +747,12 @@ class YouTubeApiBridge(gdata.youtube.client.YouTubeClient):
         Override the very low-level request method to catch possible
         too_many_recent_calls errors.
         """
-        Meter('youtube.api_request').inc()
+        wait_for_quota()
         try:
             return super(YouTubeApiBridge, self).request(*args, **kwargs)
         except gdata.client.RequestError, e:
             if 'too_many_recent_calls' in str(e):
+                youtube_quota.pause(YOUTUBE_API_PAUSE)
                 raise TooManyRecentCallsException(e.headers, e.reason,
                         e.status, e.body)
             else:
@@ -719,7 +914,7 @@ class YouTubeApiBridge(gdata.youtube.client.YouTubeClient):
         return False
 
     def _make_update_request(self, uri, entry):
-        Meter('youtube.api_request').inc()
+        wait_for_quota()
         headers = {
             'Content-Type': 'application/atom+xml',
             'Authorization': 'Bearer %s' % self.access_token,
@@ -728,7 +923,8 @@ class YouTubeApiBridge(gdata.youtube.client.YouTubeClient):
         }
         r = requests.put(uri, data=entry, headers=headers)
 
-        if r.status_code == 403 and 'too_many_recent_calls' in r.content:
+        if is_too_many_recent_calls(r.status_code, r.content):
+            youtube_quota.pause(YOUTUBE_API_PAUSE)
             raise TooManyRecentCallsException(r.headers, r.raw)
 
         return r.status_code
@@ -48,6 +48,9 @@ from apps.auth.models import CustomUser as User
 from apps.statistic.models import EmailShareStatistic
 from apps.subtitles import models as sub_models
 from apps.subtitles.forms import SubtitlesUploadForm
+from apps.subtitles.language_status import (
+    get_language_status, incomplete_tasks_by_language
+)
 from apps.subtitles.pipeline import rollback_to
 from apps.teams.models import Task
 from apps.videos import permissions
@@ -67,6 +70,7 @@ from apps.videos.tasks import video_changed_tasks
 from apps.widget.views import base_widget_params
 from utils import send_templated_email
 from utils.basexconverter import base62
+from utils.celery_search_index import search_index_queue_depth
 from utils.decorators import never_in_prod
 from utils.metrics import Meter
 from utils.rpc import RpcRouter
@@ -84,20 +88,32 @@ rpc_router = RpcRouter('videos:rpc_router', {
 AVAILABLE_SUBTITLE_FORMATS_FOR_DISPLAY = [ 'dfxp',  'sbv', 'srt', 'ssa', 'txt']
 
 LanguageListItem = namedtuple("LanguageListItem", "name status tags url")
+LANGUAGE_NAMES = dict(sub_models.ALL_LANGUAGES)
 
 class LanguageList(object):
     """List of languages for the video pages."""
 
     def __init__(self, video):
+        team_video = video.get_team_video()
+        if team_video is not None:
+            tasks = incomplete_tasks_by_language(team_video)
+        else:
+            tasks = {}
+
         original_languages = []
         other_languages = []
-        for lang in video.newsubtitlelanguage_set.having_nonempty_versions():
-
-            item = LanguageListItem(lang.get_language_code_display(),
-                                    self._calc_status(lang),
-                                    self._calc_tags(lang),
-                                    lang.get_absolute_url())
-            if lang.language_code == video.primary_audio_language_code:
+        for status in get_language_status(video):
+            if not status['has_nonempty_versions']:
+                continue
+            language_code = status['language_code']
+            is_original = (language_code == video.primary_audio_language_code)
+
+            item = LanguageListItem(self._language_name(language_code),
+                                    self._calc_status(status),
+                                    self._calc_tags(status, is_original,
+                                                    tasks.get(language_code)),
+                                    self._language_url(video, status))
+            if is_original:
                 original_languages.append(item)
             else:
                 other_languages.append(item)
@@ -105,44 +121,47 @@ class LanguageList(object):
         other_languages.sort(key=lambda li: li.name)
         self.items = original_languages + other_languages
 
-    def _calc_status(self, lang):
-        if lang.subtitles_complete:
-            if lang.has_public_version():
+    def _language_name(self, language_code):
+        # same as SubtitleLanguage.get_language_code_display()
+        return force_unicode(LANGUAGE_NAMES.get(language_code, language_code))
+
+    def _language_url(self, video, status):
+        # same as SubtitleLanguage.get_absolute_url()
+        return reverse('videos:translation_history',
+                       args=[video.video_id,
+                             status['language_code'] or 'unknown',
+                             status['pk']])
+
+    def _calc_status(self, status):
+        if status['subtitles_complete']:
+            if status['has_public_version']:
                 return 'complete'
             else:
                 return 'needs-review'
         else:
-            if lang.is_synced(public=False):
+            if status['is_synced']:
                 return 'incomplete'
             else:
                 return 'needs-timing'
 
-    def _calc_tags(self, lang):
+    def _calc_tags(self, status, is_original, task):
         tags = []
-        if lang.is_primary_audio_language():
+        if is_original:
             tags.append(ugettext(u'original'))
 
-        team_video = lang.video.get_team_video()
-
-        if not lang.subtitles_complete:
+        if not status['subtitles_complete']:
             tags.append(ugettext(u'incomplete'))
-        elif team_video is not None:
+        elif task is not None:
             # subtiltes are complete, check if they are under review/approval.
-            incomplete_tasks = (Task.objects.incomplete()
-                                            .filter(team_video=team_video,
-                                                    language=lang.language_code))
-            for t in incomplete_tasks:
-                if t.type == Task.TYPE_IDS['Review']:
-                    tags.append(ugettext(u'needs review'))
-                    break
-                elif t.type == Task.TYPE_IDS['Approve']:
-                    tags.append(ugettext(u'needs approval'))
-                    break
-                else:
-                    # subtitles are complete, but there's a subtitle/translate
-                    # task for them.  They must have gotten sent back.
-                    tags.append(ugettext(u'needs editing'))
-                    break
+            task_type = task[0]
+            if task_type == Task.TYPE_IDS['Review']:
+                tags.append(ugettext(u'needs review'))
+            elif task_type == Task.TYPE_IDS['Approve']:
+                tags.append(ugettext(u'needs approval'))
+            else:
+                # subtitles are complete, but there's a subtitle/translate
+                # task for them.  They must have gotten sent back.
+                tags.append(ugettext(u'needs editing'))
         return tags
 
     def __iter__(self):
@@ -162,13 +181,9 @@ def index(request):
 
 def watch_page(request):
 
-    # Assume we're currently indexing if the number of public
-    # indexed vids differs from the count of video objects by
-    # more than 1000
-    is_indexing = cache.get('is_indexing')
-    if is_indexing is None:
-        is_indexing = Video.objects.all().count() - VideoIndex.public().count() > 1000
-        cache.set('is_indexing', is_indexing, 300)
+    # Assume we're currently indexing if more than 1000 videos are waiting
+    # in the search index update queue
+    is_indexing = search_index_queue_depth(Video) > 1000
 
     context = {
         'featured_videos': VideoIndex.get_featured_videos()[:VideoIndex.IN_ROW],
@@ -784,7 +799,7 @@ def reindex_video(request, video_id):
     team_video = video.get_team_video()
 
     if team_video:
-        update_one_team_video.delay(team_video.id)
+        update_one_team_video(team_video.id)
 
 def subscribe_to_updates(request):
     email_address = request.POST.get('email_address', '')
@@ -23,7 +23,8 @@ from django.db.models import Sum, Q
 from django.utils import translation
 from django.utils.translation import ugettext as _
 
-from statistic.tasks import st_widget_view_statistic_update
+from statistic import st_widget_view_statistic
+from statistic.buffer import counter_buffer
 from subtitles import models as new_models
 from teams.models import Task, Workflow, Team, BillingRecord
 from teams.moderation_const import APPROVED, UNMODERATED, WAITING_MODERATION
@@ -52,7 +53,7 @@ from widget.models import SubtitlingSession
 from libs.bulkops import insert_many
 
 from functools import partial
-from apps.subtitles import pipeline
+from apps.subtitles import language_status, pipeline
 from apps.subtitles.models import ORIGIN_LEGACY_EDITOR
 from babelsubs.storage import SubtitleSet, diff
 
@@ -102,10 +103,10 @@ class Rpc(BaseRpc):
 
 
     # Widget
-    def _check_visibility_policy_for_widget(self, request, video_id):
+    def _check_visibility_policy_for_widget(self, request, snapshot):
         """Return an error if the user cannot see the widget, None otherwise."""
 
-        visibility_policy = video_cache.get_visibility_policies(video_id)
+        visibility_policy = snapshot['visibility_policy']
 
         if not visibility_policy.get("is_public", True):
             team = Team.objects.get(id=visibility_policy['team_id'])
@@ -113,22 +114,20 @@ class Rpc(BaseRpc):
             if not team.is_member(request.user):
                 return {"error_msg": _("Video embedding disabled by owner")}
 
-    def _get_video_urls_for_widget(self, video_url, video_id):
-        """Return the video URLs, 'cleaned' video id, and error."""
+    def _get_snapshot_for_widget(self, video_url, video_id):
+        """Return the widget snapshot for the video and error."""
 
         try:
-            video_urls = video_cache.get_video_urls(video_id)
+            return video_cache.get_widget_snapshot(video_id), None
         except models.Video.DoesNotExist:
             video_cache.invalidate_video_id(video_url)
 
             try:
                 video_id = video_cache.get_video_id(video_url)
             except Exception as e:
-                return None, None, {"error_msg": unicode(e)}
+                return None, {"error_msg": unicode(e)}
 
-            video_urls = video_cache.get_video_urls(video_id)
-
-        return video_urls, video_id, None
+            return video_cache.get_widget_snapshot(video_id), None
 
     def _find_remote_autoplay_language(self, request):
         language = None
@@ -138,7 +137,9 @@ class Rpc(BaseRpc):
             language = request.user.preferred_language
         return language if language != '' else None
 
-    def _get_subtitles_for_widget(self, request, base_state, video_id, is_remote):
+    def _get_subtitles_for_widget(self, request, base_state, snapshot, is_remote):
+        video_id = snapshot['video_id']
+        language_pks = snapshot['language_pks']
         # keeping both forms valid as backwards compatibility layer
         lang_code = base_state and base_state.get("language_code", base_state.get("language", None))
 
@@ -146,14 +147,15 @@ class Rpc(BaseRpc):
             lang_pk = base_state.get('language_pk', None)
 
             if lang_pk is  None:
-                lang_pk = video_cache.pk_for_default_language(video_id, lang_code)
+                # the widget sends langauge code as an empty dict
+                lang_pk = language_pks.get(lang_code or None)
 
             return self._autoplay_subtitles(request.user, video_id, lang_pk,
                                             base_state.get('revision', None))
         else:
             if is_remote:
                 autoplay_language = self._find_remote_autoplay_language(request)
-                language_pk = video_cache.pk_for_default_language(video_id, autoplay_language)
+                language_pk = language_pks.get(autoplay_language or None)
 
                 if autoplay_language is not None:
                     return self._autoplay_subtitles(request.user, video_id,
@@ -169,21 +171,23 @@ class Rpc(BaseRpc):
         if video_id is None:
             return None
 
-        error = self._check_visibility_policy_for_widget(request, video_id)
+        snapshot, error = self._get_snapshot_for_widget(video_url, video_id)
 
         if error:
             return error
 
-        video_urls, video_id, error = self._get_video_urls_for_widget(video_url, video_id)
+        error = self._check_visibility_policy_for_widget(request, snapshot)
 
         if error:
             return error
 
+        video_id = snapshot['video_id']
+
         resp = {
             'video_id' : video_id,
             'subtitles': None,
-            'video_urls': video_urls,
-            'is_moderated': video_cache.get_is_moderated(video_id),
+            'video_urls': snapshot['video_urls'],
+            'is_moderated': snapshot['is_moderated'],
         }
 
         if additional_video_urls is not None:
@@ -195,16 +199,17 @@ class Rpc(BaseRpc):
         if request.user.is_authenticated():
             resp['username'] = request.user.username
 
-        resp['drop_down_contents'] = video_cache.get_video_languages(video_id)
+        resp['drop_down_contents'] = snapshot['languages']
         resp['my_languages'] = get_user_languages_from_request(request)
         resp['subtitles'] = self._get_subtitles_for_widget(request, base_state,
-                                                           video_id, is_remote)
+                                                           snapshot, is_remote)
         return resp
 
 
     # Statistics
     def track_subtitle_play(self, request, video_id):
-        st_widget_view_statistic_update.delay(video_id=video_id)
+        counter_buffer.incr_statistic(st_widget_view_statistic,
+                                      video_id=video_id)
         return { 'response': 'ok' }
 
 
@@ -245,10 +250,10 @@ class Rpc(BaseRpc):
         my_languages.extend([l[:l.find('-')] for l in my_languages if l.find('-') > -1])
         video = models.Video.objects.get(video_id=video_id)
         team_video = video.get_team_video()
-        languages = (new_models.SubtitleLanguage.objects.having_public_versions()
-                                                        .filter(video=video))
-        video_languages = [language_summary(l, team_video, request.user) for l
-                           in languages]
+        statuses = [s for s in language_status.get_language_status(video)
+                    if s['has_public_version']]
+        video_languages = language_summaries(statuses, team_video,
+                                             request.user)
 
         original_language = video.primary_audio_language_code
 
@@ -1175,7 +1180,7 @@ class Rpc(BaseRpc):
         else:
             version = version or latest_version
             version_number = version.version_number
-            subtitles = version.get_subtitles().to_xml()
+            subtitles = version.get_subtitles_xml()
             language = version.subtitle_language
             language_code = language.language_code
 
@@ -1205,36 +1210,57 @@ class Rpc(BaseRpc):
 def language_summary(language, team_video=-1, user=None):
     """Return a dictionary of info about the given SubtitleLanguage.
 
-    The team video can be given to avoid an extra database lookup.
+    The team video can be given to avoid an extra database lookup.  If you
+    need the summaries of several languages of a video use
+    language_summaries instead.
 
     """
     if team_video == -1:
         team_video = language.video.get_team_video()
 
-    translation_source = language.get_translation_source_language()
-    is_translation = bool(translation_source)
+    status = language_status.get_language_status_for(language)
+    return language_summaries([status], team_video, user)[0]
+
+def language_summaries(statuses, team_video=None, user=None):
+    """Return language_summary dicts for a list of language statuses.
+
+    statuses should come from language_status.get_language_status, so this
+    costs at most one query (for the team's tasks) however many languages
+    there are.
+
+    """
+    if team_video:
+        tasks = language_status.incomplete_tasks_by_language(team_video)
+    else:
+        tasks = {}
+
+    return [_summarize_language(status, tasks.get(status['language_code']),
+                                user)
+            for status in statuses]
+
+def _summarize_language(status, task, user):
+    is_translation = bool(status['translation_source_pk'])
     summary = {
-        'pk': language.pk,
-        'language': language.language_code,
+        'pk': status['pk'],
+        'language': status['language_code'],
         'dependent': is_translation,
-        'subtitle_count': language.get_subtitle_count(),
-        'in_progress': language.is_writelocked,
+        'subtitle_count': status['subtitle_count'],
+        'in_progress': language_status.is_writelocked(status),
         'disabled_from': False }
 
-    if team_video:
-        tasks = team_video.task_set.incomplete().filter(language=language.language_code)
-        if tasks:
-            task = tasks[0]
-            summary['disabled_to'] = user and user != task.assignee
+    if task:
+        type, assignee_id = task
+        summary['disabled_to'] = user and (user.pk is None or
+                                           user.pk != assignee_id)
 
-    latest_version = language.get_tip()
+    is_complete_and_synced = status['subtitles_complete'] and status['is_synced']
 
-    if latest_version and language.is_complete_and_synced() and 'disabled_to' not in summary:
+    if status['has_tip'] and is_complete_and_synced and 'disabled_to' not in summary:
         # Languages with existing subtitles cannot be selected as a "to"
         # language in the "add new translation" dialog.  If you want to work on
         # that language, select it and hit "Improve these Subtitles" instead.
         summary['disabled_to'] = True
-    elif not latest_version or not latest_version.has_subtitles:
+    elif not status['has_subtitles']:
         # Languages with *no* existing subtitles cannot be selected as a "from"
         # language in the "add new translation" dialog.  There's nothing to work
         # from!
@@ -1242,8 +1268,8 @@ def language_summary(language, team_video=-1, user=None):
 
 
     if is_translation:
-        summary['standard_pk'] = translation_source.pk
-    summary['is_complete'] = language.subtitles_complete
-    summary['is_public'] = True if language.get_public_tip() else False
+        summary['standard_pk'] = status['translation_source_pk']
+    summary['is_complete'] = status['subtitles_complete']
+    summary['is_public'] = status['has_public_version']
 
     return summary
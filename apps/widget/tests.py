@@ -26,6 +26,8 @@ Replace these with more appropriate tests for your application.
 
 import json
 
+import mock
+from django.core.cache import cache
 from django.test import TestCase
 from babelsubs.storage import SubtitleSet
 import babelsubs
@@ -33,6 +35,7 @@ from auth.models import CustomUser
 from videos.models import Video, Action, SubtitleLanguage
 from videos import models
 from subtitles import models as sub_models
+from apps.subtitles import pipeline
 from apps.subtitles.pipeline import rollback_to
 from widget.models import SubtitlingSession
 from widget.rpc import Rpc
@@ -1044,6 +1047,40 @@ class TestCache(TestCase):
         video_id = video_cache.get_video_id(url)
         video_cache.get_subtitles_dict(video_id, 0, 0, lambda x: x)
 
+    def test_invalidate_bumps_generation(self):
+        video, create = Video.get_or_create_for_url(VIDEO_URL)
+        video_id = video.video_id
+        video_cache.get_video_id(VIDEO_URL)
+        urls_key = video_cache._video_urls_key(video_id)
+        video_cache.get_video_urls(video_id)
+        self.assertTrue(video_cache.cache.get(urls_key) is not None)
+
+        video_cache.invalidate_cache(video_id)
+
+        self.assertNotEqual(urls_key, video_cache._video_urls_key(video_id))
+        self.assertEqual(
+            video_cache.cache.get(video_cache._video_urls_key(video_id)),
+            None)
+        self.assertEqual(
+            video_cache.cache.get(video_cache._video_id_key(VIDEO_URL)), None)
+
+    def test_widget_snapshot_follows_generation(self):
+        video, create = Video.get_or_create_for_url(VIDEO_URL)
+        snapshot = video_cache.get_widget_snapshot(video.video_id)
+        self.assertEqual(snapshot['video_id'], video.video_id)
+        self.assertEqual(snapshot['video_urls'],
+                         video_cache.get_video_urls(video.video_id))
+        self.assertEqual(
+            snapshot, video_cache.get_widget_snapshot(video.video_id))
+
+        video_cache.invalidate_cache(video.video_id)
+        rebuilt = video_cache.get_widget_snapshot(video.video_id)
+        self.assertNotEqual(snapshot['generation'], rebuilt['generation'])
+
+    def test_widget_snapshot_missing_video(self):
+        self.assertRaises(models.Video.DoesNotExist,
+                          video_cache.get_widget_snapshot, "bad key")
+
 class TestCaching(TestCase):
     fixtures = ['test_widget.json']
 
@@ -1125,6 +1162,54 @@ class TestFormatConvertion(TestCase):
         raw, parsed = self._retrieve('sbv')
         self.assertEqual(parsed[1], (1000, 2000, '1 - and *italics* and **bold** and >>.', {'new_paragraph': False}))
 
+class TestDownloadSubtitles(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.video = test_factories.create_video()
+        self.version = pipeline.add_subtitles(self.video, 'en',
+                                              [(0, 1000, 'Hi')])
+        self.url = reverse('widget:download', kwargs={'format': 'srt'})
+        self.params = {
+            'video_id': self.video.video_id,
+            'lang_pk': self.version.subtitle_language.pk,
+        }
+
+    def _get(self, **headers):
+        return self.client.get(self.url, self.params, **headers)
+
+    def test_etag(self):
+        response = self._get()
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('Hi', response.content)
+        self.assertEquals(response['ETag'], '"%s-srt"' % self.version.pk)
+
+        response = self._get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response.content, '')
+
+        response = self._get(HTTP_IF_NONE_MATCH='*')
+        self.assertEquals(response.status_code, 304)
+
+        response = self._get(HTTP_IF_NONE_MATCH='"something-else"')
+        self.assertEquals(response.status_code, 200)
+
+    def test_rendered_output_is_cached(self):
+        with mock.patch.object(babelsubs, 'to', wraps=babelsubs.to) as to:
+            first = self._get().content
+            second = self._get().content
+        self.assertEquals(first, second)
+        self.assertEquals(to.call_count, 1)
+
+    def test_new_version(self):
+        etag = self._get()['ETag']
+        new_version = pipeline.add_subtitles(self.video, 'en',
+                                             [(0, 1000, 'Hello')])
+
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('Hello', response.content)
+        self.assertEquals(response['ETag'], '"%s-srt"' % new_version.pk)
+
 class TestLineageOnRPC(TestCase):
     def setUp(self):
         self.video = test_factories.create_video()
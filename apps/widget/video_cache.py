@@ -16,6 +16,7 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 import datetime
+import time
 
 from django.conf import settings
 from django.core.cache import cache
@@ -29,6 +30,8 @@ from videos.types.base import VideoTypeError
 import unilangs
 
 TIMEOUT = 60 * 60 * 24 * 5 # 5 days
+# generations must outlive every key that was namespaced with them
+GENERATION_TIMEOUT = TIMEOUT * 2
 
 
 def get_video_id(video_url, public_only=False, referer=None):
@@ -72,48 +75,43 @@ def associate_extra_url(video_url, video_id):
 
 # Invalidation
 def invalidate_cache(video_id):
-    cache.delete(_video_urls_key(video_id))
+    """Invalidate every widget cache entry for the video with ``video_id``.
 
-    try:
-        from apps.videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        for l in video.newsubtitlelanguage_set.all():
-            cache.delete(_subtitles_dict_key(video_id, l.pk))
-    except Video.DoesNotExist:
-        pass
-
-    for language in settings.ALL_LANGUAGES:
-        cache.delete(_subtitle_language_pk_key(video_id, language[0]))
-
-    cache.delete(_subtitle_language_pk_key(video_id, None))
-    cache.delete(_subtitles_dict_key(video_id, None))
-    cache.delete(_subtitles_count_key(video_id))
-    cache.delete(_video_languages_key(video_id))
-    cache.delete(_video_languages_verbose_key(video_id))
-    cache.delete(_video_is_moderated_key(video_id))
-    cache.delete(_video_visibility_policy_key(video_id))
+    Almost every key is namespaced by the video's cache generation, so
+    bumping the generation is enough to orphan them all at once.  Only the
+    keys that are not looked up by video_id (the per-url video id, the team
+    video's completed languages and the language statuses) have to be
+    deleted explicitly.
+    """
+    _bump_video_generation(video_id)
 
-    from videos.models import Video
-    try:
-        video = Video.objects.get(video_id=video_id)
-        for url in video.videourl_set.all():
-            cache.delete(_video_id_key(url.url))
+    from videos.models import Video, VideoUrl
+    from teams.models import TeamVideo
+    from apps.subtitles import cache as subtitles_cache
 
-        team_video = video.get_team_video()
+    for video_pk in Video.objects.filter(video_id=video_id).values_list(
+            'pk', flat=True):
+        subtitles_cache.invalidate_language_status(video_pk)
 
-        if team_video:
-            cache.delete(_video_completed_languages(team_video.id))
-    except Video.DoesNotExist:
-        pass
+    urls = VideoUrl.objects.filter(video__video_id=video_id).values_list(
+        'url', flat=True)
+    cache.delete_many([_video_id_key(url) for url in urls])
+
+    team_video_ids = TeamVideo.objects.filter(
+        video__video_id=video_id).values_list('id', flat=True)
+    cache.delete_many([_video_completed_languages(tv_id)
+                       for tv_id in team_video_ids])
 
 def invalidate_video_id(video_url):
     cache.delete(_video_id_key(video_url))
 
 def invalidate_video_moderation(video_id):
-    cache.delete(_video_is_moderated_key(video_id))
+    cache.delete_many([_video_is_moderated_key(video_id),
+                       _widget_snapshot_key(video_id)])
 
 def invalidate_video_visibility(video_id):
-    cache.delete(_video_visibility_policy_key(video_id))
+    cache.delete_many([_video_visibility_policy_key(video_id),
+                       _widget_snapshot_key(video_id)])
 
 def on_video_url_save(sender, instance, **kwargs):
     if instance.video_id:
@@ -123,23 +121,59 @@ def on_video_url_delete(sender, instance, **kwargs):
     if instance.video and instance.video.video_id:
         invalidate_cache(instance.video.video_id)
 
+def _video_generation_key(video_id):
+    return 'widget_video_gen_{0}'.format(video_id)
+
+def _video_generation(video_id):
+    """Return the current cache generation for the video.
+
+    The generation is seeded with the current timestamp rather than a
+    constant so that, if memcached evicts it, the new generation can never
+    collide with one that was handed out before.
+    """
+    cache_key = _video_generation_key(video_id)
+    generation = cache.get(cache_key)
+
+    if generation is None:
+        generation = int(time.time())
+        if not cache.add(cache_key, generation, GENERATION_TIMEOUT):
+            # someone else seeded it between our get and add
+            generation = cache.get(cache_key, generation)
+
+    return generation
+
+def _bump_video_generation(video_id):
+    cache_key = _video_generation_key(video_id)
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        # the key is not there, seeding it is as good as bumping it
+        generation = int(time.time())
+        cache.set(cache_key, generation, GENERATION_TIMEOUT)
+        return generation
+
 def _video_id_key(video_url):
     return 'video_id_{0}'.format(sha_constructor(video_url).hexdigest())
 
 def _video_urls_key(video_id):
-    return 'widget_video_urls_{0}'.format(video_id)
+    return 'widget_video_urls_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
 
 def _subtitles_dict_key(video_id, language_pk, version_no=None):
-    return 'widget_subtitles_{0}{1}{2}'.format(video_id, language_pk, version_no)
+    return 'widget_subtitles_{0}{1}{2}_{3}'.format(
+        video_id, language_pk, version_no, _video_generation(video_id))
 
 def _subtitles_count_key(video_id):
-    return "subtitle_count_{0}".format(video_id)
+    return "subtitle_count_{0}_{1}".format(
+        video_id, _video_generation(video_id))
 
 def _video_languages_key(video_id):
-    return "widget_video_languages_{0}".format(video_id)
+    return "widget_video_languages_{0}_{1}".format(
+        video_id, _video_generation(video_id))
 
 def _video_languages_verbose_key(video_id):
-    return "widget_video_languages_verbose_{0}".format(video_id)
+    return "widget_video_languages_verbose_{0}_{1}".format(
+        video_id, _video_generation(video_id))
 
 def _video_completed_languages(video_id):
     return "video_completed_verbose_{0}".format(video_id)
@@ -148,13 +182,21 @@ def _video_writelocked_langs_key(video_id):
     return "writelocked_langs_{0}".format(video_id)
 
 def _subtitle_language_pk_key(video_id, language_code):
-    return "sl_pk_{0}{1}".format(video_id, language_code)
+    return "sl_pk_{0}{1}_{2}".format(
+        video_id, language_code, _video_generation(video_id))
 
 def _video_is_moderated_key(video_id):
-    return 'widget_video_is_moderated_{0}'.format(video_id)
+    return 'widget_video_is_moderated_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
 
 def _video_visibility_policy_key(video_id):
-    return 'widget_video_vis_key_{0}'.format(video_id)
+    return 'widget_video_vis_key_{0}_{1}'.format(
+        video_id, _video_generation(video_id))
+
+def _widget_snapshot_key(video_id):
+    # Not namespaced by the generation: the snapshot carries its own
+    # generation so both can be fetched in a single get_many.
+    return 'widget_snapshot_{0}'.format(video_id)
 
 
 def pk_for_default_language(video_id, language_code):
@@ -218,8 +260,20 @@ def get_subtitles_dict(video_id, language_pk, version_number,
 
     return cached_value
 
+def _summary_language_statuses(video, team_video):
+    """Return the statuses of the languages shown in the drop down."""
+    from apps.subtitles.language_status import get_language_status
+
+    statuses = [s for s in get_language_status(video)
+                if s['has_nonempty_versions']]
+    if team_video:
+        readable_langs = set(team_video.team.get_readable_langs())
+        statuses = [s for s in statuses
+                    if s['language_code'] in readable_langs]
+    return statuses
+
 def get_video_languages(video_id):
-    from apps.widget.rpc import language_summary
+    from apps.widget.rpc import language_summaries
 
     cache_key = _video_languages_key(video_id)
     value = cache.get(cache_key)
@@ -227,14 +281,10 @@ def get_video_languages(video_id):
     if value is None:
         from videos.models import Video
         video = Video.objects.get(video_id=video_id)
-        languages = video.newsubtitlelanguage_set.having_nonempty_versions()
-
         team_video = video.get_team_video()
 
-        if team_video:
-            languages = languages.filter(language_code__in=team_video.team.get_readable_langs())
-
-        value = [language_summary(l) for l in languages]
+        value = language_summaries(
+            _summary_language_statuses(video, team_video), team_video)
         cache.set(cache_key, value, TIMEOUT)
 
     return value
@@ -331,6 +381,65 @@ def get_visibility_policies(video_id):
 
     return value
 
+# Widget snapshot
+def get_widget_snapshot(video_id):
+    """Return everything show_widget needs to know about a video.
+
+    The snapshot is fetched together with the video's cache generation in a
+    single round trip, and rebuilt in one pass if it is missing or was built
+    for an older generation.  Raises Video.DoesNotExist for unknown videos.
+
+    The returned dict has the keys ``video_id``, ``video_urls``,
+    ``visibility_policy``, ``is_moderated``, ``languages`` (the drop down
+    contents) and ``language_pks`` (language code -> SubtitleLanguage pk,
+    with ``None`` mapping to the primary audio language).
+    """
+    generation_key = _video_generation_key(video_id)
+    snapshot_key = _widget_snapshot_key(video_id)
+    values = cache.get_many([generation_key, snapshot_key])
+
+    generation = values.get(generation_key)
+    snapshot = values.get(snapshot_key)
+
+    if generation is None:
+        generation = _video_generation(video_id)
+    elif snapshot is not None and snapshot['generation'] == generation:
+        return snapshot
+
+    snapshot = _build_widget_snapshot(video_id, generation)
+    cache.set(snapshot_key, snapshot, TIMEOUT)
+    return snapshot
+
+def _build_widget_snapshot(video_id, generation):
+    from apps.widget.rpc import language_summaries
+    from apps.subtitles.language_status import get_language_status
+    from videos.models import Video
+
+    video = Video.objects.select_related('teamvideo__team').get(
+        video_id=video_id)
+    team_video = video.get_team_video()
+
+    if team_video:
+        team = team_video.team
+        visibility_policy = {"is_public": team.is_visible, "team_id": team.id}
+    else:
+        visibility_policy = {"is_public": True, "team_id": None}
+
+    language_pks = dict((s['language_code'], s['pk'])
+                        for s in get_language_status(video))
+    language_pks[None] = language_pks.get(video.primary_audio_language_code)
+
+    return {
+        'generation': generation,
+        'video_id': video.video_id,
+        'video_urls': [vu.effective_url for vu in video.videourl_set.all()],
+        'visibility_policy': visibility_policy,
+        'is_moderated': video.is_moderated,
+        'languages': language_summaries(
+            _summary_language_statuses(video, team_video), team_video),
+        'language_pks': language_pks,
+    }
+
 # Writelocking
 def _writelocked_store_langs(video_id, langs):
     cache_key = _video_writelocked_langs_key(video_id)
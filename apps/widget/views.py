@@ -28,18 +28,20 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
 from django.db.models import ObjectDoesNotExist
-from django.http import HttpResponse, Http404, HttpResponseServerError, HttpResponseRedirect
+from django.http import (HttpResponse, Http404, HttpResponseServerError,
+                         HttpResponseRedirect, HttpResponseNotModified)
 from django.shortcuts import render_to_response, redirect, get_object_or_404
 from django.template import RequestContext
 from django.template.defaultfilters import urlize, linebreaks, force_escape
 from django.utils.encoding import iri_to_uri
-from django.utils.http import cookie_date
+from django.utils.http import cookie_date, parse_etags, quote_etag
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from simplejson.decoder import JSONDecodeError
 
 import widget
 from auth.models import CustomUser
+from subtitles import cache as subtitles_cache
 from teams.models import Task
 from teams.permissions import get_member
 from uslogging.models import WidgetDialogCall
@@ -337,10 +339,19 @@ def download_subtitles(request, format):
     if not format in babelsubs.get_available_formats():
         raise HttpResponseServerError("Format not found")
     
-    subs_text = babelsubs.to(version.get_subtitles(), format, language=version.language_code)
+    # versions never change, so clients that already have this one can keep it
+    etag = subtitles_cache.rendered_subtitles_etag(version, format)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if if_none_match.strip() == '*' or etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+        response['ETag'] = quote_etag(etag)
+        return response
+
+    subs_text = subtitles_cache.get_rendered_subtitles(version, format)
     # since this is a downlaod, we can afford not to escape tags, specially true
     # since speaker change is denoted by '>>' and that would get entirely stripped out
     response = HttpResponse(subs_text, mimetype="text/plain")
+    response['ETag'] = quote_etag(etag)
     original_filename = '%s.%s' % (video.lang_filename(language.language_code), format)
 
     if not 'HTTP_USER_AGENT' in request.META or u'WebKit' in request.META['HTTP_USER_AGENT']:
@@ -86,3 +86,49 @@ def update_many(objects, fields=[], using="default"):
         "update %s set %s where %s=%%s" % (table, assignments, con.ops.quote_name(meta.pk.column)),
         parameters)
     transaction.commit_unless_managed()
+
+def increment_many(model, rows, field, using="default"):
+    """Add to a counter column for many rows, creating the missing ones.
+
+    rows is a list of (fields, value) pairs, where fields maps attribute
+    names to values and must cover one of the model's unique_together sets.
+    On MySQL this is a single INSERT ... ON DUPLICATE KEY UPDATE; other
+    databases fall back to an UPDATE (and INSERT when nothing matched) per
+    row. Signals are not raised."""
+    if not rows:
+        return
+
+    from django.db import connections, transaction
+    from django.db.models import F
+    con = connections[using]
+
+    if con.vendor != 'mysql':
+        for fields, value in rows:
+            updated = model._default_manager.filter(**fields).update(
+                **{field: F(field) + value})
+            if not updated:
+                values = dict(fields)
+                values[field] = value
+                model._default_manager.create(**values)
+        return
+
+    by_attname = dict((f.attname, f) for f in model._meta.fields)
+    attnames = sorted(rows[0][0].keys())
+    fields = [by_attname[name] for name in attnames] + [by_attname[field]]
+
+    parameters = []
+    for row_fields, value in rows:
+        values = [row_fields[name] for name in attnames] + [value]
+        parameters.extend(f.get_db_prep_save(v, connection=con)
+                          for f, v in zip(fields, values))
+
+    table = model._meta.db_table
+    column_names = ",".join(con.ops.quote_name(f.column) for f in fields)
+    placeholders = "(%s)" % ",".join(("%s",) * len(fields))
+    counter = con.ops.quote_name(by_attname[field].column)
+    con.cursor().execute(
+        "insert into %s (%s) values %s on duplicate key update %s=%s+values(%s)" % (
+            table, column_names, ",".join((placeholders,) * len(rows)),
+            counter, counter, counter),
+        parameters)
+    transaction.commit_unless_managed()
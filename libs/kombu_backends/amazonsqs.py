@@ -1,9 +1,27 @@
+import logging
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+
 from kombu.transport import virtual
 from boto.sqs.connection import SQSConnection
 from django.conf import settings
 from boto import exception as boto_exceptions
 
 LOG_AMAZON_BROKER = getattr(settings, 'LOG_AMAZON_BROKER', False)
+# How long a receive waits for messages to show up before returning empty
+# handed (SQS long polling, 0 to 20 seconds).  0 disables long polling.
+WAIT_TIME_SECONDS = getattr(settings, 'SQS_WAIT_TIME_SECONDS', 5)
+# How many messages to fetch per receive (1 to 10).  The extra ones are kept
+# in memory until the worker asks for them.  Messages are only deleted from
+# SQS once acked, so a worker that dies doesn't lose them, SQS hands them out
+# again after their visibility timeout.
+PREFETCH_COUNT = getattr(settings, 'SQS_PREFETCH_COUNT', 1)
+# SQS batch actions take at most 10 entries
+MAX_BATCH_SIZE = 10
+
+logger = logging.getLogger(__name__)
 
 try:
     from termcolor import cprint
@@ -25,7 +43,83 @@ EVENT_QUEUE_NAME = 'celeryev'
 from utils.redis_utils import default_connection
 from statistic.log_methods import LogNativeMethodsMetaclass, RedisLogBackend
 
-class SQSLoggingConnection(SQSConnection):
+class BatchResults(object):
+    """Parser for the responses of the SQS batch actions.
+
+    ``results`` and ``errors`` end up as lists of dicts of the entries'
+    fields (Id, MessageId, Code, Message...).
+
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.results = []
+        self.errors = []
+        self._entry = None
+
+    def startElement(self, name, attrs, connection):
+        if name.endswith('ResultEntry'):
+            self._entry = {}
+        return None
+
+    def endElement(self, name, value, connection):
+        if name == 'BatchResultErrorEntry':
+            self.errors.append(self._entry)
+            self._entry = None
+        elif name.endswith('ResultEntry'):
+            self.results.append(self._entry)
+            self._entry = None
+        elif self._entry is not None:
+            self._entry[name] = value
+
+class BatchSQSConnection(SQSConnection):
+    """SQSConnection with the batch actions and long polling.
+
+    Our boto predates them, so they are implemented on top of its generic
+    request methods.  They need a newer API version than the one boto asks
+    for, the older actions work the same with it.
+
+    """
+    APIVersion = '2012-11-05'
+
+    def receive_messages(self, queue, number_messages=1, wait_time_seconds=0):
+        """Receive up to number_messages messages from queue.
+
+        If wait_time_seconds is given, wait up to that long for a message to
+        show up instead of returning right away if there are none.
+
+        """
+        params = {'MaxNumberOfMessages': number_messages}
+        if wait_time_seconds:
+            params['WaitTimeSeconds'] = wait_time_seconds
+        return self.get_list('ReceiveMessage', params,
+                             [('Message', queue.message_class)],
+                             queue.id, queue)
+
+    def delete_message_batch(self, queue, messages):
+        """Delete up to 10 messages in a single request."""
+        params = {}
+        for i, message in enumerate(messages):
+            prefix = 'DeleteMessageBatchRequestEntry.%s' % (i + 1)
+            params['%s.Id' % prefix] = str(i)
+            params['%s.ReceiptHandle' % prefix] = message.receipt_handle
+        return self.get_object('DeleteMessageBatch', params, BatchResults,
+                               queue.id, verb='POST')
+
+    def send_message_batch(self, queue, messages):
+        """Send up to 10 messages in a single request.
+
+        The entry ids in the result are the indexes of the messages.
+
+        """
+        params = {}
+        for i, message in enumerate(messages):
+            prefix = 'SendMessageBatchRequestEntry.%s' % (i + 1)
+            params['%s.Id' % prefix] = str(i)
+            params['%s.MessageBody' % prefix] = message.get_body_encoded()
+        return self.get_object('SendMessageBatch', params, BatchResults,
+                               queue.id, verb='POST')
+
+class SQSLoggingConnection(BatchSQSConnection):
     __metaclass__ = LogNativeMethodsMetaclass
 
     logger_backend = RedisLogBackend(default_connection)
@@ -33,7 +127,49 @@ class SQSLoggingConnection(SQSConnection):
 if LOG_AMAZON_BROKER:
     DEFAULT_CONNECTION = SQSLoggingConnection
 else:
-    DEFAULT_CONNECTION = SQSConnection
+    DEFAULT_CONNECTION = BatchSQSConnection
+
+
+# Batched publishing
+_batching = threading.local()
+
+@contextmanager
+def batch_publish():
+    """Send the messages published inside the block in batches.
+
+    Normally every message is sent to SQS with its own request.  Inside this
+    block they are buffered per queue and sent 10 at a time with
+    SendMessageBatch, the rest when the block exits.  Use it around loops
+    that call .delay() a lot.  Blocks can be nested, only the outermost one
+    flushes.
+
+    This does nothing for the other broker backends.
+
+    """
+    if getattr(_batching, 'channels', None) is not None:
+        yield
+        return
+
+    _batching.channels = set()
+    try:
+        yield
+    finally:
+        channels, _batching.channels = _batching.channels, None
+        _flush_channels(channels)
+
+def _flush_channels(channels):
+    # Every channel gets flushed even if one fails, then the first error is
+    # raised.
+    error = None
+    for channel in channels:
+        try:
+            channel.flush_puts()
+        except Exception:
+            logger.exception('Failed to flush batched SQS messages')
+            if error is None:
+                error = sys.exc_info()
+    if error is not None:
+        raise error[0], error[1], error[2]
 
 class Channel(virtual.Channel):
 
@@ -43,9 +179,20 @@ class Channel(virtual.Channel):
     DOT_REPLECEMENT = '___'
     supports_fanout = False
 
+    wait_time_seconds = WAIT_TIME_SECONDS
+    prefetch_count = PREFETCH_COUNT
+
     def __init__(self, connection, **kwargs):
         self.queue_prefix = connection.client.virtual_host or ''
         self.queue_cache = {}
+        # queue -> deque of received message bodies
+        self._prefetched = {}
+        # delivery tag -> (queue, SQS message) of the received, unacked ones
+        self._unacked = {}
+        # queue -> acked SQS messages waiting to be deleted in a batch
+        self._acked = {}
+        # queue -> list of messages waiting for the end of batch_publish
+        self._put_buffer = {}
         super(Channel, self).__init__(connection, **kwargs)
 
     def _lookup(self, exchange, routing_key, default="ae.undeliver"):
@@ -73,32 +220,165 @@ class Channel(virtual.Channel):
         return super(Channel, self)._lookup(exchange, routing_key, default)
 
     def _get(self, queue, timeout=None):
-        """Get next message from `queue`."""
+        """Get next message from `queue`.
+
+        Messages are received up to prefetch_count at a time and handed out
+        from memory afterwards.  They stay in SQS until they are acked, see
+        basic_ack.
+
+        """
         DEBUG and pr('>>> Channel._get: %s' % queue)
-        q = self._get_queue(queue)
-        m = q.read()
+        prefetched = self._prefetched.get(queue)
+        if not prefetched:
+            prefetched = self._receive(queue)
 
-        if m:
-            q.delete_message(m)
-            return deserialize(m.get_body())
+        if prefetched:
+            return prefetched.popleft()
         raise Empty()
 
+    def _receive(self, queue):
+        q = self._get_queue(queue)
+        messages = self.client.receive_messages(
+            q, number_messages=min(self.prefetch_count, MAX_BATCH_SIZE),
+            wait_time_seconds=self.wait_time_seconds)
+        if not messages:
+            return None
+
+        prefetched = self._prefetched.setdefault(queue, deque())
+        untracked = []
+        for m in messages:
+            payload = deserialize(m.get_body())
+            tag = payload.get('properties', {}).get('delivery_tag')
+            if tag is None:
+                # nobody will ack this one
+                untracked.append(m)
+            else:
+                self._unacked[tag] = (queue, m)
+            prefetched.append(payload)
+        if untracked:
+            self._delete_messages(queue, untracked)
+        return prefetched
+
+    def basic_ack(self, delivery_tag):
+        super(Channel, self).basic_ack(delivery_tag)
+        self._message_done(delivery_tag)
+
+    def basic_reject(self, delivery_tag, requeue=False):
+        # with requeue set, _restore already left the message in SQS
+        super(Channel, self).basic_reject(delivery_tag, requeue)
+        self._message_done(delivery_tag)
+
+    def _message_done(self, delivery_tag):
+        """Delete the SQS message of delivery_tag.
+
+        Deletes are batched: they go out once every message received from the
+        queue is done, or MAX_BATCH_SIZE are waiting.
+        """
+        entry = self._unacked.pop(delivery_tag, None)
+        if entry is None:
+            return
+        queue, m = entry
+        acked = self._acked.setdefault(queue, [])
+        acked.append(m)
+
+        still_unacked = any(q == queue for q, _ in self._unacked.itervalues())
+        if len(acked) >= MAX_BATCH_SIZE or not still_unacked:
+            self._flush_acked(queue)
+
+    def _flush_acked(self, queue):
+        messages = self._acked.pop(queue, None)
+        if messages:
+            self._delete_messages(queue, messages)
+
+    def _delete_messages(self, queue, messages):
+        q = self._get_queue(queue)
+        if len(messages) == 1:
+            q.delete_message(messages[0])
+        else:
+            result = self.client.delete_message_batch(q, messages)
+            for error in result.errors:
+                logger.error('Failed to delete SQS message: %s', error)
+
+    def _restore(self, message):
+        if self._unacked.pop(message.delivery_tag, None) is not None:
+            # Still in SQS, it comes back by itself after its visibility
+            # timeout, publishing it again would duplicate it.
+            return
+        return super(Channel, self)._restore(message)
+
+    def close(self):
+        for queue in self._acked.keys():
+            try:
+                self._flush_acked(queue)
+            except Exception:
+                logger.exception('Failed to delete acked SQS messages')
+        super(Channel, self).close()
+
     def _put(self, queue, message, **kwargs):
-        """Put `message` onto `queue`."""
+        """Put `message` onto `queue`.
+
+        Inside a batch_publish block the message is only buffered.
+
+        """
         DEBUG and pr('>>> Channel._put: %s, %s' % (queue, message))
         q = self._get_queue(queue)
         m = q.new_message(serialize(message))
-        q.write(m)
+
+        channels = getattr(_batching, 'channels', None)
+        if channels is None:
+            q.write(m)
+            return
+
+        channels.add(self)
+        buffered = self._put_buffer.setdefault(queue, [])
+        buffered.append(m)
+        if len(buffered) >= MAX_BATCH_SIZE:
+            self._flush_queue_puts(queue)
+
+    def flush_puts(self):
+        """Send every message buffered by batch_publish."""
+        error = None
+        for queue in self._put_buffer.keys():
+            try:
+                self._flush_queue_puts(queue)
+            except Exception:
+                if error is None:
+                    error = sys.exc_info()
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    def _flush_queue_puts(self, queue):
+        messages = self._put_buffer.pop(queue, None)
+        if not messages:
+            return
+
+        q = self._get_queue(queue)
+        try:
+            result = self.client.send_message_batch(q, messages)
+        except Exception:
+            # The whole request failed (throttled, batch too big, connection
+            # error...), don't lose the messages, send them one by one.
+            logger.warning('SQS batch send failed, sending %s messages one '
+                           'by one', len(messages), exc_info=True)
+            for m in messages:
+                q.write(m)
+            return
+        for error in result.errors:
+            # Entries fail one by one (throttling...), retry them alone.
+            logger.warning('SQS batch send failed for one message: %s', error)
+            q.write(messages[int(error['Id'])])
 
     def _purge(self, queue):
         """Remove all messages from `queue`."""
         DEBUG and pr('>>> Channel._purge: %s' % queue)
+        self._prefetched.pop(queue, None)
         return self._get_queue(queue).clear()
 
     def _size(self, queue):
         """Return the number of messages in `queue` as an :class:`int`."""
         DEBUG and pr('>>> Channel._size: %s' % queue)
-        return self._get_queue(queue).count()
+        prefetched = len(self._prefetched.get(queue, ()))
+        return self._get_queue(queue).count() + prefetched
 
     def _delete(self, queue):
         """Delete `queue`.
@@ -175,6 +455,10 @@ class Channel(virtual.Channel):
 class Transport(virtual.Transport):
     Channel = Channel
 
+    # With long polling the receive call does the waiting for us
+    if WAIT_TIME_SECONDS:
+        polling_interval = 0
+
     def __init__(self, *args, **kwargs):
         super(Transport, self).__init__(*args, **kwargs)
         self.connection_errors = (
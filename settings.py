@@ -418,6 +418,12 @@ CELERY_DISABLE_RATE_LIMITS = True
 CELERY_SEND_EVENTS = False
 CELERY_SEND_TASK_ERROR_EMAILS = True
 CELERY_RESULT_BACKEND = 'redis'
+# Partner webhooks can be slow, keep them off the default queue.  Workers
+# for them: python manage.py celeryd -Q webhooks
+CELERY_ROUTES = {
+    'teams.tasks.deliver_webhooks': {'queue': 'webhooks'},
+    'teams.tasks.retry_webhooks': {'queue': 'webhooks'},
+}
 
 BROKER_BACKEND = 'kombu_backends.amazonsqs.Transport'
 BROKER_USER = AWS_ACCESS_KEY_ID = ""
@@ -440,7 +446,7 @@ LOCALE_INDEPENDENT_PATHS = (
 
 #Haystack configuration
 HAYSTACK_SITECONF = 'search_site'
-HAYSTACK_SEARCH_ENGINE = 'solr'
+HAYSTACK_SEARCH_ENGINE = 'utils.solr'
 HAYSTACK_SOLR_URL = 'http://127.0.0.1:8983/solr'
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 20
 SOLR_ROOT = rel('..', 'buildout', 'parts', 'solr', 'example')
@@ -24,9 +24,11 @@ from django.utils import simplejson
 from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.functional import update_wrapper
 from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.utils import translation
+from django.utils.html import escape
 from utils.metrics import Meter
 
 DEFAULT_PROTOCOL = getattr(settings, "DEFAULT_PROTOCOL", 'https')
@@ -121,3 +123,59 @@ def send_templated_email(to, subject, body_template, body_dict,
 
     return email.send(fail_silently)
 
+RECIPIENT_PLACEHOLDER = u'\x00recipient\x00'
+
+def render_for_recipients(users, template_name, context):
+    """Render a template for many users, once per preferred language.
+
+    The template sees the recipient as {{ user }}, and must not use it any
+    other way: it is rendered with a placeholder that gets replaced by each
+    user's name.  Returns a list of (user, rendered template).
+    """
+    context = dict(context, user=RECIPIENT_PLACEHOLDER)
+    by_language = {}
+    for user in users:
+        by_language.setdefault(user.preferred_language, []).append(user)
+
+    rendered = []
+    for language, language_users in by_language.items():
+        with translation.override(language or settings.LANGUAGE_CODE):
+            text = render_to_string(template_name, context)
+        for user in language_users:
+            rendered.append(
+                (user, text.replace(RECIPIENT_PLACEHOLDER, escape(user))))
+    return rendered
+
+def send_templated_emails(users, subject, body_template, body_dict,
+                          from_email=None, ct="html", fail_silently=False):
+    """
+    Sends the same templated email to many users over a single connection.
+
+    Like send_templated_email, but the template is only rendered once per
+    language, see render_for_recipients.  Users without an email or who
+    opted out of email notifications are skipped.  Returns the number of
+    emails sent.
+    """
+    if not from_email: from_email = settings.DEFAULT_FROM_EMAIL
+
+    domain = Site.objects.get_current().domain
+    body_dict = dict(body_dict,
+        STATIC_URL_BASE=settings.STATIC_URL_BASE,
+        domain=domain,
+        url_base="%s://%s" % (DEFAULT_PROTOCOL, domain))
+    users = [u for u in users if u.email and u.notify_by_email]
+
+    emails = []
+    for user, message in render_for_recipients(users, body_template,
+                                               body_dict):
+        email = EmailMessage(subject, message, from_email, [user.email],
+                             bcc=settings.EMAIL_BCC_LIST)
+        email.content_subtype = ct
+        emails.append(email)
+    if not emails:
+        return 0
+
+    Meter('templated-emails-sent').inc(len(emails))
+    connection = get_connection(fail_silently=fail_silently)
+    return connection.send_messages(emails)
+
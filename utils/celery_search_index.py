@@ -1,13 +1,48 @@
+import sys
 import time
+from datetime import timedelta
 
+from celery.decorators import periodic_task
 from celery.task import task
+from django.conf import settings
 from django.db.models import signals
 from haystack import indexes, site
 from haystack.exceptions import NotRegistered
 from haystack.utils import get_identifier
 from redisco import models as rmodels
 
-from utils.redis_utils import default_connection
+from utils.redis_utils import default_connection, IGNORE_REDIS
+
+
+class BatchPrepareMixin(object):
+    """Let a search index prepare a chunk of objects with grouped queries.
+
+    Subclasses implement _prefetch(objects), which returns a dict of pk ->
+    whatever prepare() needs for that object, and call get_prefetched(obj)
+    from prepare().  utils.solr_backend calls prepare_batch() with every
+    chunk it is about to index, so prepare() then runs without touching
+    the database, and clear_prefetched() once the chunk is done; objects
+    prepared one at a time still work, they just get a batch of one.
+    """
+    def __init__(self, *args, **kwargs):
+        super(BatchPrepareMixin, self).__init__(*args, **kwargs)
+        self._prefetched = {}
+
+    def _prefetch(self, objects):
+        raise NotImplementedError()
+
+    def prepare_batch(self, objects):
+        self._prefetched.update(self._prefetch(objects))
+
+    def clear_prefetched(self):
+        """Drop what prepare_batch() fetched and prepare() didn't use."""
+        self._prefetched = {}
+
+    def get_prefetched(self, obj):
+        data = self._prefetched.pop(obj.pk, None)
+        if data is None:
+            data = self._prefetch([obj])[obj.pk]
+        return data
 
 
 class CelerySearchIndex(indexes.SearchIndex):
@@ -24,7 +59,7 @@ class CelerySearchIndex(indexes.SearchIndex):
         signals.post_delete.disconnect(self.remove_handler, sender=model)
 
     def update_handler(self, instance, **kwargs):
-        update_search_index.deplay(instance.__class__, instance.pk)
+        queue_search_index_update(instance.__class__, instance.pk)
 
     def remove_handler(self, instance, **kwargs):
         remove_search_index.delay(instance.__class__, get_identifier(instance))
@@ -66,19 +101,171 @@ def update_search_index(model_class, pk):
 def update_search_index_for_qs(model_class, pks):
     start = time.time()
 
-    qs = model_class._default_manager.filter(pk__in=pks)
-
     try:
         search_index = site.get_index(model_class)
     except NotRegistered:
         log(u'Seacrh index is not registered for %s' % model_class)
         return None
 
+    qs = search_index.index_queryset().filter(pk__in=pks)
+
     search_index.backend.update(search_index, qs)
 
     LogEntry(num=len(pks), time=time.time()-start).save()
 
 
+# Debounced index updates
+#
+# Instead of one Celery task per change, changed objects are marked dirty in
+# a redis set per model.  drain_search_index_queue pops them in batches and
+# sends each batch to Solr with a single backend.update call, so a burst of
+# edits on the same object only costs one update.
+QUEUE_DRAIN_INTERVAL = getattr(settings, 'SEARCH_INDEX_QUEUE_DRAIN_INTERVAL', 10)
+QUEUE_BATCH_SIZE = getattr(settings, 'SEARCH_INDEX_QUEUE_BATCH_SIZE', 200)
+# batches per model and drain run, the rest waits for the next run
+QUEUE_MAX_BATCHES = getattr(settings, 'SEARCH_INDEX_QUEUE_MAX_BATCHES', 10)
+# runs an object can fail in before we stop retrying it
+QUEUE_MAX_ATTEMPTS = getattr(settings, 'SEARCH_INDEX_QUEUE_MAX_ATTEMPTS', 5)
+
+def _queue_key(model_class):
+    return 'search_index_queue:%s.%s' % (model_class._meta.app_label,
+                                         model_class._meta.module_name)
+
+def _attempts_key(model_class):
+    return '%s:attempts' % _queue_key(model_class)
+
+def _failed_key(model_class):
+    """Set of the pks we gave up on, for someone to look at."""
+    return '%s:failed' % _queue_key(model_class)
+
+def queue_search_index_update(model_class, pk):
+    """Mark an object as needing to be reindexed."""
+    if IGNORE_REDIS:
+        return
+    default_connection.sadd(_queue_key(model_class), pk)
+
+def search_index_queue_depth(model_class):
+    """Return the number of objects of model_class waiting to be reindexed."""
+    if IGNORE_REDIS:
+        return 0
+    return default_connection.scard(_queue_key(model_class))
+
+def clear_queue_for_model(model_class):
+    """Forget the queued updates of model_class without reindexing."""
+    default_connection.delete(_queue_key(model_class),
+                              _attempts_key(model_class),
+                              _failed_key(model_class))
+
+def _pop_queued_pks(model_class, count):
+    pipe = default_connection.pipeline(transaction=False)
+    for i in xrange(count):
+        pipe.spop(_queue_key(model_class))
+    return [int(pk) for pk in pipe.execute() if pk]
+
+def _requeue(model_class, pks):
+    pipe = default_connection.pipeline(transaction=False)
+    for pk in pks:
+        pipe.sadd(_queue_key(model_class), pk)
+    pipe.execute()
+
+def _update_index(search_index, pks):
+    qs = search_index.index_queryset().filter(pk__in=pks)
+    search_index.backend.update(search_index, qs)
+
+def _update_one_by_one(model_class, search_index, pks):
+    """Update pks one at a time, return the ones that failed."""
+    failed = []
+    for pk in pks:
+        try:
+            _update_index(search_index, [pk])
+        except Exception:
+            log(u'Failed to index %s %s' % (model_class, pk), exc_info=True)
+            failed.append(pk)
+    return failed
+
+def _retry_later(model_class, pks):
+    """Put back the pks that failed, until they failed QUEUE_MAX_ATTEMPTS
+    times.
+    """
+    pipe = default_connection.pipeline(transaction=False)
+    for pk in pks:
+        pipe.hincrby(_attempts_key(model_class), pk, 1)
+    attempts = pipe.execute()
+
+    pipe = default_connection.pipeline(transaction=False)
+    for pk, n in zip(pks, attempts):
+        if n >= QUEUE_MAX_ATTEMPTS:
+            log(u'Giving up on indexing %s %s' % (model_class, pk))
+            pipe.hdel(_attempts_key(model_class), pk)
+            pipe.sadd(_failed_key(model_class), pk)
+        else:
+            pipe.sadd(_queue_key(model_class), pk)
+    pipe.execute()
+
+def _forget_attempts(model_class, pks):
+    pipe = default_connection.pipeline(transaction=False)
+    for pk in pks:
+        pipe.hdel(_attempts_key(model_class), pk)
+    pipe.execute()
+
+def drain_queue_for_model(model_class, batch_size=QUEUE_BATCH_SIZE,
+                          max_batches=QUEUE_MAX_BATCHES):
+    """Reindex the queued objects of model_class, batch_size at a time.
+
+    Stops after max_batches batches (None for no limit), returns how many
+    objects were indexed.
+
+    When a batch fails, its objects are indexed one by one so a single broken
+    object doesn't hold back the others.  The ones that still fail are
+    retried in the next runs, and left in the failed set after
+    QUEUE_MAX_ATTEMPTS.  If every one of them fails, the problem is more
+    likely Solr than the objects, so they are all put back and the error is
+    raised.
+    """
+    search_index = site.get_index(model_class)
+    drained = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        pks = _pop_queued_pks(model_class, batch_size)
+        if not pks:
+            break
+        batches += 1
+
+        start = time.time()
+
+        try:
+            _update_index(search_index, pks)
+        except:
+            exc_info = sys.exc_info()
+            failed = _update_one_by_one(model_class, search_index, pks)
+            if len(pks) > 1 and len(failed) == len(pks):
+                _requeue(model_class, pks)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            _retry_later(model_class, failed)
+        else:
+            failed = []
+
+        failed = set(failed)
+        succeeded = [pk for pk in pks if pk not in failed]
+        _forget_attempts(model_class, succeeded)
+        drained += len(succeeded)
+        LogEntry(num=len(pks), time=time.time()-start).save()
+
+    return drained
+
+@periodic_task(run_every=timedelta(seconds=QUEUE_DRAIN_INTERVAL))
+def drain_search_index_queue():
+    for model_class in site.get_indexed_models():
+        # one broken index shouldn't hold back the others
+        try:
+            drain_queue_for_model(model_class)
+        except Exception:
+            import logging
+            logging.getLogger('search.index.updater').exception(
+                u'Error draining the search index queue for %s' % model_class)
+
+
 class LogEntry(rmodels.Model):
     num = rmodels.IntegerField()
     time = rmodels.FloatField()
@@ -16,7 +16,12 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import atexit
+import math
+import os
+import random
 import socket
+import threading
 import time as _time
 from contextlib import contextmanager
 from functools import wraps
@@ -50,6 +55,15 @@ else:
 HOST = socket.gethostname()
 ENABLED = (not RUNNING_TESTS) and getattr(settings, 'ENABLE_METRICS', False)
 RIEMANN_HOST = getattr(settings, 'RIEMANN_HOST', '127.0.0.1')
+# Collect metrics in memory and send a summary every FLUSH_INTERVAL seconds
+# from a background thread, instead of an event per measurement.
+AGGREGATE = getattr(settings, 'METRICS_AGGREGATE', True)
+FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+# Memory bounds: how many different metrics we keep between flushes, and how
+# many values we keep per timer/histogram to compute the percentiles from.
+MAX_SERIES = getattr(settings, 'METRICS_MAX_SERIES', 2000)
+MAX_SAMPLES = getattr(settings, 'METRICS_MAX_SAMPLES', 1000)
+PERCENTILES = (50, 95, 99)
 
 c = Client(RIEMANN_HOST, transport=UDPTransport)
 
@@ -97,6 +111,192 @@ def send(service, tag, metric=None):
             pass
 
 
+# Aggregation
+class Samples(object):
+    """The values recorded for a timer or histogram during one interval.
+
+    Count, total, min and max are exact.  The percentiles are computed from
+    a uniform random sample of at most max_samples values (reservoir
+    sampling), so memory stays bounded however many values come in.
+
+    """
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.values = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        if len(self.values) < self.max_samples:
+            self.values.append(value)
+        else:
+            i = random.randint(0, self.count - 1)
+            if i < self.max_samples:
+                self.values[i] = value
+
+    def mean(self):
+        return float(self.total) / self.count
+
+    def percentile(self, p):
+        values = sorted(self.values)
+        # nearest rank
+        rank = int(math.ceil(p / 100.0 * len(values))) - 1
+        return values[max(0, min(rank, len(values) - 1))]
+
+class Aggregator(object):
+    """Collect metrics in memory and send them to Riemann periodically.
+
+    Counters are summed, gauges keep their last value and timers/histograms
+    are summarized into mean, percentiles and max.  Recording only updates a
+    dict under a lock, the sending happens in a daemon thread every interval
+    seconds.
+
+    Once max_series different metrics have been recorded in an interval, new
+    ones are dropped until the next flush and their count is reported as
+    metrics.dropped.
+
+    The thread is started by the first measurement in each process, so this
+    works the same in forked web and celery workers.
+
+    """
+    def __init__(self, send=send, interval=FLUSH_INTERVAL,
+                 max_series=MAX_SERIES, max_samples=MAX_SAMPLES):
+        self._send = send
+        self.interval = interval
+        self.max_series = max_series
+        self.max_samples = max_samples
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.counters = {}
+        self.gauges = {}
+        self.samples = {}
+        self.dropped = 0
+
+    def _has_room(self):
+        series = len(self.counters) + len(self.gauges) + len(self.samples)
+        if series < self.max_series:
+            return True
+        self.dropped += 1
+        return False
+
+    def count(self, name, tag, n=1):
+        self._check_thread()
+        key = (name, tag)
+        with self._lock:
+            if key in self.counters:
+                self.counters[key] += n
+            elif self._has_room():
+                self.counters[key] = n
+
+    def gauge(self, name, tag, value):
+        self._check_thread()
+        key = (name, tag)
+        with self._lock:
+            if key in self.gauges or self._has_room():
+                self.gauges[key] = value
+
+    def sample(self, name, tag, value):
+        self._check_thread()
+        key = (name, tag)
+        with self._lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                if not self._has_room():
+                    return
+                samples = self.samples[key] = Samples(self.max_samples)
+            samples.add(value)
+
+    def flush(self):
+        """Send everything recorded since the last flush."""
+        with self._lock:
+            counters, gauges = self.counters, self.gauges
+            samples, dropped = self.samples, self.dropped
+            self._reset()
+
+        for (name, tag), n in counters.items():
+            self._send(name, tag, n)
+        for (name, tag), value in gauges.items():
+            self._send(name, tag, value)
+        for (name, tag), values in samples.items():
+            self._send(name, tag, values.mean())
+            for p in PERCENTILES:
+                self._send('%s.p%s' % (name, p), tag, values.percentile(p))
+            self._send('%s.max' % name, tag, values.max)
+        if dropped:
+            self._send('metrics.dropped', 'meter', dropped)
+
+    def _check_thread(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            # First measurement in this process.  If we were forked, the data
+            # and the lock belong to the parent and the thread didn't survive.
+            self._lock = threading.Lock()
+            self._reset()
+            self._thread = threading.Thread(target=self._run,
+                                            name='metrics-flush')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self):
+        while True:
+            _time.sleep(self.interval)
+            try:
+                self.flush()
+            except:
+                pass
+
+aggregator = Aggregator()
+
+@atexit.register
+def _flush_at_exit():
+    if aggregator._pid == os.getpid():
+        aggregator.flush()
+
+def count(service, tag, n=1):
+    if not ENABLED:
+        return
+    if AGGREGATE:
+        aggregator.count(service, tag, n)
+    else:
+        send(service, tag, n)
+
+def gauge(service, tag, value):
+    if not ENABLED:
+        return
+    if AGGREGATE:
+        aggregator.gauge(service, tag, value)
+    else:
+        send(service, tag, value)
+
+def sample(service, tag, value):
+    if not ENABLED:
+        return
+    if AGGREGATE:
+        aggregator.sample(service, tag, value)
+    else:
+        send(service, tag, value)
+
+
 class Metric(object):
     def __init__(self, name):
         self.name = name
@@ -104,22 +304,22 @@ class Metric(object):
 
 class Occurrence(Metric):
     def mark(self):
-        send(self.name, 'occurrence')
+        count(self.name, 'occurrence')
 
 class Meter(Metric):
     def inc(self, n=1):
-        send(self.name, 'meter', n)
+        count(self.name, 'meter', n)
 
 class Histogram(Metric):
     def record(self, value):
-        send(self.name, 'histogram', value)
+        sample(self.name, 'histogram', value)
 
 class Gauge(Metric):
     def __init__(self, name):
         return super(Gauge, self).__init__('gauges.' + name)
 
     def report(self, value):
-        send(self.name, 'gauge', value)
+        gauge(self.name, 'gauge', value)
 
 
 @contextmanager
@@ -135,7 +335,7 @@ def Timer(name):
         yield
     finally:
         ms = (_time.time() - start) * 1000
-        send(name, 'timer', ms)
+        sample(name, 'timer', ms)
 
 
 def time(f):
@@ -173,4 +373,4 @@ def time_as(name):
 
 class ManualTimer(Metric):
     def record(self, value):
-        send(self.name, 'timer', value)
+        sample(self.name, 'timer', value)
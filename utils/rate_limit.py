@@ -0,0 +1,124 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Rate limits shared by every process, kept in redis.
+
+A RateLimiter lets *rate* calls through every *period* seconds, for all the
+web and celery processes together.  The calls of each period are counted
+with a redis INCR on a key for that period, which is atomic and needs
+nothing newer than plain redis commands.  Being a fixed window, up to twice
+the rate can get through around the boundary of two periods; set the rate
+with that in mind.
+
+When the remote service tells us we went too fast anyway, pause() stops
+everyone for a while.
+
+If redis is down, or IGNORE_REDIS is set, every call is let through: we'd
+rather risk the remote quota than stop working.
+
+Usage:
+
+    limiter = RateLimiter('youtube-api', rate=10)
+    if limiter.acquire(timeout=30):
+        call_the_api()
+"""
+
+import logging
+import math
+import random
+import time
+
+from redis.exceptions import RedisError
+
+from utils.redis_utils import default_connection, IGNORE_REDIS
+
+logger = logging.getLogger('rate-limit')
+
+
+class RateLimiter(object):
+    def __init__(self, name, rate, period=1, connection=None,
+                 clock=time.time, sleep=time.sleep):
+        self.key = 'rate-limit:%s' % name
+        self.pause_key = 'rate-limit:%s:paused-until' % name
+        self.rate = rate
+        self.period = period
+        self.connection = connection or default_connection
+        self.clock = clock
+        self.sleep = sleep
+
+    def _take(self):
+        """Try to take a call.
+
+        Returns (True, 0) on success, else (False, seconds until it makes
+        sense to try again).
+        """
+        if IGNORE_REDIS:
+            return True, 0
+        now = self.clock()
+        window = int(now // self.period)
+        key = '%s:%s' % (self.key, window)
+
+        try:
+            paused_until = self.connection.get(self.pause_key)
+            if paused_until and float(paused_until) > now:
+                return False, float(paused_until) - now
+
+            pipe = self.connection.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, int(math.ceil(self.period)) + 1)
+            taken = pipe.execute()[0]
+        except RedisError:
+            logger.warn("Can't reach redis, not rate limiting %s" % self.key,
+                        exc_info=True)
+            return True, 0
+
+        if taken <= self.rate:
+            return True, 0
+        return False, (window + 1) * self.period - now
+
+    def try_acquire(self):
+        """Take a call if there is one left, return whether we got it."""
+        return self._take()[0]
+
+    def acquire(self, timeout=None):
+        """Wait until we can make a call.
+
+        Returns False if we couldn't within timeout seconds.
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            acquired, wait = self._take()
+            if acquired:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            # spread the waiting processes a bit over the next period
+            self.sleep(wait + random.uniform(0, self.period / 10.0))
+
+    def pause(self, seconds):
+        """Don't let any call through for the next seconds seconds."""
+        if IGNORE_REDIS:
+            return
+        until = self.clock() + seconds
+        try:
+            self.connection.set(self.pause_key, until)
+            self.connection.expire(self.pause_key,
+                                   int(math.ceil(seconds)) + 1)
+        except RedisError:
+            logger.warn("Can't reach redis, not pausing %s" % self.key,
+                        exc_info=True)
@@ -0,0 +1,42 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""Haystack's Solr backend, plus batch preparation of documents.
+
+Enabled with HAYSTACK_SEARCH_ENGINE = 'utils.solr'.  Every chunk handed to
+update() (by update_index, rebuild_index_ordered or
+update_search_index_for_qs) is passed to the index's prepare_batch() first,
+see utils.celery_search_index.BatchPrepareMixin.
+"""
+# haystack looks up SearchQuery on the backend module as well
+from haystack.backends.solr_backend import (
+    SearchBackend as SolrSearchBackend, SearchQuery
+)
+
+
+class SearchBackend(SolrSearchBackend):
+    def update(self, index, iterable, commit=True):
+        if not hasattr(index, 'prepare_batch'):
+            return super(SearchBackend, self).update(index, iterable, commit)
+
+        iterable = list(iterable)
+        index.prepare_batch(iterable)
+        try:
+            return super(SearchBackend, self).update(index, iterable, commit)
+        finally:
+            # don't keep the data of objects that failed to prepare around
+            index.clear_prefetched()
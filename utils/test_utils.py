@@ -77,8 +77,6 @@ class TestCaseMessagesMixin(object):
                 )
 
 save_thumbnail_in_s3 = mock.Mock()
-update_team_video = mock.Mock()
-update_search_index = mock.Mock()
 
 def mock_youtube_get_entry(video_id):
     # map video ids to (title, description, author, duration) tuples
@@ -189,6 +187,20 @@ def mock_youtube_get_entry(video_id):
 youtube_get_entry = mock.Mock(side_effect=mock_youtube_get_entry)
 youtube_get_subtitled_languages = mock.Mock(return_value=[])
 
+def update_search_index(*model_classes):
+    """Reindex the objects of model_classes that are waiting in the search
+    index queue, right away instead of waiting for drain_search_index_queue.
+    """
+    from utils.celery_search_index import drain_queue_for_model
+    for model_class in model_classes:
+        drain_queue_for_model(model_class, max_batches=None)
+
+def clear_search_index_queues():
+    from haystack import site
+    from utils.celery_search_index import clear_queue_for_model
+    for model_class in site.get_indexed_models():
+        clear_queue_for_model(model_class)
+
 class UnisubsTestPlugin(Plugin):
     name = 'Amara Test Plugin'
 
@@ -203,9 +215,6 @@ class UnisubsTestPlugin(Plugin):
         # list of (function, mock object tuples)
         patch_info = [
             ('videos.tasks.save_thumbnail_in_s3.delay', save_thumbnail_in_s3),
-            ('teams.tasks.update_one_team_video.delay', update_team_video),
-            ('utils.celery_search_index.update_search_index.delay',
-             update_search_index),
             ('videos.types.youtube.YoutubeVideoType._get_entry',
              youtube_get_entry),
             ('videos.types.youtube.YoutubeVideoType.get_subtitled_languages',
@@ -240,3 +249,5 @@ class UnisubsTestPlugin(Plugin):
             # also resets the things like return_value and side_effect to
             # their initial value.
             mock_obj.__dict__ = initial_data.copy()
+        # don't let queued index updates leak into the next test
+        clear_search_index_queues()
@@ -20,16 +20,21 @@
 from string import printable as chars
 from random import randint, choice
 
+import mock
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 import simplejson as json
+from redis.exceptions import ConnectionError as RedisConnectionError
 
 from teams.models import Task
 from videos.models import Video
-from utils import test_factories
+from utils import celery_search_index, test_factories
 from utils.multi_query_set import MultiQuerySet
 from utils.compress import compress, decompress
 from utils.chunkediter import chunkediter
+from utils.metrics import Aggregator, Samples
+from utils.redis_utils import default_connection
+from utils.rate_limit import RateLimiter
 
 class MultiQuerySetTest(TestCase):
     fixtures = ['test.json']
@@ -205,6 +210,191 @@ class BleachSanityTest(TestCase):
         value = bleach.clean(html, strip=True, tags=[], attributes=[])
         self.assertEquals(u"", value)
 
+class MetricsAggregatorTest(TestCase):
+    def setUp(self):
+        self.sent = []
+        self.aggregator = Aggregator(send=self.record_send, interval=3600,
+                                     max_series=3, max_samples=100)
+
+    def record_send(self, service, tag, metric=None):
+        self.sent.append((service, tag, metric))
+
+    def test_counters_and_gauges(self):
+        for i in xrange(5):
+            self.aggregator.count('requests.started', 'meter')
+        self.aggregator.count('requests.started', 'meter', 3)
+        self.aggregator.gauge('gauges.queue', 'gauge', 10)
+        self.aggregator.gauge('gauges.queue', 'gauge', 12)
+        self.assertEquals(self.sent, [])
+
+        self.aggregator.flush()
+        self.assertEquals(sorted(self.sent), [
+            ('gauges.queue', 'gauge', 12),
+            ('requests.started', 'meter', 8),
+        ])
+
+        # everything was reset
+        self.sent = []
+        self.aggregator.flush()
+        self.assertEquals(self.sent, [])
+
+    def test_timers(self):
+        for ms in xrange(1, 101):
+            self.aggregator.sample('response-time', 'timer', ms)
+        self.aggregator.flush()
+        self.assertEquals(sorted(self.sent), [
+            ('response-time', 'timer', 50.5),
+            ('response-time.max', 'timer', 100),
+            ('response-time.p50', 'timer', 50),
+            ('response-time.p95', 'timer', 95),
+            ('response-time.p99', 'timer', 99),
+        ])
+
+    def test_series_limit(self):
+        for i in xrange(5):
+            self.aggregator.count('meter-%s' % i, 'meter')
+        self.aggregator.count('meter-0', 'meter')
+        self.aggregator.flush()
+        self.assertEquals(sorted(self.sent), [
+            ('meter-0', 'meter', 2),
+            ('meter-1', 'meter', 1),
+            ('meter-2', 'meter', 1),
+            ('metrics.dropped', 'meter', 2),
+        ])
+
+    def test_samples_are_bounded(self):
+        samples = Samples(max_samples=10)
+        for i in xrange(1000):
+            samples.add(i)
+        self.assertEquals(len(samples.values), 10)
+        self.assertEquals(samples.count, 1000)
+        self.assertEquals(samples.min, 0)
+        self.assertEquals(samples.max, 999)
+
+class RateLimiterTest(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.slept = []
+        self.limiter = RateLimiter('test-limiter', rate=2,
+                                  clock=lambda: self.now, sleep=self.sleep)
+        self._clear_redis()
+
+    def tearDown(self):
+        self._clear_redis()
+
+    def _clear_redis(self):
+        keys = default_connection.keys('%s*' % self.limiter.key)
+        if keys:
+            default_connection.delete(*keys)
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def test_rate(self):
+        self.assert_(self.limiter.try_acquire())
+        self.assert_(self.limiter.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+        # refilled the next second
+        self.now += 1
+        self.assert_(self.limiter.try_acquire())
+
+    def test_shared(self):
+        other = RateLimiter('test-limiter', rate=2, clock=lambda: self.now)
+        self.assert_(self.limiter.try_acquire())
+        self.assert_(other.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+
+    def test_acquire_waits(self):
+        self.now = 1000.5
+        self.limiter.try_acquire()
+        self.limiter.try_acquire()
+        self.assert_(self.limiter.acquire(timeout=5))
+        self.assertEquals(len(self.slept), 1)
+        self.assert_(0.5 <= self.slept[0] <= 0.6)
+
+        self.limiter.try_acquire()
+        self.assertFalse(self.limiter.acquire(timeout=0.1))
+
+    def test_pause(self):
+        self.limiter.pause(30)
+        self.assertFalse(self.limiter.try_acquire())
+        self.now += 10
+        self.assertFalse(self.limiter.try_acquire())
+        self.now += 21
+        self.assert_(self.limiter.try_acquire())
+
+    def test_paused_calls_dont_count(self):
+        self.limiter.pause(0.5)
+        for i in xrange(5):
+            self.assertFalse(self.limiter.try_acquire())
+        # still within the same second, every call is left
+        self.now += 0.6
+        self.assert_(self.limiter.try_acquire())
+        self.assert_(self.limiter.try_acquire())
+
+    def test_redis_down(self):
+        class DownConnection(object):
+            def __getattr__(self, name):
+                def fail(*args, **kwargs):
+                    raise RedisConnectionError('down')
+                return fail
+        limiter = RateLimiter('test-limiter', rate=1,
+                              connection=DownConnection())
+        limiter.pause(10)
+        self.assert_(limiter.try_acquire())
+        self.assert_(limiter.try_acquire())
+
+class SearchIndexQueueTest(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        from haystack import site
+        self.search_index = site.get_index(Video)
+        self.pks = list(self.search_index.index_queryset()
+                        .values_list('pk', flat=True)[:3])
+        self.bad_pk = self.pks[0]
+        self.indexed = []
+        celery_search_index.clear_queue_for_model(Video)
+
+    def tearDown(self):
+        celery_search_index.clear_queue_for_model(Video)
+
+    def fake_update(self, index, qs):
+        pks = [obj.pk for obj in qs]
+        if self.bad_pk in pks:
+            raise ValueError("can't prepare %s" % self.bad_pk)
+        self.indexed.extend(pks)
+
+    def _drain(self, **kwargs):
+        with mock.patch.object(self.search_index.backend, 'update',
+                               self.fake_update):
+            return celery_search_index.drain_queue_for_model(Video, **kwargs)
+
+    def test_bad_object_doesnt_hold_back_the_batch(self):
+        for pk in self.pks:
+            celery_search_index.queue_search_index_update(Video, pk)
+
+        self.assertEquals(self._drain(), 2)
+        self.assertEquals(sorted(self.indexed), sorted(self.pks[1:]))
+        # only the bad one is queued again
+        self.assertEquals(celery_search_index.search_index_queue_depth(Video), 1)
+
+        for i in xrange(celery_search_index.QUEUE_MAX_ATTEMPTS - 1):
+            self.assertEquals(self._drain(), 0)
+        self.assertEquals(celery_search_index.search_index_queue_depth(Video), 0)
+        self.assert_(default_connection.sismember(
+            celery_search_index._failed_key(Video), self.bad_pk))
+
+    def test_max_batches(self):
+        self.bad_pk = None
+        for pk in self.pks:
+            celery_search_index.queue_search_index_update(Video, pk)
+
+        self.assertEquals(self._drain(batch_size=1, max_batches=2), 2)
+        self.assertEquals(celery_search_index.search_index_queue_depth(Video), 1)
+        self.assertEquals(self._drain(batch_size=1, max_batches=None), 1)
+
 class TestEditor(object):
     """Simulates the editor widget for unit tests"""
     def __init__(self, client, video, original_language_code=None,